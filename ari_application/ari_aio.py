@@ -0,0 +1,39 @@
+# -*- coding: utf-8 -*-
+import asyncio, threading
+
+_loop: asyncio.AbstractEventLoop | None = None
+_lock = threading.Lock()
+
+
+def get_loop() -> asyncio.AbstractEventLoop:
+    """
+    Ein langlebiger Event-Loop in einem Hintergrund-Thread, den STT und TTS
+    gemeinsam nutzen (statt asyncio.run() pro Äußerung). Wird beim ersten
+    Aufruf gestartet.
+    """
+    global _loop
+    with _lock:
+        if _loop is None:
+            loop = asyncio.new_event_loop()
+            t = threading.Thread(target=loop.run_forever, name="aio-bg", daemon=True)
+            t.start()
+            _loop = loop
+        return _loop
+
+
+def submit(coro):
+    """Coroutine auf dem Hintergrund-Loop starten -> concurrent.futures.Future."""
+    return asyncio.run_coroutine_threadsafe(coro, get_loop())
+
+
+def run(coro, timeout: float | None = None):
+    """
+    Blockierend auf dem Hintergrund-Loop ausführen (nicht aus dem Loop selbst
+    aufrufen). Bei Timeout wird die Coroutine abgebrochen.
+    """
+    fut = submit(coro)
+    try:
+        return fut.result(timeout)
+    except BaseException:
+        fut.cancel()
+        raise
@@ -1,15 +1,26 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 
-import json, base64, time, requests, socket, threading, audioop, queue
-from websocket import create_connection, WebSocketTimeoutException
+import argparse, asyncio, json, base64, logging, time, threading
+from websockets.asyncio.client import connect as ws_connect
 from urllib.parse import unquote
 
-from ari_stt_openai import transcribe_segment
-from ari_webhook import process_text
-from ari_tts import send_tts_to_rtp
+from ari_stt_backends import router_from_cfg
+from ari_webhook import process_text, iter_sentences, N8N_STREAM
+import ari_webhook
+from ari_tts import open_playout, synth_into, asynth_into
 from ari_segmenter import Segmenter, SegmenterConfig
+from ari_audio import trim_silence
+from ari_bargein import BargeInDetector, BargeInConfig
 from ari_rtpreceiver import RtpReceiver
+from ari_session import CallSession, SessionRegistry, RtpPortPool
+from ari_pipeline import Budget, stage_from_cfg
+from ari_http import ari_client, all_clients
+from ari_playout import get_scheduler
+from ari_journal import journal_from_cfg
+from ari_metrics import REGISTRY, TurnTrace, metric_family, http_histograms, serve as serve_metrics
+from ari_supervisor import Supervisor, connect_master, default_argv, port_shard, process_load, WORKER_PREFIX
+import ari_tts
 from config import cfg
 import uuid
 import os
@@ -37,31 +48,206 @@ OPENAI_STT_MODEL = C["openai"]["stt_model"]
 WYOMING_HOST     = C["wyoming"]["host"]
 WYOMING_ASR_DE   = int(C["wyoming"]["asr_de"])
 
+# Lokaler Portbereich für externalMedia: ext_host_port .. ext_host_port+ext_port_count-1
+EXT_PORT_COUNT = int(C["media"].get("ext_port_count", 50))
+
+# Samplerate der Pipeline (Segmenter/STT): 16000, oder 8000 = Telefonband ohne Upsampling
+MEDIA_RATE = int(C["media"].get("rate", 8000))
+MIN_SEGMENT_BYTES = MEDIA_RATE * 2   # kürzere Segmente (< 1 s) gehen nicht ins STT
+
+# Turn-Erkennung (Segmenter), Defaults siehe SegmenterConfig
+SEGMENTER_CFG = SegmenterConfig(**{
+    "silence_ms": 500, "rms_thresh": 400, "min_bytes": 24000 * MEDIA_RATE // 16000,
+    **(C.get("segmenter", {}) or {}),
+    "rate": MEDIA_RATE,
+})
+
+# Barge-in: Anrufer unterbricht die Ausgabe -> TTS sofort stoppen
+BARGE_IN_CFG = BargeInConfig(**(C.get("barge_in", {}) or {}))
+
+# Streaming-STT (Wyoming): Audio wird schon während des Sprechens gesendet
+STT_C = C.get("stt", {}) or {}
+STT_STREAMING = bool(STT_C.get("streaming", False))
+if STT_STREAMING:
+    from ari_stt import StreamingTranscriber   # zieht Wyoming-ASR nur bei Bedarf
+# Stille am Anfang/Ende eines Segments vor dem Upload abschneiden
+STT_UPLOAD_C = STT_C.get("upload", {}) or {}
+STT_TRIM = bool(STT_UPLOAD_C.get("trim", True))
+STT_TRIM_KEEP_MS = int(STT_UPLOAD_C.get("keep_ms", 150))
+
+# Pipeline-Stufen: eigener Thread-Pool, Concurrency-Limit und Timeout pro Stufe
+PIPE_C = C.get("pipeline", {}) or {}
+STT_STAGE     = stage_from_cfg("stt",     PIPE_C.get("stt"),     concurrency=8,  timeout_s=15)
+WEBHOOK_STAGE = stage_from_cfg("webhook", PIPE_C.get("webhook"), concurrency=16, timeout_s=20)
+TTS_STAGE     = stage_from_cfg("tts",     PIPE_C.get("tts"),     concurrency=8,  timeout_s=10)
+
+# STT-Backend(s) aus stt.backend / stt.hedge, mit Circuit-Breaker pro Backend
+STT_ROUTER = router_from_cfg(STT_C, workers=2 * STT_STAGE.concurrency)
+
+# Annahme unter Last: begrenzte Segment-Queues pro Call, globales Turn-Budget,
+# Verhalten bei Überlast (Besetzt-Ansage oder Abweisen)
+ADMIT_C = C.get("admission", {}) or {}
+MAX_CALLS = int(ADMIT_C.get("max_calls", 0) or 0)
+OVERLOAD_POLICY = ADMIT_C.get("policy", "busy")
+BUSY_PROMPT = ADMIT_C.get("busy_prompt") or ""
+BUSY_SOUND = ADMIT_C.get("busy_sound") or "sound:tt-allbusy"
+BUSY_HOLD_S = float(ADMIT_C.get("busy_hold_s", 4))
+CALL_MAX_PENDING = max(1, int(ADMIT_C.get("max_pending_segments", 2)))
+CALL_MAX_TURNS = int(ADMIT_C.get("max_turns_per_call", 2) or 0)
+SEGMENT_MAX_AGE_S = float(ADMIT_C.get("max_segment_age_s", 6))
+TURN_BUDGET = Budget(int(ADMIT_C.get("max_turns_inflight", 32) or 0), int(ADMIT_C.get("max_waiting_turns", 4)),
+                     float(ADMIT_C.get("max_turn_wait_ms", 500)) / 1000.0)
+COALESCE_MAX_BYTES = SEGMENTER_CFG.max_segment_ms * MEDIA_RATE * 2 // 1000
+COALESCE_GAP = b"\0\0" * (MEDIA_RATE // 5)   # 200 ms Stille zwischen zusammengefassten Segmenten
+
+# Call-Setup: max. Wartezeit auf ARI-Events; ausgehende Begrüßung startet mit dem
+# ersten eingehenden RTP-Paket (spätestens nach greeting_media_timeout_s)
+SETUP_TIMEOUT_S = float(C["ari"].get("setup_timeout_s", 5))
+GREETING_MEDIA_TIMEOUT_S = float(C["dialer"].get("greeting_media_timeout_s", 2))
+
+# Metriken (Prometheus) und Logging
+METRICS_C = C.get("metrics", {}) or {}
+METRICS_PORT = int(METRICS_C.get("port", 9108) or 0)
+METRICS_HOST = METRICS_C.get("host", "0.0.0.0")
+LOG_LEVEL = ((C.get("logging", {}) or {}).get("level") or "INFO").upper()
+
+# Mitschnitt (Audio + Transkripte) im Hintergrund, optional
+JOURNAL = journal_from_cfg(C.get("journal"))
+
+# Warm-Start: Backends vorwärmen und Prompts rendern, bevor ARI verbunden wird
+WARMUP_C = C.get("warmup", {}) or {}
+WARMUP = bool(WARMUP_C.get("enabled", True))
+WARMUP_TIMEOUT_S = float(WARMUP_C.get("timeout_s", 60))
+WARMUP_ARI_CONNS = int(WARMUP_C.get("ari_connections", 4))
+WARMUP_WY_CONNS = int(WARMUP_C.get("wyoming_connections", 2))
+WARMUP_STT = bool(WARMUP_C.get("stt", True))
+WARMUP_PROMPTS = list(WARMUP_C.get("prompts") or [])
+
+# Mehrere Prozesse: count >= 2 -> Supervisor + Worker (siehe ari_supervisor)
+WORKERS_C = C.get("workers", {}) or {}
+WORKERS = int(WORKERS_C.get("count", 0) or 0)
+WORKER_REPORT_S = float(WORKERS_C.get("report_s", 1.0))
+WORKER_RESTART_BACKOFF_S = float(WORKERS_C.get("restart_backoff_s", 2.0))
+
+# ARI-Events per Websocket (aus der HTTP-Basis abgeleitet)
+ARI_WS_URL = ARI_BASE.replace("http", "ws", 1).rstrip("/") + \
+    f"/events?api_key={ARI_USER}:{ARI_PASS}&app={APP}&subscribeAll=true"
+
 # ---------- globaler Zustand ----------
-segment_queue: "queue.Queue[bytes]" = queue.Queue()
-ext_id = None
-bridge_id = None
-caller_id = None
-rtp_receiver = None
-call_alive = False       
-segmenter_instance = None
-TTS_DST_IP = None
-TTS_DST_PORT = None
-caller_number = None
-tts_stop_event = None
+sessions = SessionRegistry()
+port_pool = RtpPortPool(EXT_HOST_PORT, EXT_PORT_COUNT)
+WORKER_IDX: int | None = None   # gesetzt im Worker-Prozess (--worker)
+EXT_ID_PREFIX = ""              # Worker-Präfix für selbst vergebene Channel-IDs
+_loop: asyncio.AbstractEventLoop | None = None   # Event-Loop aus main()
+_waiters: dict[tuple[str, str], asyncio.Future] = {}   # (Event-Typ, Channel-ID) -> Future
+_warm = False          # Warm-up abgeschlossen
+_connected = False     # ARI-Websocket (bzw. im Worker: Steuerverbindung) steht
+
+log = logging.getLogger("freya.app")
+
+# ---------- Metriken ----------
+CALLS = REGISTRY.counter("freya_calls_total", "Calls nach Setup-Ergebnis", ("result",))
+SEGMENTS = REGISTRY.counter("freya_segments_total", "Segmente vom Segmenter", ("result",))
+BARGE_INS = REGISTRY.counter("freya_barge_ins_total", "Unterbrechungen der Ausgabe durch den Anrufer")
+SHED = REGISTRY.counter("freya_calls_shed_total", "Wegen Überlast nicht angenommene Calls", ("reason",))
+
+RTP_COUNTERS = ("received", "lost", "late", "duplicates", "reordered", "foreign", "bad")
+_rtp_closed = dict.fromkeys(RTP_COUNTERS, 0)   # Summen beendeter Calls
+_rtp_lock = threading.Lock()
+
+def _collect():
+    live = sessions.all()
+    yield from metric_family("freya_calls_active", "gauge", "Aktive Calls", [({}, len(live))])
+    yield from metric_family("freya_rtp_ports_free", "gauge", "Freie RTP-Ports", [({}, port_pool.free_count())])
+    yield from metric_family("freya_segment_queue_depth", "gauge", "Wartende Segmente (alle Calls)",
+                             [({}, sum(x.segment_queue.qsize() for x in live))])
+    yield from metric_family("freya_turn_budget", "gauge", "Globales Turn-Budget",
+                             [({"state": "limit"}, TURN_BUDGET.limit), ({"state": "inflight"}, TURN_BUDGET.inflight),
+                              ({"state": "waiting"}, TURN_BUDGET.waiting)])
+    yield from metric_family("freya_turn_budget_wait_seconds", "gauge", "Wartezeit auf das Turn-Budget",
+                             [({"kind": "oldest"}, round(TURN_BUDGET.oldest_wait_s(), 3)),
+                              ({"kind": "projected"}, round(TURN_BUDGET.projected_wait_s(), 3))])
+    yield from metric_family("freya_turns_inflight", "gauge", "Laufende Turns (alle Calls)",
+                             [({}, sum(len(x.turns) for x in live))])
+    stages = (STT_STAGE, WEBHOOK_STAGE, TTS_STAGE)
+    yield from metric_family("freya_stage_inflight", "gauge", "Jobs in Arbeit pro Stufe",
+                             [({"stage": st.name}, st.inflight) for st in stages])
+    yield from metric_family("freya_stage_waiting", "gauge", "Jobs, die auf einen Slot warten",
+                             [({"stage": st.name}, st.waiting) for st in stages])
+
+    stats = [x.receiver.stats for x in live if x.receiver]
+    with _rtp_lock:
+        totals = dict(_rtp_closed)
+    for st in stats:
+        for k in RTP_COUNTERS:
+            totals[k] += getattr(st, k)
+    yield from metric_family("freya_rtp_packets_total", "counter", "Eingehende RTP-Pakete nach Art",
+                             [({"kind": k}, v) for k, v in totals.items()])
+    jit = [st.jitter_ms for st in stats]
+    yield from metric_family("freya_rtp_jitter_ms", "gauge", "Interarrival-Jitter aktiver Calls",
+                             [({"stat": "avg"}, round(sum(jit) / len(jit), 3) if jit else 0),
+                              ({"stat": "max"}, round(max(jit), 3) if jit else 0)])
+
+    ps = get_scheduler().stats()
+    yield from metric_family("freya_playout_packets_total", "counter", "Gesendete TTS-RTP-Pakete",
+                             [({"timing": "all"}, ps["sent"]), ({"timing": "late"}, ps["late"])])
+    yield from metric_family("freya_playout_streams", "gauge", "Laufende Ausgaben", [({}, ps["streams"])])
+    yield from metric_family("freya_playout_timing_ms", "gauge", "Sendezeitpunkt-Abweichung",
+                             [({"stat": "max_late"}, ps["max_late_ms"]), ({"stat": "jitter"}, ps["jitter_ms"])])
+
+    r = STT_ROUTER.snapshot()
+    yield from metric_family("freya_stt_hedged_total", "counter", "Segmente, die zusätzlich ans Hedge-Backend gingen",
+                             [({}, r["hedged"])])
+    yield from metric_family("freya_stt_hedge_wins_total", "counter", "Hedge-Backend war schneller",
+                             [({}, r["hedge_wins"])])
+    yield from metric_family("freya_stt_breaker_open", "gauge", "Circuit-Breaker offen (1) pro Backend",
+                             [({"backend": n}, int(b["state"] != "closed")) for n, b in r["backends"].items()])
+    if ari_tts.tts_cache is not None:
+        c = ari_tts.tts_cache
+        yield from metric_family("freya_tts_cache_total", "counter", "TTS-Cache-Abfragen",
+                                 [({"result": "hit"}, c.hits), ({"result": "miss"}, c.misses)])
+    if JOURNAL is not None:
+        yield from metric_family("freya_journal_entries_total", "counter", "Journal-Einträge (Audio-Frames, Ereignisse)",
+                                 [({"result": "queued"}, JOURNAL.queued), ({"result": "dropped"}, JOURNAL.dropped)])
+        yield from metric_family("freya_journal_queue_depth", "gauge", "Noch nicht geschriebene Journal-Einträge",
+                                 [({}, JOURNAL.depth())])
+        yield from metric_family("freya_journal_written_bytes_total", "counter", "Vom Journal geschriebene Bytes",
+                                 [({}, JOURNAL.written_bytes)])
+    if ari_webhook.reply_cache is not None:
+        c = ari_webhook.reply_cache
+        yield from metric_family("freya_reply_cache_total", "counter", "Antwort-Cache-Abfragen vor dem Webhook",
+                                 [({"result": "hit"}, c.hits), ({"result": "miss"}, c.misses),
+                                  ({"result": "store"}, c.stores)])
+        yield from metric_family("freya_reply_cache_entries", "gauge", "Einträge im Antwort-Cache", [({}, len(c))])
+    yield from http_histograms(all_clients())
+
+REGISTRY.add_collector(_collect)
 
 
 # ---------- ARI-Helper ----------
-def ari(path, method="GET", **kw):
-    f = getattr(requests, method.lower())
-    r = f(ARI_BASE + path, auth=(ARI_USER, ARI_PASS), timeout=5, **kw)
+ARI = ari_client()   # gemeinsamer Keep-Alive-Pool für alle ARI-Requests
+
+def _ari_endpoint(path: str) -> str:
+    # Statistik/Timeouts pro Endpoint, z.B. "ari.bridges", "ari.variable"
+    if path.endswith("/variable"):
+        return "ari.variable"
+    return "ari." + path.lstrip("/").split("/", 1)[0]
+
+def _ari_result(r):
     r.raise_for_status()
     return r.json() if r.text else {}
 
+def ari(path, method="GET", **kw):
+    return _ari_result(ARI.request(method, path, endpoint=_ari_endpoint(path), **kw))
+
+async def aari(path, method="GET", **kw):
+    return _ari_result(await ARI.arequest(method, path, endpoint=_ari_endpoint(path), **kw))
+
 def get_var(ch_id, var):
-    r = requests.get(f"{ARI_BASE}/channels/{ch_id}/variable",
-                     params={"variable": var}, auth=(ARI_USER, ARI_PASS), timeout=5)
-    r.raise_for_status(); return r.json().get("value")
+    return ari(f"/channels/{ch_id}/variable", params={"variable": var}).get("value")
+
+async def aget_var(ch_id, var):
+    return (await aari(f"/channels/{ch_id}/variable", params={"variable": var})).get("value")
 
 def is_caller(ev):
     ch = ev.get("channel", {})
@@ -69,127 +255,332 @@ def is_caller(ev):
     name = (ch.get("name") or ""); caller = ch.get("caller", {}).get("number","")
     return tech in ("PJSIP", "SIP", "DAHDI") or caller or name.startswith(("PJSIP/","SIP/","DAHDI/"))
 
-def wait_channel(id, tries=100, delay=0.05):
-    url = f"{ARI_BASE}/channels/{id}"
-    for _ in range(tries):
-        r = requests.get(url, auth=(ARI_USER, ARI_PASS), timeout=2)
-        if r.status_code == 200: return True
-        time.sleep(delay)
-    return False
-
-def safe_add(bridge, ch):
-    for _ in range(10):
+# ---------- Cleanup ----------
+def _delete_ari_objects(sess: CallSession):
+    # externalMedia + Bridge in Asterisk abbauen (sonst bleiben sie pro Call liegen)
+    for path in ([f"/channels/{sess.ext_id}"] if sess.ext_id else []) + \
+                ([f"/bridges/{sess.bridge_id}"] if sess.bridge_id else []):
         try:
-            ari(f"/bridges/{bridge}/addChannel", "POST", params={"channel": ch})
-            return True
-        except requests.HTTPError as e:
-            if e.response is not None and e.response.status_code in (400, 404):
-                time.sleep(0.05); continue
-            raise
-    return False
+            ari(path, "DELETE")
+        except Exception:
+            pass
 
-# ---------- Cleanup ----------
-def cleanup_call():
-    global ext_id, bridge_id, caller_id, caller_number, call_alive, tts_stop_event
+def cleanup_call(sess: CallSession):
+    # nur einmal pro Session (Hangup-Event und fehlgeschlagenes Setup können sich überholen)
+    if sessions.pop(sess.caller_id) is None:
+        return
+    sess.alive = False
+    sess.closed = True
 
-    # >>> laufende TTS (falls vorhanden) sofort abbrechen
-    try:
-        if tts_stop_event:
-            tts_stop_event.set()
-            tts_stop_event = None
-    except Exception:
-        pass
+    # Segment-Worker + laufende Turns im Event-Loop beenden (Queue wird damit verworfen)
+    if _loop:
+        _loop.call_soon_threadsafe(_cancel_tasks, sess)
 
-    # Segmenter flush, falls noch Audio drin
+    if sess.stt_stream:
+        sess.stt_stream.abort()
+
+    # >>> laufende TTS (falls vorhanden) sofort abbrechen
     try:
-        if segmenter_instance and segmenter_instance.buf:
-            seg = bytes(segmenter_instance.buf)
-            segmenter_instance.buf.clear()
-            if len(seg) > 32000:
-                print(f"[SEG] --> FLUSH OUT: {len(seg)} bytes")
-                segment_queue.put(seg)
+        if sess.tts_stop_event:
+            sess.tts_stop_event.set()
+            sess.tts_stop_event = None
     except Exception:
         pass
 
-    # Queue leeren
+    # Receiver stoppen, Port zurück in den Pool
     try:
-        while not segment_queue.empty():
-            segment_queue.get_nowait()
+        if sess.receiver:
+            sess.receiver.stop()
     except Exception:
         pass
+    port_pool.release(sess.rtp_port)
+    if sess.receiver:
+        with _rtp_lock:
+            for k in RTP_COUNTERS:
+                _rtp_closed[k] += getattr(sess.receiver.stats, k)
 
-    ext_id = bridge_id = caller_id = None
-    caller_number = None  
-    call_alive = False
-    print("[ARI] cleaned up.")
+    if JOURNAL is not None:
+        JOURNAL.event(sess.caller_id, "call_end")
+    _delete_ari_objects(sess)
+    log.info("[ARI] cleaned up %s (active calls: %d)", sess.caller_id, len(sessions))
 
 # ---------- TTS Helper: über denselben Socket senden wie Empfang ----------
-def say(text: str):
-    global tts_stop_event
-    if not (TTS_DST_IP and TTS_DST_PORT and rtp_receiver and rtp_receiver._sock):
-        print("[TTS] no dst/socket available")
+def _journal_tts(sess: CallSession, st, text: str, trace: TurnTrace | None):
+    # Text ins Index, gesendete Pakete in <call>.out.ulaw
+    if JOURNAL is None:
         return
+    JOURNAL.event(sess.caller_id, "tts", turn=trace.turn if trace else 0, text=text)
+    if st.tap is None:
+        st.tap = lambda frame, cid=sess.caller_id: JOURNAL.audio(cid, "out", frame)
+
+def say(sess: CallSession, text: str, trace: TurnTrace | None = None):
+    rx = sess.receiver
+    if not (sess.tts_dst_ip and sess.tts_dst_port and rx and rx._sock):
+        log.warning("[TTS] no dst/socket available")
+        return None
 
     # alten TTS stoppen, falls aktiv
-    if tts_stop_event:
-        tts_stop_event.set()
+    if sess.tts_stop_event:
+        sess.tts_stop_event.set()
 
     # neuen Event erstellen
-    tts_stop_event = threading.Event()
+    stop = sess.tts_stop_event = threading.Event()
+
+    # blockiert nur während der Synthese; abgespielt wird vom gemeinsamen PlayoutScheduler
+    st = sess.tts_stream = open_playout(sess.tts_dst_ip, sess.tts_dst_port, rx._sock,
+                                        stop_event=stop, rtp_state=sess.tts_rtp_state)
+    if trace is not None:
+        st.on_first_packet = trace.first_rtp
+    _journal_tts(sess, st, text, trace)
+    try:
+        synth_into(st, text, TTS_STAGE.timeout_s)
+    finally:
+        st.close()
+    return st
+
+async def say_stream(sess: CallSession, sentences: asyncio.Queue, trace: TurnTrace | None = None):
+    """
+    Wie say(), aber Satz für Satz aus 'sentences' (None = Ende) in denselben
+    Stream: der erste Satz läuft schon, während die weiteren noch entstehen.
+    Die alte Ausgabe wird erst gestoppt, wenn der erste Satz da ist.
+    """
+    first = await sentences.get()
+    rx = sess.receiver
+    if first is None or not (sess.alive and sess.tts_dst_ip and sess.tts_dst_port and rx and rx._sock):
+        return None
+    await TTS_STAGE.offload(ensure_ext_in_bridge, sess)
+    if sess.tts_stop_event:
+        sess.tts_stop_event.set()
+    stop = sess.tts_stop_event = threading.Event()
+    st = sess.tts_stream = open_playout(sess.tts_dst_ip, sess.tts_dst_port, rx._sock,
+                                        stop_event=stop, rtp_state=sess.tts_rtp_state)
+    if trace is not None:
+        st.on_first_packet = trace.first_rtp
+    try:
+        text = first
+        while text is not None and not st.cancelled():
+            _journal_tts(sess, st, text, trace)
+            await asyncio.wait_for(asynth_into(st, text), TTS_STAGE.timeout_s)
+            text = await sentences.get()
+    finally:
+        st.close()
+    return st
 
-    threading.Thread(
-        target=send_tts_to_rtp,
-        args=(text, TTS_DST_IP, TTS_DST_PORT),
-        kwargs={"sock": rtp_receiver._sock, "stop_event": tts_stop_event},
-        daemon=True,
-    ).start()
+def is_playing(sess: CallSession) -> bool:
+    st = sess.tts_stream
+    return st is not None and not st.done.is_set() and not st.cancelled()
+
+def barge_in(sess: CallSession):
+    # läuft im RTP-Thread: Stop-Flag setzen, der Scheduler prüft es vor jedem Paket
+    if sess.tts_stop_event:
+        sess.tts_stop_event.set()
+    BARGE_INS.inc()
+    log.info("[BARGE-IN] caller %s interrupted playout", sess.caller_number)
 
 # ---------- Call-Start ----------
-def on_start(ev):
-    global ext_id, bridge_id, caller_id, caller_number, call_alive, TTS_DST_IP, TTS_DST_PORT
-    if not is_caller(ev):
-        return
-    caller_id = ev["channel"]["id"]
-    print(f"[ARI] caller in: {caller_id}")
+def _expect(typ: str, ch_id: str) -> asyncio.Future:
+    """Future, das dispatch() beim ARI-Event 'typ' für Channel 'ch_id' erfüllt."""
+    fut = _loop.create_future()
+    _waiters[(typ, ch_id)] = fut
+    return fut
 
+async def _await_event(fut: asyncio.Future, key: tuple, timeout: float):
+    try:
+        return await asyncio.wait_for(fut, timeout)
+    finally:
+        _waiters.pop(key, None)
+
+# ---------- Annahme unter Last ----------
+def over_capacity() -> str | None:
+    """Grund, keinen neuen Call anzunehmen (max_calls erreicht, Turn-Budget überlastet), sonst None."""
+    if MAX_CALLS and len(sessions) >= MAX_CALLS:
+        return "max_calls"
+    if TURN_BUDGET.overloaded():
+        return "turn_budget"
+    return None
+
+async def shed_call(caller_id: str, reason: str):
+    """
+    Call ablehnen: mit policy "busy" spielt Asterisk selbst eine Ansage (der
+    vorgerenderte busy_prompt aus tts_cache.dir, sonst busy_sound), danach
+    wird aufgelegt – ohne RTP-Port, Bridge oder Pipeline-Arbeit.
+    """
+    busy = OVERLOAD_POLICY == "busy"
+    log.warning("[ADMISSION] over capacity (%s), %s %s", reason, "busy prompt for" if busy else "rejecting", caller_id)
+    CALLS.inc(result="busy" if busy else "rejected")
+    SHED.inc(reason=reason)
+    if busy:
+        path = ari_tts.prompt_file(BUSY_PROMPT)
+        media, hold = (f"sound:{path.with_suffix('')}", path.stat().st_size / 8000 + 0.5) if path \
+            else (BUSY_SOUND, BUSY_HOLD_S)
+        try:
+            await aari(f"/channels/{caller_id}/play", "POST", params={"media": media})
+            await asyncio.sleep(hold)
+        except Exception as e:
+            log.debug("[ADMISSION] busy prompt failed: %r", e)
+    try:
+        await _hangup(caller_id)
+    except Exception:
+        pass
+
+def _coalesce(items: list[tuple]) -> tuple:
+    """
+    Wartende Segmente eines Calls (älteste zuerst) -> ein Segment, der Anrufer
+    bekommt eine Antwort auf alles zusammen. Was nicht mehr in max_segment_ms
+    passt, fällt von vorn weg (veraltet). Streaming-STT-Ergebnisse gelten nur
+    für ein Segment und werden verworfen; die Zeitachse ist die des neuesten.
+    """
+    if len(items) == 1:
+        return items[0]
+    parts, size, full = [], 0, False
+    newest = items[-1][2]
+    for seg, fut, trace in reversed(items):
+        if fut is not None:
+            fut.cancel()
+        full = full or (bool(parts) and size + len(COALESCE_GAP) + len(seg) > COALESCE_MAX_BYTES)
+        if trace is not newest:
+            SEGMENTS.inc(result="dropped_stale" if full else "coalesced")
+            trace.finish(result="stale" if full else "coalesced")
+        if not full:
+            parts.append(seg)
+            size += len(seg) + len(COALESCE_GAP)
+    return COALESCE_GAP.join(reversed(parts)), None, newest
+
+def _enqueue_segment(sess: CallSession, item: tuple):
+    # im Event-Loop: Queue pro Call begrenzt, bei Überlauf alles Wartende zusammenfassen
+    q = sess.segment_queue
+    if q.qsize() >= CALL_MAX_PENDING:
+        item = _coalesce([q.get_nowait() for _ in range(q.qsize())] + [item])
+    q.put_nowait(item)
+
+async def on_start(ev):
+    """
+    Call-Setup ereignisgetrieben: statt Sleeps/Polling wird auf StasisStart des
+    externalMedia-Channels und ChannelEnteredBridge gewartet; Bridge und
+    externalMedia werden parallel angelegt, Channel-Variablen parallel gelesen.
+    """
+    caller_id = ev["channel"]["id"]
     caller_number = (ev.get("channel", {}).get("caller", {}) or {}).get("number") or ""
     if not caller_number:
         caller_number = str(uuid.uuid4())
-    print(f"[ARI] caller in: chan={caller_id}, number={caller_number}")
-
-    bridge_id = ari("/bridges", "POST", params={"type": "mixing"})["id"]
-    safe_add(bridge_id, caller_id)
-
-    ext = ari("/channels/externalMedia", "POST", params={
-        "app": APP,
-        "external_host": f"{EXT_HOST_IP}:{EXT_HOST_PORT}",
-        "format": "ulaw",
-        "direction": "both",
-    })
-    ext_id = ext["id"]
-    time.sleep(0.1)
-    if not wait_channel(ext_id) or not safe_add(bridge_id, ext_id):
-        print(f"[ARI] externalMedia {ext_id} nicht bereit")
+    log.info("[ARI] caller in: chan=%s, number=%s", caller_id, caller_number)
+
+    # selbst gewählte Anrufe (Dialer/Kampagne, mit Stasis-Args) nicht abweisen: die
+    # Last begrenzt der Dialer, und dem Angerufenen "alle Leitungen belegt" zu sagen wäre falsch
+    outbound = bool(ev.get("args"))
+    reason = None if outbound else over_capacity()
+    port = port_pool.acquire() if reason is None else None
+    if port is None:
+        if outbound:
+            log.warning("[ADMISSION] no RTP port for outbound call %s, hanging up", caller_id)
+            SHED.inc(reason="rtp_ports")
+            try:
+                await _hangup(caller_id)
+            except Exception:
+                pass
+        else:
+            await shed_call(caller_id, reason or "rtp_ports")
         return
 
-    call_alive = True
-    print("[ARI] call active, RTP already running")
-
-    ip  = get_var(ext_id, "UNICASTRTP_LOCAL_ADDRESS")
-    port= int(get_var(ext_id, "UNICASTRTP_LOCAL_PORT") or 0)
-    TTS_DST_IP, TTS_DST_PORT = ip, port
-    print(f"[TTS] target set {TTS_DST_IP}:{TTS_DST_PORT}")
+    sess = CallSession(caller_id=caller_id, caller_number=caller_number, rtp_port=port)
+    stream = sess.stt_stream = StreamingTranscriber(lang=LANG, rate=MEDIA_RATE) if STT_STREAMING else None
+
+    def on_segment(seg: bytes):
+        # läuft im RTP-Thread -> thread-safe an den Event-Loop übergeben;
+        # Turn-Zeitachse beginnt hier (nach silence_ms Stille, bei Zwangsteilung sofort)
+        fut = stream.finish() if stream else None
+        sess.turn_no += 1
+        eos = 0.0 if sess.segmenter.in_speech else SEGMENTER_CFG.silence_ms / 1000.0
+        trace = TurnTrace(caller_id, sess.turn_no, eos)
+        if JOURNAL is not None:
+            JOURNAL.event(caller_id, "segment", turn=sess.turn_no, ms=len(seg) * 500 // MEDIA_RATE)
+        _loop.call_soon_threadsafe(_enqueue_segment, sess, (seg, fut, trace))
+
+    sess.segmenter = Segmenter(
+        on_segment=on_segment,
+        cfg=SEGMENTER_CFG,
+        on_speech_start=stream.start if stream else None,
+        on_frame=stream.feed if stream else None,
+        on_discard=stream.abort if stream else None,
+    )
+    sink = sess.segmenter
+    if BARGE_IN_CFG.enabled:
+        sink = BargeInDetector(sess.segmenter, BARGE_IN_CFG,
+                               is_playing=lambda: is_playing(sess),
+                               on_barge_in=lambda: barge_in(sess))
+    sess.receiver = RtpReceiver(ip=EXT_HOST_IP, port=port, segmenter=sink, rate=MEDIA_RATE)
+    if JOURNAL is not None:
+        JOURNAL.event(caller_id, "call_start", number=caller_number, port=port)
+        sess.receiver.on_ulaw = lambda frames: JOURNAL.audio(caller_id, "in", frames)
+    media_ready = _loop.create_future()
+    sess.receiver.on_first_packet = lambda: _loop.call_soon_threadsafe(
+        lambda: media_ready.done() or media_ready.set_result(True))
+    sessions.add(sess)
+
+    # Channel-ID selbst vergeben, damit der Waiter vor dem StasisStart-Event steht
+    ext_id = sess.ext_id = EXT_ID_PREFIX + str(uuid.uuid4())
+    k_start, k_bridge = ("StasisStart", ext_id), ("ChannelEnteredBridge", ext_id)
+    ext_started, ext_bridged = _expect(*k_start), _expect(*k_bridge)
+    try:
+        sess.receiver.start()
+
+        async def make_bridge():
+            sess.bridge_id = (await aari("/bridges", "POST", params={"type": "mixing"}))["id"]
+            await aari(f"/bridges/{sess.bridge_id}/addChannel", "POST", params={"channel": caller_id})
+
+        await asyncio.gather(
+            make_bridge(),
+            aari("/channels/externalMedia", "POST", params={
+                "app": APP,
+                "channelId": ext_id,
+                "external_host": f"{EXT_HOST_IP}:{port}",
+                "format": "ulaw",
+                "direction": "both",
+            }),
+        )
+        await _await_event(ext_started, k_start, SETUP_TIMEOUT_S)
+
+        # externalMedia in die Bridge, parallel dazu die RTP-Zieladresse lesen
+        _, ip, rport = await asyncio.gather(
+            aari(f"/bridges/{sess.bridge_id}/addChannel", "POST", params={"channel": ext_id}),
+            aget_var(ext_id, "UNICASTRTP_LOCAL_ADDRESS"),
+            aget_var(ext_id, "UNICASTRTP_LOCAL_PORT"),
+        )
+        await _await_event(ext_bridged, k_bridge, SETUP_TIMEOUT_S)
+
+        sess.tts_dst_ip, sess.tts_dst_port = ip, int(rport or 0)
+        if ip and sess.tts_dst_port:
+            sess.receiver.expect_from(ip, sess.tts_dst_port)   # fremde RTP-Quellen verwerfen
+        log.debug("[TTS] target set %s:%s", ip, sess.tts_dst_port)
+        if sess.closed:
+            # während des Setups aufgelegt: cleanup_call lief evtl. schon
+            raise RuntimeError("caller gone during setup")
+        sess.alive = True
+        sess.worker = await _start_worker(sess)
+        CALLS.inc(result="ok")
+        log.info("[ARI] call active on RTP port %d (active calls: %d)", port, len(sessions))
+    except Exception as e:
+        CALLS.inc(result="failed")
+        log.warning("[ARI] call setup failed for %s: %r", caller_id, e)
+        _waiters.pop(k_start, None); _waiters.pop(k_bridge, None)
+        if sess.closed:
+            await asyncio.to_thread(_delete_ari_objects, sess)
+        else:
+            await asyncio.to_thread(cleanup_call, sess)
+        return
 
     args = ev.get("args") or []
     init_tts_enc = (args[0] if args else "").strip()
     init_tts = unquote(init_tts_enc)
 
-    
     if init_tts:
-        time.sleep(3)
-        say(init_tts) 
-    else:
-        say(WELCOME)     
+        # ausgehender Call: sprechen, sobald Medien fließen (erstes RTP-Paket)
+        try:
+            await asyncio.wait_for(media_ready, GREETING_MEDIA_TIMEOUT_S)
+        except asyncio.TimeoutError:
+            log.info("[ARI] no inbound media yet, speaking anyway")
+    if sess.alive:
+        await TTS_STAGE.offload(say, sess, init_tts or WELCOME)
 
 
 def bridge_has_channel(bridge_id: str, ch_id: str) -> bool:
@@ -199,74 +590,354 @@ def bridge_has_channel(bridge_id: str, ch_id: str) -> bool:
     except Exception:
         return False
 
-def ensure_ext_in_bridge():
-    if bridge_id and ext_id and not bridge_has_channel(bridge_id, ext_id):
-        print("[BRIDGE] externalMedia missing -> re-adding")
+def ensure_ext_in_bridge(sess: CallSession):
+    if sess.bridge_id and sess.ext_id and not bridge_has_channel(sess.bridge_id, sess.ext_id):
+        log.warning("[BRIDGE] externalMedia missing -> re-adding")
+        try:
+            ari(f"/bridges/{sess.bridge_id}/addChannel", "POST", params={"channel": sess.ext_id})
+        except Exception as e:
+            log.warning("[BRIDGE] re-add failed: %s", e)
+
+def speak_reply(sess: CallSession, text_out: str, trace: TurnTrace | None = None):
+    if sess.alive and sess.tts_dst_ip and sess.tts_dst_port:
+        ensure_ext_in_bridge(sess)
+        log.debug("[TTS] send to %s:%s -> %r", sess.tts_dst_ip, sess.tts_dst_port, text_out[:60])
+        return say(sess, text_out, trace)
+    return None
+
+async def transcribe(seg: bytes, stt_fut=None, thresh: float = 0) -> str:
+    # Streaming-Ergebnis bevorzugen (nur noch der letzte Decode bleibt übrig),
+    # bei Fehlern den kompletten Turn klassisch transkribieren
+    if stt_fut is not None:
         try:
-            ari(f"/bridges/{bridge_id}/addChannel", "POST", params={"channel": ext_id})
+            return await asyncio.wrap_future(stt_fut)
         except Exception as e:
-            print("[BRIDGE] re-add failed:", e)
+            log.warning("[STT] streaming failed, falling back: %s", e)
+    if STT_TRIM and thresh:
+        seg = trim_silence(seg, MEDIA_RATE, int(thresh), STT_TRIM_KEEP_MS)
+    return await STT_ROUTER.transcribe(seg, LANG, MEDIA_RATE)
+
+async def reply_streamed(sess: CallSession, text_in: str, trace: TurnTrace):
+    """
+    Webhook-Antwort als Stream: die Webhook-Stufe liest Sätze in eine Queue,
+    parallel spricht die TTS-Stufe sie ab (Reihenfolge pro Call über sess.lane).
+    Die TTS-Stufe läuft so lange wie der Stream, ihr Timeout ist daher
+    Webhook- plus TTS-Timeout; pro Satz gilt der TTS-Timeout.
+    Return: (ganzer Antworttext, PlayoutStream | None)
+    """
+    sentences: asyncio.Queue = asyncio.Queue()
+    t0 = time.monotonic()
+
+    def produce(text: str, caller: str) -> str:
+        # Webhook-Thread: jeder fertige Satz sofort in die Queue
+        parts = []
+        for s in iter_sentences(text, caller):
+            if not parts:
+                trace.span("webhook_first", time.monotonic() - t0)
+            parts.append(s)
+            _loop.call_soon_threadsafe(sentences.put_nowait, s)
+        return " ".join(parts)
+
+    web = asyncio.create_task(sess.lane.run(1, WEBHOOK_STAGE, produce, text_in, sess.caller_number,
+                                            trace=trace))
+    # Ende der Stufe (auch Fehler/Timeout) beendet die Ausgabe
+    web.add_done_callback(lambda t: sentences.put_nowait(None))
+    try:
+        st = await sess.lane.run(2, TTS_STAGE, say_stream, sess, sentences, trace, trace=trace,
+                                 timeout_s=WEBHOOK_STAGE.timeout_s + TTS_STAGE.timeout_s)
+    except BaseException:
+        # nur bei Fehler/Abbruch, sonst hält der Webhook seinen Platz in der Lane bis zum Ende
+        web.cancel()
+        raise
+    return await web, st
+
+async def run_turn(sess: CallSession, seg: bytes, stt_fut=None, trace: TurnTrace | None = None):
+    """
+    Ein Turn durch die Stufen STT -> Webhook -> TTS (Reihenfolge pro Call über sess.lane).
+    Die Zeitachse (trace) endet mit dem ersten RTP-Paket der Antwort.
+    """
+    trace = trace or TurnTrace(sess.caller_id, sess.turn_no)
+    trace.span("queue", time.monotonic() - trace.t0)
+    try:
+        text_in = await sess.lane.run(0, STT_STAGE, transcribe, seg, stt_fut,
+                                      sess.segmenter.threshold, trace=trace)
+        if not text_in or not sess.alive:
+            trace.finish(result="empty")
+            return
+
+        log.info("[ASR][%s] %r", sess.caller_number, text_in)
+        if JOURNAL is not None:
+            JOURNAL.event(sess.caller_id, "transcript", turn=trace.turn, text=text_in)
+        if N8N_STREAM:
+            text_out, st = await reply_streamed(sess, text_in, trace)
+            log.info("[AGENT] %r", text_out)
+            if JOURNAL is not None:
+                JOURNAL.event(sess.caller_id, "reply", turn=trace.turn, text=text_out)
+        else:
+            text_out = await sess.lane.run(1, WEBHOOK_STAGE, process_text, text_in, sess.caller_number,
+                                           trace=trace)
+
+            log.info("[AGENT] %r", text_out)
+            if JOURNAL is not None:
+                JOURNAL.event(sess.caller_id, "reply", turn=trace.turn, text=text_out)
+            st = None
+            if sess.alive:
+                st = await sess.lane.run(2, TTS_STAGE, speak_reply, sess, text_out, trace, trace=trace)
+        # mit Ausgabe: Log-Zeile, sobald auch das erste RTP-Paket raus ist
+        trace.finish("ok" if st is not None else "no_playout", wait_playout=st is not None)
+    except asyncio.CancelledError:
+        trace.finish(result="cancelled")
+        raise
+    except Exception:
+        trace.finish(result="error")
+        raise
 
 # ---------- Event-Loop ----------
-def main():
-    # Receiver dauerhaft starten
-    seg = Segmenter(
-        on_segment=lambda seg_bytes: segment_queue.put(seg_bytes),
-        cfg=SegmenterConfig(silence_ms=500, rms_thresh=400, min_bytes=24000)
-    )
-    global rtp_receiver, segmenter_instance
-    segmenter_instance = seg
-    rtp_receiver = RtpReceiver(ip=EXT_HOST_IP, port=EXT_HOST_PORT, segmenter=seg)
-    rtp_receiver.start()
-    print("[RTP-IN] permanent receiver started")
-
+async def _start_worker(sess: CallSession) -> asyncio.Task:
+    t = asyncio.create_task(_segment_worker(sess))
+    if sess.closed:
+        t.cancel()
+    return t
+
+def _cancel_tasks(sess: CallSession):
+    if sess.worker:
+        sess.worker.cancel()
+    for t in list(sess.turns):
+        t.cancel()
+
+def _turn_done(sess: CallSession, t: asyncio.Task):
+    TURN_BUDGET.release()
+    sess.turns.discard(t)
+    if not t.cancelled() and t.exception():
+        log.warning("[JOB] turn failed for %s: %r", sess.caller_id, t.exception())
+
+async def _segment_worker(sess: CallSession):
+    # ein Worker pro Call: startet pro Segment einen Turn-Task; die Stufen
+    # arbeiten parallel, die Reihenfolge hält sess.lane ein. Pro Call laufen
+    # höchstens CALL_MAX_TURNS Turns, insgesamt höchstens TURN_BUDGET; was
+    # solange ankommt, wird zusammengefasst, was zu alt wird, verworfen.
+    q = sess.segment_queue
+    while True:
+        seg, stt_fut, trace = await q.get()
+        if not sess.alive or len(seg) < MIN_SEGMENT_BYTES:
+            SEGMENTS.inc(result="dropped_short" if sess.alive else "dropped_closed")
+            if stt_fut is not None:
+                stt_fut.cancel()
+            continue
+        while CALL_MAX_TURNS and len(sess.turns) >= CALL_MAX_TURNS:
+            await asyncio.wait(list(sess.turns), return_when=asyncio.FIRST_COMPLETED)
+        left = SEGMENT_MAX_AGE_S - (time.monotonic() - trace.t0)
+        # auf einen Platz im Budget höchstens max_turn_wait_ms warten, sonst verwerfen
+        if left <= 0 or not await TURN_BUDGET.acquire(left):
+            stale = left <= 0 or left <= TURN_BUDGET.max_wait_s
+            SEGMENTS.inc(result="dropped_stale" if stale else "dropped_overload")
+            if stt_fut is not None:
+                stt_fut.cancel()
+            trace.finish(result="stale" if stale else "overload")
+            continue
+        if not q.empty():
+            seg, stt_fut, trace = _coalesce([(seg, stt_fut, trace)] + [q.get_nowait() for _ in range(q.qsize())])
+        SEGMENTS.inc(result="accepted")
+        t = asyncio.create_task(run_turn(sess, seg, stt_fut, trace))
+        sess.turns.add(t)
+        t.add_done_callback(lambda t, sess=sess: _turn_done(sess, t))
+
+def _log_task_error(t: asyncio.Future):
+    if not t.cancelled() and t.exception():
+        log.warning("[ARI] handler error: %r", t.exception())
+
+def dispatch(ev: dict):
+    """Verteilt ein ARI-Event sofort; blockierende Arbeit geht in den Thread-Pool."""
+    typ = ev.get("type")
+    waiter = _waiters.pop((typ, ev.get("channel", {}).get("id")), None)
+    if waiter is not None:
+        if not waiter.done():
+            waiter.set_result(ev)
+    elif typ == "StasisStart" and ev.get("application") == APP and is_caller(ev):
+        t = asyncio.create_task(on_start(ev))
+        t.add_done_callback(_log_task_error)
+    elif typ in ("ChannelHangupRequest", "ChannelDestroyed", "StasisEnd"):
+        sess = sessions.get(ev.get("channel", {}).get("id"))
+        if sess and not sess.closed:
+            log.info("[ARI] caller hung up/destroyed: %s", sess.caller_id)
+            fut = _loop.run_in_executor(None, cleanup_call, sess)
+            fut.add_done_callback(_log_task_error)
+
+async def run_events(handle=lambda raw: dispatch(json.loads(raw))):
     auth = base64.b64encode(f"{ARI_USER}:{ARI_PASS}".encode()).decode()
-    ws = create_connection(
-        f"ws://127.0.0.1:8088/ari/events?api_key={ARI_USER}:{ARI_PASS}&app={APP}&subscribeAll=true",
-        header=[f"Authorization: Basic {auth}"]
-    )
-    ws.settimeout(0.1)
-    print("[ARI] connected; waiting for calls...")
-
+    backoff = 1.0
+    while True:
+        try:
+            async with ws_connect(ARI_WS_URL,
+                                  additional_headers={"Authorization": f"Basic {auth}"}) as ws:
+                log.info("[ARI] connected; waiting for calls (RTP ports %d..%d)...",
+                         EXT_HOST_PORT, EXT_HOST_PORT + EXT_PORT_COUNT - 1)
+                backoff = 1.0
+                _set_connected(True)
+                async for raw in ws:
+                    try:
+                        handle(raw)
+                    except Exception as e:
+                        log.warning("[ARI] event error: %s", e)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            log.warning("[ARI] WS error: %r – reconnect in %.0fs", e, backoff)
+        _set_connected(False)
+        await asyncio.sleep(backoff)
+        backoff = min(backoff * 2, 30.0)
+
+# ---------- Warm-Start und Bereitschaft ----------
+def _set_connected(v: bool):
+    global _connected
+    _connected = v
+
+async def _warm_step(name: str, aw):
+    t0 = time.monotonic()
+    try:
+        await aw
+        log.info("[WARMUP] %s ok in %.0f ms", name, (time.monotonic() - t0) * 1000)
+    except Exception as e:
+        log.warning("[WARMUP] %s failed: %r", name, e)
+
+async def warm_up():
+    """
+    Vor dem ersten Call: ARI-Verbindungen im Pool öffnen, STT-Backends laden
+    (Wegwerf-Transkription bzw. TLS-Aufbau), Piper-Verbindungen öffnen und
+    WELCOME, busy_prompt und warmup.prompts in den TTS-Cache rendern.
+    Schritte laufen parallel; Fehler werden geloggt, blockieren aber nicht.
+    """
+    global _warm
+    t0 = time.monotonic()
+    prompts = [WELCOME] + ([BUSY_PROMPT] if OVERLOAD_POLICY == "busy" else []) + WARMUP_PROMPTS
+    steps = [
+        _warm_step("ari", asyncio.gather(*(aari("/asterisk/info") for _ in range(WARMUP_ARI_CONNS)))),
+        _warm_step("tts", ari_tts.awarm(prompts, WARMUP_WY_CONNS)),
+    ]
+    if WARMUP_STT:
+        steps.append(_warm_step("stt", STT_ROUTER.warm(WARMUP_WY_CONNS, LANG, MEDIA_RATE)))
+    try:
+        await asyncio.wait_for(asyncio.gather(*steps), WARMUP_TIMEOUT_S)
+    except asyncio.TimeoutError:
+        log.warning("[WARMUP] not finished after %.0fs, accepting calls anyway", WARMUP_TIMEOUT_S)
+    _warm = True
+    log.info("[WARMUP] done in %.0f ms", (time.monotonic() - t0) * 1000)
+
+def _health():
+    return 200, "text/plain", "ok\n"
+
+def _ready():
+    # bereit = warm und ARI-Events kommen an; erst dann schickt Asterisk Calls
+    ok = _warm and _connected
+    return (200 if ok else 503), "text/plain", ("ready\n" if ok else
+                                                f"not ready (warm={_warm}, connected={_connected})\n")
+
+HEALTH_ROUTES = {"/healthz": _health, "/readyz": _ready}
+
+# ---------- Mehrere Prozesse ----------
+def _hangup(ch_id: str):
+    return aari(f"/channels/{ch_id}", "DELETE", params={"reason": "congestion"})
+
+async def run_supervisor():
+    """Master: hält den ARI-Websocket, verteilt Calls auf WORKERS Worker-Prozesse."""
+    sup = Supervisor(WORKERS, default_argv(os.path.abspath(__file__)), is_caller, _hangup,
+                     APP, WORKER_RESTART_BACKOFF_S)
+    # Call-Metriken liefern die Worker selbst (eigener Port), hier nur die Verteilung
+    REGISTRY.remove_collector(_collect)
+    REGISTRY.add_collector(sup.collect)
+
+    def ready():
+        # Supervisor: ARI verbunden und mindestens ein Worker warm
+        ok = _connected and any(w.up for w in sup.workers)
+        return (200 if ok else 503), "text/plain", "ready\n" if ok else "not ready\n"
+
+    if METRICS_PORT:
+        serve_metrics(METRICS_PORT, METRICS_HOST, routes={
+            "/workers": lambda: (200, "application/json", json.dumps(sup.snapshot())),
+            "/healthz": _health,
+            "/readyz": ready,
+        })
+    # Worker melden sich erst nach ihrem Warm-up
+    await sup.start(WARMUP_TIMEOUT_S + 30)
+    log.info("[SUPERVISOR] %d workers, RTP ports %d..%d", WORKERS, EXT_HOST_PORT, EXT_HOST_PORT + EXT_PORT_COUNT - 1)
     try:
+        await run_events(sup.route)
+    finally:
+        sup.stop()
+
+def setup_worker(idx: int, n: int):
+    """Worker-Prozess: eigener RTP-Portbereich, Channel-ID-Präfix, Metrik-Port, Journal-Verzeichnis."""
+    global WORKER_IDX, EXT_ID_PREFIX, port_pool, METRICS_PORT, EXT_HOST_PORT, EXT_PORT_COUNT
+    WORKER_IDX, EXT_ID_PREFIX = idx, WORKER_PREFIX.format(idx)
+    EXT_HOST_PORT, EXT_PORT_COUNT = port_shard(EXT_HOST_PORT, EXT_PORT_COUNT, idx, n)
+    port_pool = RtpPortPool(EXT_HOST_PORT, EXT_PORT_COUNT)
+    METRICS_PORT = METRICS_PORT + 1 + idx if METRICS_PORT else 0
+    if JOURNAL is not None:
+        JOURNAL.dir = JOURNAL.dir / f"w{idx}"
+
+async def run_worker(ctl_fd: int):
+    """Events kommen vom Master über die Steuerverbindung; Lastbericht alle WORKER_REPORT_S."""
+    reader, writer = await connect_master(ctl_fd)
+    _set_connected(True)
+    log.info("[WORKER] %d ready, RTP ports %d..%d", WORKER_IDX, EXT_HOST_PORT, EXT_HOST_PORT + EXT_PORT_COUNT - 1)
+
+    async def report():
         while True:
+            live = sessions.all()
+            load = {"calls": len(live), "turns": sum(len(x.turns) for x in live),
+                    "ports_free": port_pool.free_count(), "overloaded": over_capacity() is not None,
+                    **process_load()}
+            writer.write(json.dumps({"load": load}).encode() + b"\n")
+            await asyncio.sleep(WORKER_REPORT_S)
+
+    reporter = asyncio.create_task(report())
+    try:
+        async for line in reader:
             try:
-                ev = json.loads(ws.recv())
-                if ev.get("type") == "StasisStart" and ev.get("application") == APP:
-                    on_start(ev)
-                elif ev.get("type") in ("ChannelHangupRequest", "ChannelDestroyed", "StasisEnd"):
-                    ch_id = ev.get("channel", {}).get("id")
-                    if caller_id and ch_id == caller_id:
-                        print("[ARI] caller hung up/destroyed.")
-                        cleanup_call()
-            except WebSocketTimeoutException:
-                pass
+                dispatch(json.loads(line))
             except Exception as e:
-                print("[ARI] WS error:", e)
-
-            # Segmente verarbeiten nur wenn Call aktiv
-            if call_alive and not segment_queue.empty():
-                seg = segment_queue.get()
-                if len(seg) < 32000:
-                    continue
-                t0 = time.time()
-                text_in = transcribe_segment(seg, lang=LANG)
-                print(f"[JOB] stt_done in {(time.time()-t0)*1000:.0f}ms text_in={text_in!r}")
-                if not text_in:
-                    continue
-
-                print(f"[ASR][{caller_number}] {text_in!r}")
-                text_out = process_text(text_in, caller=caller_number)
-
-                print(f"[AGENT] {text_out!r}")
-                if TTS_DST_IP and TTS_DST_PORT:
-                    ensure_ext_in_bridge()
-                    print(f"[TTS] send to {TTS_DST_IP}:{TTS_DST_PORT} -> '{text_out[:60]}'")
-                    say(text_out)
-
-            time.sleep(0.003)
+                log.warning("[ARI] event error: %s", e)
     finally:
-        ws.close()
+        reporter.cancel()
+        _set_connected(False)
+    log.warning("[WORKER] %d: master gone, exiting", WORKER_IDX)
+
+async def amain(ctl_fd: int | None = None):
+    global _loop, _warm
+    _loop = asyncio.get_running_loop()
+    if WORKER_IDX is None and WORKERS > 1:
+        await run_supervisor()
+        return
+    if METRICS_PORT:
+        serve_metrics(METRICS_PORT, METRICS_HOST, routes=HEALTH_ROUTES)
+    if JOURNAL is not None:
+        JOURNAL.start()
+    # erst warm, dann ARI verbinden: vorher schickt Asterisk keine Calls an die App
+    if WARMUP:
+        await warm_up()
+    else:
+        _warm = True
+        if OVERLOAD_POLICY == "busy" and BUSY_PROMPT:
+            # Besetzt-Ansage trotzdem in den Cache (Asterisk spielt sie aus tts_cache.dir)
+            t = asyncio.create_task(ari_tts.apresynth(BUSY_PROMPT))
+            t.add_done_callback(_log_task_error)
+    if WORKER_IDX is not None:
+        await run_worker(ctl_fd)
+    else:
+        await run_events()
+
+def main():
+    p = argparse.ArgumentParser()
+    p.add_argument("--worker", type=int, default=None, help=argparse.SUPPRESS)
+    p.add_argument("--workers", type=int, default=0, help=argparse.SUPPRESS)
+    p.add_argument("--ctl-fd", type=int, default=None, help=argparse.SUPPRESS)
+    a = p.parse_args()
+    tag = ""
+    if a.worker is not None:
+        setup_worker(a.worker, a.workers)
+        tag = f"[w{a.worker}] "
+    logging.basicConfig(level=LOG_LEVEL, format=f"%(asctime)s %(levelname)s {tag}%(name)s %(message)s")
+    asyncio.run(amain(a.ctl_fd))
 
 if __name__ == "__main__":
     main()
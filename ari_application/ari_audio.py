@@ -0,0 +1,55 @@
+# -*- coding: utf-8 -*-
+import audioop, struct
+
+WAVE_FORMAT_PCM = 1
+WAVE_FORMAT_MULAW = 7
+
+
+def wav_header(n_bytes: int, rate: int, width: int = 2, channels: int = 1,
+               fmt: int = WAVE_FORMAT_PCM) -> bytes:
+    """44-Byte RIFF/WAVE-Header für n_bytes Audiodaten (ohne wave/BytesIO)."""
+    block = width * channels
+    return struct.pack("<4sI4s4sIHHIIHH4sI",
+                       b"RIFF", 36 + n_bytes, b"WAVE",
+                       b"fmt ", 16, fmt, channels, rate, rate * block, block, width * 8,
+                       b"data", n_bytes)
+
+
+def trim_silence(pcm: bytes, rate: int, thresh: int, keep_ms: int = 150,
+                 frame_ms: int = 20) -> memoryview:
+    """
+    Schneidet Stille am Anfang und Ende ab (RMS pro frame_ms unter 'thresh'),
+    lässt keep_ms Rand stehen. Liefert einen View auf 'pcm' (keine Kopie).
+    Ist alles still, bleibt das Segment unverändert.
+    """
+    mv = memoryview(pcm)
+    step = rate * 2 * frame_ms // 1000
+    n = len(mv) - len(mv) % step
+    start = 0
+    while start < n and audioop.rms(mv[start:start + step], 2) < thresh:
+        start += step
+    if start >= n:
+        return mv
+    end = n
+    while end > start and audioop.rms(mv[end - step:end], 2) < thresh:
+        end -= step
+    pad = rate * 2 * keep_ms // 1000
+    return mv[max(0, start - pad):min(len(mv), end + pad)]
+
+
+def encode_wav(pcm, rate: int, out_rate: int | None = None, encoding: str = "pcm16") -> bytes:
+    """
+    PCM16-mono als WAV für den Upload: optional auf out_rate herunterrechnen
+    (8000 = Telefonband, mehr steckt nach dem Upsampling nicht drin) und als
+    'pcm16' oder kompakt als 'wav-ulaw' (8 Bit G.711) kodieren.
+    Ergebnis entsteht mit einer einzigen Verkettung aus Header + Daten.
+    """
+    if out_rate and out_rate != rate:
+        pcm, _ = audioop.ratecv(pcm, 2, 1, rate, out_rate, None)
+        rate = out_rate
+    if encoding == "wav-ulaw":
+        data = audioop.lin2ulaw(pcm, 2)
+        return b"".join((wav_header(len(data), rate, 1, fmt=WAVE_FORMAT_MULAW), data))
+    if encoding != "pcm16":
+        raise ValueError(f"unknown upload encoding {encoding!r}")
+    return b"".join((wav_header(len(pcm), rate), pcm))
@@ -0,0 +1,62 @@
+# -*- coding: utf-8 -*-
+import audioop, logging
+from dataclasses import dataclass
+from typing import Callable
+
+from ari_segmenter import Segmenter
+
+log = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class BargeInConfig:
+    enabled: bool = False
+    min_ms: int = 120              # so lange Sprache während der Ausgabe = Unterbrechung
+    threshold_factor: float = 1.5  # Schwelle = Segmenter-Schwelle * Faktor (Echo-Reserve)
+    keep_audio: bool = True        # False: Audio vor der Unterbrechung (Echo-Mix) verwerfen
+
+
+class BargeInDetector:
+    """
+    Sitzt zwischen RtpReceiver und Segmenter (gleiche feed20ms-API).
+    Solange is_playing() wahr ist, wird die Energie der eingehenden Frames
+    beobachtet; nach min_ms Sprache wird on_barge_in() aufgerufen, das die
+    Ausgabe stoppt (der PlayoutScheduler hört nach spätestens einem Frame auf).
+    """
+    def __init__(self, segmenter: Segmenter, cfg: BargeInConfig,
+                 is_playing: Callable[[], bool], on_barge_in: Callable[[], None]):
+        self.segmenter = segmenter
+        self.cfg = cfg
+        self.is_playing = is_playing
+        self.on_barge_in = on_barge_in
+        self._speech_ms = 0.0
+        self._bpms = segmenter.cfg.rate * 2 // 1000
+        self.count = 0
+
+    def feed20ms(self, frame: bytes):
+        if self.cfg.enabled and self.is_playing():
+            self._check(frame)
+        else:
+            self._speech_ms = 0.0
+        self.segmenter.feed20ms(frame)
+
+    def _check(self, frame: bytes):
+        try:
+            rms = audioop.rms(frame, 2)
+        except Exception:
+            rms = 0
+        if rms < self.segmenter.threshold * self.cfg.threshold_factor:
+            self._speech_ms = 0.0
+            return
+        self._speech_ms += len(frame) / self._bpms
+        if self._speech_ms < self.cfg.min_ms:
+            return
+        self._speech_ms = 0.0
+        self.count += 1
+        try:
+            self.on_barge_in()
+        except Exception as e:
+            log.warning("[BARGE-IN] callback error: %s", e)
+        if not self.cfg.keep_audio:
+            # Sprache ab der Unterbrechung behalten, alles davor (Echo) verwerfen
+            self.segmenter.drop_before(self.cfg.min_ms)
@@ -0,0 +1,322 @@
+# -*- coding: utf-8 -*-
+import asyncio, logging, time, uuid
+from collections import OrderedDict, deque
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable
+
+from ari_metrics import REGISTRY
+
+log = logging.getLogger(__name__)
+
+CAMPAIGN_CALLS = REGISTRY.counter("freya_campaign_calls_total",
+                                  "Kampagnen-Anrufe nach Endzustand", ("trunk", "status"))
+PRESYNTH_SECONDS = REGISTRY.histogram("freya_campaign_presynth_seconds",
+                                      "Vorab-Synthese einer Kampagnen-Nachricht")
+
+# Endzustände eines Jobs
+FINAL = ("answered", "no_answer", "failed", "cancelled")
+
+
+class TokenBucket:
+    """Calls-per-second-Grenze: 'rate' Tokens pro Sekunde, höchstens 'burst' auf Vorrat."""
+    def __init__(self, rate: float, burst: float = 1.0):
+        self.rate = float(rate)
+        self.burst = max(1.0, float(burst))
+        self._tokens = self.burst
+        self._t = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        if self.rate <= 0:
+            return
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(self.burst, self._tokens + (now - self._t) * self.rate)
+                self._t = now
+                if self._tokens >= 1.0:
+                    self._tokens -= 1.0
+                    return
+                await asyncio.sleep((1.0 - self._tokens) / self.rate)
+
+
+@dataclass
+class Trunk:
+    name: str
+    endpoint_template: str
+    max_concurrent: int = 2
+
+
+@dataclass
+class CampaignJob:
+    number: str
+    message: str
+    trunk: str
+    status: str = "queued"      # queued, dialing, ringing, up, + FINAL
+    channel_id: str = ""
+    error: str = ""
+    queued_at: float = field(default_factory=time.time)
+    dialed_at: float | None = None
+    answered_at: float | None = None
+    ended_at: float | None = None
+    presynth_ms: float | None = None
+
+    def as_dict(self) -> dict:
+        return {k: v for k, v in self.__dict__.items() if v not in (None, "")}
+
+
+@dataclass
+class Campaign:
+    id: str
+    jobs: list[CampaignJob]
+    created: float = field(default_factory=time.time)
+
+    def counts(self) -> dict:
+        out: dict[str, int] = {}
+        for j in self.jobs:
+            out[j.status] = out.get(j.status, 0) + 1
+        return out
+
+    @property
+    def finished(self) -> bool:
+        return all(j.status in FINAL for j in self.jobs)
+
+    def summary(self) -> dict:
+        return {"id": self.id, "created": self.created, "total": len(self.jobs),
+                "finished": self.finished, "counts": self.counts()}
+
+
+class CampaignRunner:
+    """
+    Arbeitet Kampagnen ab: eine Warteschlange pro Trunk, ein Dispatcher-Task
+    pro Trunk. Jeder Anruf braucht einen globalen Slot, einen Trunk-Slot und
+    ein Token (calls per second); die Slots sind belegt, bis der Channel weg
+    ist (GET /channels/{id} liefert 404), auch bei Fehlern der Abfrage und
+    über max_call_s hinaus (dann wird aufgelegt). ARI-Events aus on_event()
+    (Websocket des Dialers) melden Annahme und Ende sofort, auch wenn ein
+    Anruf kürzer als poll_s ist; ohne Events wird nur gepollt. Parallel zum
+    Klingeln wird die Nachricht vorab synthetisiert (presynth), damit sie beim
+    Annehmen sofort abgespielt werden kann.
+    Alle Methoden laufen im Event-Loop des Dialers.
+    """
+    def __init__(self, originate: Callable[..., Awaitable[dict]],
+                 channel_state: Callable[[str], Awaitable[str | None]],
+                 trunks: dict[str, Trunk], default_trunk: str,
+                 max_concurrent: int = 4, cps: float = 1.0, burst: float = 1.0,
+                 poll_s: float = 2.0, max_call_s: float = 900.0,
+                 presynth: Callable[[str], Awaitable[int]] | None = None,
+                 keep_campaigns: int = 100,
+                 hangup: Callable[[str], Awaitable] | None = None):
+        self.originate = originate
+        self.channel_state = channel_state
+        self.trunks = trunks
+        self.default_trunk = default_trunk
+        self.poll_s = float(poll_s)
+        self.max_call_s = float(max_call_s)
+        self.presynth = presynth
+        self.hangup = hangup
+        self.keep_campaigns = int(keep_campaigns)
+        self.max_concurrent = max(1, int(max_concurrent))
+        self._cps, self._burst = float(cps), float(burst)
+        self.campaigns: "OrderedDict[str, Campaign]" = OrderedDict()
+        self._queues: dict[str, deque] = {t: deque() for t in trunks}
+        self._wake: dict[str, asyncio.Event] = {}
+        self._dispatchers: dict[str, asyncio.Task] = {}
+        self._tasks: set[asyncio.Task] = set()
+        self._global: asyncio.Semaphore | None = None
+        self._trunk_sem: dict[str, asyncio.Semaphore] = {}
+        self._bucket: TokenBucket | None = None
+        self.active: dict[str, int] = {t: 0 for t in trunks}
+        self._by_channel: dict[str, CampaignJob] = {}     # gewählte Channels -> Job
+        self._ch_wake: dict[str, asyncio.Event] = {}      # weckt _watch bei einem Event
+
+    # ---- API ----
+    def submit(self, calls: list[tuple[str, str, str | None]]) -> Campaign:
+        """calls = [(nummer, text, trunk|None), ...] -> neue Kampagne (läuft sofort an)."""
+        jobs = []
+        for number, message, trunk in calls:
+            trunk = trunk or self.default_trunk
+            if trunk not in self.trunks:
+                raise ValueError(f"unknown trunk {trunk!r}")
+            if not number or not message:
+                raise ValueError("number und message dürfen nicht leer sein")
+            jobs.append(CampaignJob(number=number, message=message, trunk=trunk))
+        camp = Campaign(id=uuid.uuid4().hex[:12], jobs=jobs)
+        self._start()
+        self.campaigns[camp.id] = camp
+        self._prune()
+        for j in jobs:
+            self._queues[j.trunk].append(j)
+        for t in {j.trunk for j in jobs}:
+            self._wake[t].set()
+        log.info("[CAMPAIGN] %s queued %d calls", camp.id, len(jobs))
+        return camp
+
+    def get(self, camp_id: str) -> Campaign | None:
+        return self.campaigns.get(camp_id)
+
+    def cancel(self, camp_id: str) -> int:
+        """Noch nicht gewählte Jobs verwerfen (laufende Anrufe bleiben)."""
+        camp = self.campaigns.get(camp_id)
+        if camp is None:
+            return 0
+        n = 0
+        for j in camp.jobs:
+            if j.status == "queued":
+                self._final(j, "cancelled")
+                n += 1
+        return n
+
+    def on_event(self, ev: dict):
+        """ARI-Event (ChannelStateChange, ChannelDestroyed, …) eines gewählten Channels."""
+        ch = ev.get("channel") or {}
+        job = self._by_channel.get(ch.get("id"))
+        if job is None:
+            return
+        if ch.get("state") == "Up" and not job.answered_at:
+            self._answered(job)
+        self._ch_wake[job.channel_id].set()   # Ende (404) prüft _watch sofort
+
+    def snapshot(self) -> dict:
+        return {t: {"active": self.active[t], "queued": sum(1 for j in self._queues[t] if j.status == "queued"),
+                    "max": self.trunks[t].max_concurrent} for t in self.trunks}
+
+    # ---- intern ----
+    def _start(self):
+        if self._global is not None:
+            return
+        self._global = asyncio.Semaphore(self.max_concurrent)
+        self._bucket = TokenBucket(self._cps, self._burst)
+        for name, t in self.trunks.items():
+            self._trunk_sem[name] = asyncio.Semaphore(max(1, int(t.max_concurrent)))
+            self._wake[name] = asyncio.Event()
+            self._dispatchers[name] = asyncio.create_task(self._dispatch(name), name=f"campaign-{name}")
+
+    def _prune(self):
+        while len(self.campaigns) > self.keep_campaigns:
+            oldest = next(iter(self.campaigns.values()))
+            if not oldest.finished:
+                break
+            self.campaigns.popitem(last=False)
+
+    async def _dispatch(self, trunk: str):
+        q, wake, sem = self._queues[trunk], self._wake[trunk], self._trunk_sem[trunk]
+        while True:
+            if not q:
+                wake.clear()
+                await wake.wait()
+                continue
+            await sem.acquire()
+            await self._global.acquire()
+            job = None
+            while q and job is None:
+                j = q.popleft()
+                job = j if j.status == "queued" else None   # abgebrochene überspringen
+            if job is None:
+                self._global.release(); sem.release()
+                continue
+            await self._bucket.acquire()
+            if job.status != "queued":
+                self._global.release(); sem.release()
+                continue
+            t = asyncio.create_task(self._run(job))
+            self._tasks.add(t)
+            t.add_done_callback(self._tasks.discard)
+
+    async def _run(self, job: CampaignJob):
+        trunk = self.trunks[job.trunk]
+        self.active[job.trunk] += 1
+        job.status, job.dialed_at = "dialing", time.time()
+        job.channel_id = str(uuid.uuid4())
+        # vor dem Originate registrieren, damit kein Event verloren geht
+        self._by_channel[job.channel_id] = job
+        self._ch_wake[job.channel_id] = asyncio.Event()
+        pre = asyncio.create_task(self._presynth(job)) if self.presynth else None
+        try:
+            await self.originate(job.number, job.message, trunk.endpoint_template, job.channel_id)
+            job.status = "ringing"
+            await self._watch(job)
+        except Exception as e:
+            job.error = str(e)
+            self._final(job, "failed")
+            log.warning("[CAMPAIGN] call to %s failed: %s", job.number, e)
+        finally:
+            self._by_channel.pop(job.channel_id, None)
+            self._ch_wake.pop(job.channel_id, None)
+            if pre is not None and not pre.done():
+                pre.cancel()
+            self.active[job.trunk] -= 1
+            self._trunk_sem[job.trunk].release()
+            self._global.release()
+
+    async def _presynth(self, job: CampaignJob):
+        t0 = time.monotonic()
+        try:
+            await self.presynth(job.message)
+        except Exception as e:
+            log.warning("[CAMPAIGN] presynth failed: %s", e)
+            return
+        dt = time.monotonic() - t0
+        job.presynth_ms = round(dt * 1000.0, 1)
+        PRESYNTH_SECONDS.observe(dt)
+
+    async def _watch(self, job: CampaignJob):
+        """
+        Bis der Channel verschwunden ist (Slot bleibt so lange belegt): alle
+        poll_s oder sofort nach einem Event abfragen. Schlägt die Abfrage fehl,
+        bleibt der Slot belegt; nach max_call_s wird aufgelegt.
+        """
+        wake = self._ch_wake[job.channel_id]
+        deadline = time.monotonic() + self.max_call_s
+        while True:
+            try:
+                await asyncio.wait_for(wake.wait(), self.poll_s)
+            except asyncio.TimeoutError:
+                pass
+            wake.clear()
+            try:
+                state = await self.channel_state(job.channel_id)
+            except Exception as e:
+                log.warning("[CAMPAIGN] state of %s unknown, keeping slot: %s", job.channel_id, e)
+                state = ""
+            if state is None:
+                self._final(job, "answered" if job.answered_at else "failed" if job.error else "no_answer")
+                return
+            if state == "Up" and not job.answered_at:
+                self._answered(job)
+            if time.monotonic() > deadline:
+                if not job.error:
+                    job.error = "max_call_s exceeded"
+                    log.warning("[CAMPAIGN] call to %s exceeded max_call_s, hanging up", job.number)
+                if self.hangup is not None:
+                    try:
+                        await self.hangup(job.channel_id)
+                    except Exception as e:
+                        log.warning("[CAMPAIGN] hangup of %s failed: %s", job.channel_id, e)
+
+    @staticmethod
+    def _answered(job: CampaignJob):
+        job.status, job.answered_at = "up", time.time()
+
+    @staticmethod
+    def _final(job: CampaignJob, status: str):
+        job.status, job.ended_at = status, time.time()
+        CAMPAIGN_CALLS.inc(trunk=job.trunk, status=status)
+
+
+def trunks_from_cfg(dialer_c: dict) -> tuple[dict[str, Trunk], str]:
+    """
+    dialer.campaign.trunks -> {name: Trunk}; ohne Eintrag gibt es einen
+    Trunk "default" mit dialer.endpoint_template.
+    """
+    cc = dialer_c.get("campaign", {}) or {}
+    trunks = {}
+    for name, t in (cc.get("trunks") or {}).items():
+        t = t or {}
+        trunks[name] = Trunk(name, t.get("endpoint_template") or dialer_c["endpoint_template"],
+                             int(t.get("max_concurrent", 2)))
+    if not trunks:
+        trunks["default"] = Trunk("default", dialer_c["endpoint_template"],
+                                  int(cc.get("per_trunk_max", 2)))
+    default = cc.get("default_trunk") or next(iter(trunks))
+    return trunks, default
@@ -1,9 +1,14 @@
 #!/usr/bin/env python3
-import requests
+import asyncio, base64, json, logging
 from fastapi import FastAPI, HTTPException
+from fastapi.responses import PlainTextResponse
 from pydantic import BaseModel, Field
 import uvicorn
 from urllib.parse import quote
+from websockets.asyncio.client import connect as ws_connect
+from ari_http import HttpClient, ari_client, make_client, all_clients
+from ari_metrics import REGISTRY, PROM_CONTENT_TYPE, http_histograms, metric_family
+from ari_campaign import CampaignRunner, trunks_from_cfg
 from config import cfg
 
 # ---------- Konfig aus YAML ----------
@@ -16,20 +21,33 @@ APP      = C["ari"]["app"]
 ENDPOINT_TEMPLATE = C["dialer"]["endpoint_template"]
 DIALER_TIMEOUT_S  = int(C["dialer"]["timeout_s"])
 API_PORT          = int(C.get("api_port", 8099))
+CAMPAIGN_C        = C["dialer"].get("campaign", {}) or {}
+CAMPAIGN_EVENTS   = bool(CAMPAIGN_C.get("events", True))
+
+# eigene ARI-App nur für Events (subscribeAll: Zustände aller Channels, übernimmt keine)
+EVENTS_APP    = f"{APP}-dialer"
+EVENTS_WS_URL = ARI_BASE.replace("http", "ws", 1).rstrip("/") + \
+    f"/events?app={EVENTS_APP}&subscribeAll=true"
+
+log = logging.getLogger(__name__)
 
 # ---------- Dialer-Klasse ----------
 class AriDialer:
-    def __init__(self, base: str, user: str, pwd: str, app: str, endpoint_template: str):
+    def __init__(self, base: str, user: str, pwd: str, app: str, endpoint_template: str,
+                 http: HttpClient | None = None):
         self.base = base.rstrip("/")
         self.auth = (user, pwd)
         self.app  = app
         self.endpoint_template = endpoint_template
+        # Keep-Alive-Pool statt neuer TCP-Verbindung pro Anruf
+        self.http = http or make_client("ari", base=self.base, auth=self.auth)
 
-    def call_and_say(self, number: str, message: str, timeout_s: int | None = None) -> dict:
+    def _originate_params(self, number: str, message: str, timeout_s: int | None,
+                          endpoint_template: str | None = None, channel_id: str | None = None) -> dict:
         if not number or not message:
             raise ValueError("number und message dürfen nicht leer sein")
 
-        endpoint = self.endpoint_template.format(number=number)
+        endpoint = (endpoint_template or self.endpoint_template).format(number=number)
         params = {
             "endpoint": endpoint,
             "app": self.app,
@@ -37,32 +55,167 @@ class AriDialer:
             "callerId": number,
             "timeout": timeout_s or DIALER_TIMEOUT_S,
         }
-        r = requests.post(
-            f"{self.base}/channels",
-            params=params,
-            json={},          # leerer Body verhindert 500er bei manchen ARI-Versionen
-            auth=self.auth,
-            timeout=5,
-        )
+        if channel_id:
+            params["channelId"] = channel_id     # eigene ID -> Status per GET /channels/{id}
+        return params
+
+    @staticmethod
+    def _result(r) -> dict:
         if r.status_code not in (200, 202):
             raise RuntimeError(f"ARI create failed: {r.status_code} | {r.reason} | {r.text}")
         return r.json() if r.text else {"status": "ok"}
 
+    def call_and_say(self, number: str, message: str, timeout_s: int | None = None) -> dict:
+        params = self._originate_params(number, message, timeout_s)
+        r = self.http.request(
+            "POST", "/channels",
+            endpoint="ari.originate",
+            params=params,
+            json={},          # leerer Body verhindert 500er bei manchen ARI-Versionen
+        )
+        return self._result(r)
+
+    async def acall_and_say(self, number: str, message: str, timeout_s: int | None = None,
+                            endpoint_template: str | None = None, channel_id: str | None = None) -> dict:
+        params = self._originate_params(number, message, timeout_s, endpoint_template, channel_id)
+        r = await self.http.arequest("POST", "/channels", endpoint="ari.originate",
+                                     params=params, json={})
+        return self._result(r)
+
+    async def achannel_state(self, channel_id: str) -> str | None:
+        """ARI-Channel-Zustand ("Down", "Ring", "Up", …) oder None, wenn er nicht mehr existiert."""
+        r = await self.http.arequest("GET", f"/channels/{channel_id}", endpoint="ari.channel")
+        if r.status_code == 404:
+            return None
+        if r.status_code != 200:
+            raise RuntimeError(f"ARI channel lookup failed: {r.status_code} | {r.reason}")
+        return r.json().get("state") or ""
+
+    async def ahangup(self, channel_id: str):
+        r = await self.http.arequest("DELETE", f"/channels/{channel_id}", endpoint="ari.channel")
+        if r.status_code not in (204, 404):
+            raise RuntimeError(f"ARI hangup failed: {r.status_code} | {r.reason}")
+
 # ---------- HTTP für n8n / externe Trigger ----------
 class CallRequest(BaseModel):
     callerId: str = Field(..., description="Zielrufnummer (E.164 oder passend zu deinem Dialplan)")
     message:  str = Field(..., description="Text, der gesprochen werden soll")
 
+class CampaignCall(BaseModel):
+    callerId: str = Field(..., description="Zielrufnummer")
+    message:  str | None = Field(None, description="Text für diesen Anruf (sonst der Kampagnen-Text)")
+    trunk:    str | None = Field(None, description="Trunk aus dialer.campaign.trunks (sonst default)")
+
+class CampaignRequest(BaseModel):
+    calls:   list[CampaignCall] = Field(..., min_length=1)
+    message: str | None = Field(None, description="Standard-Text für alle Anrufe")
+    trunk:   str | None = None
+
 app = FastAPI(title="Freya Dialer API", version="1.0")
-dialer = AriDialer(ARI_BASE, ARI_USER, ARI_PASS, APP, ENDPOINT_TEMPLATE)
+dialer = AriDialer(ARI_BASE, ARI_USER, ARI_PASS, APP, ENDPOINT_TEMPLATE, http=ari_client())
+
+def _presynth():
+    # Vorab-Synthese in den (geteilten) TTS-Cache; ari_tts erst hier laden (Wyoming, Playout)
+    if not CAMPAIGN_C.get("presynth", True):
+        return None
+    from ari_tts import apresynth
+    return apresynth
+
+async def _originate(number: str, message: str, endpoint_template: str, channel_id: str) -> dict:
+    return await dialer.acall_and_say(number, message, endpoint_template=endpoint_template,
+                                      channel_id=channel_id)
+
+_trunks, _default_trunk = trunks_from_cfg(C["dialer"])
+campaigns = CampaignRunner(
+    _originate, dialer.achannel_state, _trunks, _default_trunk,
+    max_concurrent=int(CAMPAIGN_C.get("max_concurrent", 4)),
+    cps=float(CAMPAIGN_C.get("cps", 1.0)),
+    burst=float(CAMPAIGN_C.get("burst", 1)),
+    poll_s=float(CAMPAIGN_C.get("poll_s", 2.0)),
+    max_call_s=float(CAMPAIGN_C.get("max_call_s", 900)),
+    presynth=_presynth(),
+    keep_campaigns=int(CAMPAIGN_C.get("keep", 100)),
+    hangup=dialer.ahangup,
+)
+
+async def _run_events():
+    """ARI-Events an den CampaignRunner (Annahme/Ende ohne Poll-Lücke), mit Reconnect."""
+    auth = base64.b64encode(f"{ARI_USER}:{ARI_PASS}".encode()).decode()
+    backoff = 1.0
+    while True:
+        try:
+            async with ws_connect(EVENTS_WS_URL, additional_headers={"Authorization": f"Basic {auth}"}) as ws:
+                log.info("[DIALER] ARI events connected (app %s)", EVENTS_APP)
+                backoff = 1.0
+                async for raw in ws:
+                    try:
+                        campaigns.on_event(json.loads(raw))
+                    except Exception as e:
+                        log.warning("[DIALER] event error: %s", e)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            log.warning("[DIALER] ARI events: %r – reconnect in %.0fs (polling only)", e, backoff)
+        await asyncio.sleep(backoff)
+        backoff = min(backoff * 2, 30.0)
+
+@app.on_event("startup")
+async def _start_events():
+    if CAMPAIGN_EVENTS:
+        app.state.events_task = asyncio.create_task(_run_events())
 
 @app.post("/call")
-def call(req: CallRequest):
+async def call(req: CallRequest):
     try:
-        res = dialer.call_and_say(req.callerId.strip(), req.message.strip())
+        res = await dialer.acall_and_say(req.callerId.strip(), req.message.strip())
         return {"ok": True, "ari": res}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/campaigns", status_code=202)
+async def create_campaign(req: CampaignRequest):
+    calls = [(c.callerId.strip(), (c.message or req.message or "").strip(), c.trunk or req.trunk)
+             for c in req.calls]
+    try:
+        camp = campaigns.submit(calls)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return camp.summary()
+
+@app.get("/campaigns")
+async def list_campaigns():
+    return {"trunks": campaigns.snapshot(),
+            "campaigns": [c.summary() for c in campaigns.campaigns.values()]}
+
+@app.get("/campaigns/{camp_id}")
+async def get_campaign(camp_id: str):
+    camp = campaigns.get(camp_id)
+    if camp is None:
+        raise HTTPException(status_code=404, detail="unknown campaign")
+    return {**camp.summary(), "jobs": [j.as_dict() for j in camp.jobs]}
+
+@app.delete("/campaigns/{camp_id}")
+async def cancel_campaign(camp_id: str):
+    if campaigns.get(camp_id) is None:
+        raise HTTPException(status_code=404, detail="unknown campaign")
+    return {"cancelled": campaigns.cancel(camp_id)}
+
+# ---------- Metriken (Prometheus) ----------
+# Dialer-Prozess: ARI-Originate-Latenzen; Call-/Turn-Metriken liefert ari_app (metrics.port)
+REGISTRY.add_collector(lambda: http_histograms(all_clients()))
+
+def _collect_campaigns():
+    snap = campaigns.snapshot()
+    yield from metric_family("freya_campaign_active_calls", "gauge", "Laufende Kampagnen-Anrufe pro Trunk",
+                             [({"trunk": t}, s["active"]) for t, s in snap.items()])
+    yield from metric_family("freya_campaign_queued_calls", "gauge", "Wartende Kampagnen-Anrufe pro Trunk",
+                             [({"trunk": t}, s["queued"]) for t, s in snap.items()])
+
+REGISTRY.add_collector(_collect_campaigns)
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def metrics():
+    return PlainTextResponse(REGISTRY.render(), media_type=PROM_CONTENT_TYPE)
+
 if __name__ == "__main__":
     uvicorn.run(app, host="0.0.0.0", port=API_PORT)
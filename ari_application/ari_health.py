@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Bereitschaftsprüfung für Container-Healthcheck und Startreihenfolge.
+Fragt /readyz von ari_app auf metrics.port ab (Port aus der Konfig, nicht
+fest verdrahtet); ist der Endpoint aus (metrics.port 0), wird stattdessen
+geprüft, ob ARI antwortet. Nur Standardbibliothek, damit der Aufruf schnell ist.
+
+  python ari_health.py              # einmal prüfen, Exit 0 = bereit
+  python ari_health.py --wait 120   # höchstens 120 s auf Bereitschaft warten
+"""
+import argparse, base64, sys, time
+import urllib.request
+
+from config import cfg
+
+
+def probe() -> tuple[str, urllib.request.Request]:
+    C = cfg()
+    m = C.get("metrics", {}) or {}
+    port = int(m.get("port", 9108) or 0)
+    if port:
+        host = m.get("host", "0.0.0.0")
+        host = "127.0.0.1" if host in ("", "0.0.0.0", "::") else host
+        url = f"http://{host}:{port}/readyz"
+        return url, urllib.request.Request(url)
+    a = C["ari"]
+    url = a["base"].rstrip("/") + "/asterisk/info"
+    auth = base64.b64encode(f'{a["user"]}:{a["pass"]}'.encode()).decode()
+    return url, urllib.request.Request(url, headers={"Authorization": f"Basic {auth}"})
+
+
+def ready(req: urllib.request.Request, timeout_s: float = 2.0) -> bool:
+    try:
+        with urllib.request.urlopen(req, timeout=timeout_s) as r:
+            return r.status == 200
+    except (OSError, ValueError):   # URLError/HTTPError (503) sind OSError
+        return False
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description="ari_app-Bereitschaft prüfen")
+    ap.add_argument("--wait", type=float, default=0.0, help="höchstens so viele Sekunden warten (0 = einmal prüfen)")
+    args = ap.parse_args()
+    url, req = probe()
+    t_end = time.monotonic() + args.wait
+    while not ready(req):
+        if time.monotonic() >= t_end:
+            if args.wait:
+                print(f"[HEALTH] {url} not ready after {args.wait:.0f}s", file=sys.stderr)
+            return 1
+        time.sleep(1)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
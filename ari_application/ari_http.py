@@ -0,0 +1,134 @@
+# -*- coding: utf-8 -*-
+import asyncio, bisect, threading, time
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from config import cfg
+
+# Latenz-Buckets in ms (obere Grenzen, kumulativ wie bei Prometheus)
+LATENCY_BUCKETS_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+
+class LatencyHistogram:
+    """Zähler + Latenz-Histogramm für einen Endpoint (thread-safe)."""
+    def __init__(self, buckets=LATENCY_BUCKETS_MS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)   # letzter = +Inf
+        self.count = 0
+        self.errors = 0
+        self.sum_ms = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, ms: float, error: bool = False):
+        i = bisect.bisect_left(self.buckets, ms)
+        with self._lock:
+            self.counts[i] += 1
+            self.count += 1
+            self.sum_ms += ms
+            if error:
+                self.errors += 1
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            cum, acc = [], 0
+            for c in self.counts:
+                acc += c
+                cum.append(acc)
+            return {"count": self.count, "errors": self.errors, "sum_ms": round(self.sum_ms, 1),
+                    "buckets": dict(zip([*self.buckets, "+Inf"], cum))}
+
+
+class HttpClient:
+    """
+    Gemeinsamer HTTP-Client mit Keep-Alive-Pool (requests.Session), Timeouts
+    pro Endpoint, Retry mit Backoff (Verbindungsfehler immer, 502/503/504 nur
+    bei idempotenten Methoden) und Latenz-Statistik pro Endpoint.
+    arequest() ist die Variante für den Event-Loop (eigener Thread-Pool in
+    Größe des Verbindungspools, die Verbindungen werden geteilt).
+    """
+    def __init__(self, name: str, base: str = "", auth=None, pool_size: int = 32,
+                 retries: int = 2, backoff_s: float = 0.1, timeouts: dict | None = None,
+                 default_timeout_s: float = 5.0):
+        self.name = name
+        self.base = base.rstrip("/")
+        self.timeouts = timeouts or {}
+        self.default_timeout_s = default_timeout_s
+        self.session = requests.Session()
+        if auth:
+            self.session.auth = auth
+        retry = Retry(total=retries, connect=retries, read=retries, status=retries,
+                      backoff_factor=backoff_s, status_forcelist=(502, 503, 504),
+                      allowed_methods=frozenset({"GET", "HEAD", "PUT", "DELETE", "OPTIONS"}),
+                      raise_on_status=False)
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size, max_retries=retry)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self._executor = ThreadPoolExecutor(max_workers=pool_size, thread_name_prefix=f"http-{name}")
+        self.stats: dict[str, LatencyHistogram] = {}
+        self._stats_lock = threading.Lock()
+
+    def _timeout(self, endpoint: str) -> float:
+        return float(self.timeouts.get(endpoint, self.timeouts.get(self.name, self.default_timeout_s)))
+
+    def _hist(self, endpoint: str) -> LatencyHistogram:
+        h = self.stats.get(endpoint)
+        if h is None:
+            with self._stats_lock:
+                h = self.stats.setdefault(endpoint, LatencyHistogram())
+        return h
+
+    def request(self, method: str, path: str, endpoint: str | None = None,
+                timeout: float | None = None, **kw) -> requests.Response:
+        endpoint = endpoint or self.name
+        url = path if path.startswith(("http://", "https://")) else self.base + path
+        t0 = time.perf_counter()
+        err = True
+        try:
+            r = self.session.request(method, url, timeout=timeout or self._timeout(endpoint), **kw)
+            err = r.status_code >= 500
+            return r
+        finally:
+            self._hist(endpoint).observe((time.perf_counter() - t0) * 1000.0, err)
+
+    async def arequest(self, method: str, path: str, **kw) -> requests.Response:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, lambda: self.request(method, path, **kw))
+
+    def snapshot(self) -> dict:
+        with self._stats_lock:
+            items = list(self.stats.items())
+        return {ep: h.snapshot() for ep, h in items}
+
+
+def _http_cfg() -> dict:
+    return cfg().get("http", {}) or {}
+
+def make_client(name: str, base: str = "", auth=None, default_timeout_s: float = 5.0) -> HttpClient:
+    h = _http_cfg()
+    return HttpClient(name, base=base, auth=auth,
+                      pool_size=int(h.get("pool_size", 32)),
+                      retries=int(h.get("retries", 2)),
+                      backoff_s=float(h.get("backoff_s", 0.1)),
+                      timeouts=h.get("timeouts") or {},
+                      default_timeout_s=default_timeout_s)
+
+@lru_cache(maxsize=1)
+def ari_client() -> HttpClient:
+    a = cfg()["ari"]
+    return make_client("ari", base=a["base"], auth=(a["user"], a["pass"]), default_timeout_s=5)
+
+@lru_cache(maxsize=1)
+def webhook_client() -> HttpClient:
+    return make_client("webhook", default_timeout_s=10)
+
+def all_clients() -> list[HttpClient]:
+    """Bereits erzeugte Clients (für Metriken)."""
+    out = []
+    for f in (ari_client, webhook_client):
+        if f.cache_info().currsize:
+            out.append(f())
+    return out
@@ -0,0 +1,258 @@
+# -*- coding: utf-8 -*-
+import json, logging, os, threading, time
+from collections import deque
+from pathlib import Path
+
+log = logging.getLogger(__name__)
+
+_AUDIO = 0
+_EVENT = 1
+
+
+class _CallFiles:
+    __slots__ = ("day", "files", "bytes", "pending", "last")
+
+    def __init__(self, day: str):
+        self.day = day
+        self.files = {}                       # "in"/"out" -> offene Datei
+        self.bytes = {"in": 0, "out": 0}      # geschrieben + anstehend = Offset fürs Index
+        self.pending = {"in": [], "out": []}
+        self.last = time.monotonic()
+
+
+class Journal:
+    """
+    Mitschnitt von Calls abseits des Hot-Paths: Audio (8k μ-law, wie es ankommt
+    bzw. gesendet wird) und Ereignisse (Segment, Transkript, Antwort, …) gehen
+    in einen begrenzten Ring im RAM. audio()/event() blockieren nie: ist der
+    Ring voll, wird verworfen und gezählt (dropped).
+    Ein Hintergrund-Thread schreibt alle flush_s gesammelt weg:
+      <dir>/<YYYYMMDD>/<call>.in.ulaw / .out.ulaw  (roh, 8000 Bytes/s)
+      <dir>/index.jsonl                             (eine JSON-Zeile pro Ereignis,
+                                                     mit Byte-Offsets in die Audiodateien)
+    index.jsonl rotiert ab index_rotate_bytes, ältere Dateien werden gelöscht,
+    sobald das Verzeichnis max_total_bytes überschreitet.
+    """
+    def __init__(self, directory: str, max_queue: int = 20000, flush_s: float = 0.25,
+                 index_rotate_bytes: int = 64 * 1024 * 1024,
+                 max_total_bytes: int = 2 * 1024 * 1024 * 1024,
+                 idle_close_s: float = 300.0):
+        self.dir = Path(directory)
+        self.max_queue = int(max_queue)
+        self.flush_s = float(flush_s)
+        self.index_rotate_bytes = int(index_rotate_bytes)
+        self.max_total_bytes = int(max_total_bytes)
+        self.idle_close_s = float(idle_close_s)
+        self._q: deque = deque()
+        self._calls: dict[str, _CallFiles] = {}
+        self._ended: dict[str, None] = {}     # beendete Calls: späte Einträge verwerfen
+        self._index = None
+        self._index_bytes = 0
+        self._stop = threading.Event()
+        self._thread = None
+        self._dir_bytes = 0
+        self._last_prune = 0.0
+        # Statistik
+        self.queued = 0
+        self.dropped = 0
+        self._dropped_logged = 0
+        self._drop_warned = 0.0
+        self.written_bytes = 0
+
+    # ---- Hot-Path (RTP-, Playout-, Event-Loop-Threads) ----
+    def audio(self, call_id: str, direction: str, ulaw) -> bool:
+        """direction "in"/"out"; ulaw: bytes oder Liste von Payloads (wird kopiert)."""
+        if len(self._q) >= self.max_queue:
+            self.dropped += 1
+            return False
+        data = b"".join(ulaw) if isinstance(ulaw, list) else bytes(ulaw)
+        self._q.append((_AUDIO, call_id, direction, data))
+        self.queued += 1
+        return True
+
+    def event(self, call_id: str, kind: str, **fields) -> bool:
+        if len(self._q) >= self.max_queue:
+            self.dropped += 1
+            return False
+        self._q.append((_EVENT, call_id, kind, (time.time(), fields)))
+        self.queued += 1
+        return True
+
+    def depth(self) -> int:
+        return len(self._q)
+
+    # ---- Writer ----
+    def start(self) -> "Journal":
+        self.dir.mkdir(parents=True, exist_ok=True)
+        self._dir_bytes = self._scan()[1]
+        self._open_index()
+        self._thread = threading.Thread(target=self._run, name="journal", daemon=True)
+        self._thread.start()
+        log.info("[JOURNAL] writing to %s", self.dir)
+        return self
+
+    def close(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(5)
+        self._thread = None
+
+    def _run(self):
+        while not self._stop.wait(self.flush_s):
+            try:
+                self._drain()
+            except Exception as e:
+                log.warning("[JOURNAL] write failed: %s", e)
+        self._drain()
+        for cf in list(self._calls.values()):
+            self._close_call(cf)
+        if self._index:
+            self._index.close()
+
+    def _drain(self):
+        q = self._q
+        lines = []
+        touched = set()
+        for _ in range(len(q)):
+            typ, call_id, a, b = q.popleft()
+            if call_id in self._ended:
+                continue
+            cf = self._calls.get(call_id)
+            if cf is None:
+                cf = self._calls[call_id] = _CallFiles(time.strftime("%Y%m%d"))
+            if typ == _AUDIO:
+                cf.pending[a].append(b)
+                cf.bytes[a] += len(b)
+                touched.add(call_id)
+                continue
+            t, fields = b
+            rec = {"t": round(t, 3), "call": call_id, "kind": a,
+                   "in_off": cf.bytes["in"], "out_off": cf.bytes["out"], **fields}
+            if a == "call_start":
+                rec["files"] = f"{cf.day}/{_safe(call_id)}"
+            lines.append(json.dumps(rec, ensure_ascii=False))
+            if a == "call_end":
+                touched.discard(call_id)
+                self._write_audio(call_id, cf)
+                self._close_call(cf)
+                del self._calls[call_id]
+                self._ended[call_id] = None
+                if len(self._ended) > 1000:
+                    del self._ended[next(iter(self._ended))]
+        for call_id in touched:
+            self._write_audio(call_id, self._calls[call_id])
+        if self.dropped != self._dropped_logged:
+            lines.append(json.dumps({"t": round(time.time(), 3), "kind": "dropped", "total": self.dropped}))
+            if time.monotonic() - self._drop_warned > 10:
+                self._drop_warned = time.monotonic()
+                log.warning("[JOURNAL] ring full, dropped %d entries so far", self.dropped)
+            self._dropped_logged = self.dropped
+        if lines:
+            data = ("\n".join(lines) + "\n").encode("utf-8")
+            self._index.write(data)
+            self._index.flush()
+            self._index_bytes += len(data)
+            self._account(len(data))
+            if self._index_bytes >= self.index_rotate_bytes:
+                self._rotate_index()
+        self._close_idle()
+        self._prune()
+
+    def _write_audio(self, call_id: str, cf: _CallFiles):
+        for d in ("in", "out"):
+            chunks = cf.pending[d]
+            if not chunks:
+                continue
+            f = cf.files.get(d)
+            if f is None:
+                p = self.dir / cf.day / f"{_safe(call_id)}.{d}.ulaw"
+                p.parent.mkdir(exist_ok=True)
+                f = cf.files[d] = open(p, "ab")
+            data = b"".join(chunks)
+            f.write(data)
+            f.flush()
+            chunks.clear()
+            self._account(len(data))
+        cf.last = time.monotonic()
+
+    @staticmethod
+    def _close_call(cf: _CallFiles):
+        for f in cf.files.values():
+            try:
+                f.close()
+            except OSError:
+                pass
+        cf.files.clear()
+
+    def _close_idle(self):
+        # Calls ohne call_end (z.B. Absturz des Setups): Dateien irgendwann schließen
+        now = time.monotonic()
+        for call_id, cf in list(self._calls.items()):
+            if now - cf.last > self.idle_close_s:
+                self._close_call(cf)
+                del self._calls[call_id]
+
+    # ---- Index und Größen ----
+    def _open_index(self):
+        p = self.dir / "index.jsonl"
+        self._index = open(p, "ab")
+        self._index_bytes = p.stat().st_size
+
+    def _rotate_index(self):
+        self._index.close()
+        stem = time.strftime("index-%Y%m%d-%H%M%S")
+        dst, n = self.dir / f"{stem}.jsonl", 0
+        while dst.exists():
+            n += 1
+            dst = self.dir / f"{stem}-{n}.jsonl"
+        os.replace(self.dir / "index.jsonl", dst)
+        self._open_index()
+
+    def _account(self, n: int):
+        self.written_bytes += n
+        self._dir_bytes += n
+
+    def _scan(self) -> tuple[list, int]:
+        files, total = [], 0
+        for p in self.dir.rglob("*"):
+            if p.is_file():
+                st = p.stat()
+                files.append((st.st_mtime, st.st_size, p))
+                total += st.st_size
+        return files, total
+
+    def _prune(self):
+        # höchstens alle 30 s das Verzeichnis scannen, und nur wenn die Grenze erreicht sein kann
+        if self._dir_bytes <= self.max_total_bytes or time.monotonic() - self._last_prune < 30:
+            return
+        self._last_prune = time.monotonic()
+        files, total = self._scan()
+        open_files = {Path(f.name) for cf in self._calls.values() for f in cf.files.values()}
+        open_files.add(self.dir / "index.jsonl")
+        for _, size, p in sorted(files):
+            if total <= self.max_total_bytes:
+                break
+            if p in open_files:
+                continue
+            try:
+                p.unlink()
+                total -= size
+            except OSError:
+                pass
+        self._dir_bytes = total
+
+
+def _safe(call_id: str) -> str:
+    return "".join(c if c.isalnum() or c in "-_." else "_" for c in call_id)
+
+
+def journal_from_cfg(c: dict) -> Journal | None:
+    """Journal aus der Config (journal.*), None wenn aus. Writer startet mit start()."""
+    c = c or {}
+    if not c.get("enabled", False):
+        return None
+    return Journal(c.get("dir") or "/tmp/freya-journal",
+                   max_queue=int(c.get("max_queue", 20000)),
+                   flush_s=float(c.get("flush_ms", 250)) / 1000.0,
+                   index_rotate_bytes=int(c.get("index_rotate_bytes", 64 * 1024 * 1024)),
+                   max_total_bytes=int(c.get("max_total_bytes", 2 * 1024 * 1024 * 1024)))
@@ -0,0 +1,280 @@
+# -*- coding: utf-8 -*-
+import bisect, logging, threading, time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Iterable
+
+log = logging.getLogger(__name__)
+
+# Sekunden-Buckets für Turn-/Stufen-Latenzen
+SECONDS_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.0, 4.0, 8.0, 16.0)
+
+
+def _labels(names: tuple, values: tuple, extra: str = "") -> str:
+    parts = [f'{k}="{v}"' for k, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help: str, labelnames: tuple = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: dict) -> tuple:
+        return tuple(str(labels.get(k, "")) for k in self.labelnames)
+
+    def render(self) -> Iterable[str]:
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} {self.kind}"
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, *a, **kw):
+        super().__init__(*a, **kw)
+        self._v: dict[tuple, float] = {}
+
+    def inc(self, n: float = 1, **labels):
+        k = self._key(labels)
+        with self._lock:
+            self._v[k] = self._v.get(k, 0) + n
+
+    def render(self):
+        yield from super().render()
+        with self._lock:
+            items = list(self._v.items())
+        for k, v in items:
+            yield f"{self.name}{_labels(self.labelnames, k)} {v}"
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def set(self, v: float, **labels):
+        with self._lock:
+            self._v[self._key(labels)] = v
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help, labelnames=(), buckets=SECONDS_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(buckets)
+        self._v: dict[tuple, list] = {}   # key -> [counts..., +Inf, sum]
+
+    def observe(self, v: float, **labels):
+        k = self._key(labels)
+        i = bisect.bisect_left(self.buckets, v)
+        with self._lock:
+            row = self._v.get(k)
+            if row is None:
+                row = self._v[k] = [0] * (len(self.buckets) + 1) + [0.0]
+            row[i] += 1
+            row[-1] += v
+
+    def render(self):
+        yield from super().render()
+        with self._lock:
+            items = [(k, list(r)) for k, r in self._v.items()]
+        for k, row in items:
+            acc = 0
+            for le, c in zip([*self.buckets, "+Inf"], row):
+                acc += c
+                lbl = _labels(self.labelnames, k, 'le="%s"' % le)
+                yield f"{self.name}_bucket{lbl} {acc}"
+            yield f"{self.name}_sum{_labels(self.labelnames, k)} {row[-1]:.6f}"
+            yield f"{self.name}_count{_labels(self.labelnames, k)} {acc}"
+
+
+class Registry:
+    """
+    Metriken im Prometheus-Textformat. Neben eigenen Countern/Gauges/Histogrammen
+    können Collector-Funktionen registriert werden, die beim Abruf Zeilen liefern
+    (z.B. Zähler, die ohnehin schon in anderen Objekten stehen).
+    """
+    def __init__(self):
+        self._metrics: dict[str, _Metric] = {}
+        self._collectors: list[Callable[[], Iterable[str]]] = []
+        self._lock = threading.Lock()
+
+    def _get(self, cls, name, help, labelnames=(), **kw):
+        with self._lock:
+            m = self._metrics.get(name)
+            if m is None:
+                m = self._metrics[name] = cls(name, help, labelnames, **kw)
+            return m
+
+    def counter(self, name, help, labelnames=()) -> Counter:
+        return self._get(Counter, name, help, labelnames)
+
+    def gauge(self, name, help, labelnames=()) -> Gauge:
+        return self._get(Gauge, name, help, labelnames)
+
+    def histogram(self, name, help, labelnames=(), buckets=SECONDS_BUCKETS) -> Histogram:
+        return self._get(Histogram, name, help, labelnames, buckets=buckets)
+
+    def add_collector(self, fn: Callable[[], Iterable[str]]):
+        self._collectors.append(fn)
+
+    def remove_collector(self, fn: Callable[[], Iterable[str]]):
+        if fn in self._collectors:
+            self._collectors.remove(fn)
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for m in metrics:
+            lines.extend(m.render())
+        for fn in self._collectors:
+            try:
+                lines.extend(fn())
+            except Exception as e:
+                log.warning("[METRICS] collector failed: %s", e)
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+def metric_family(name: str, kind: str, help: str, samples: Iterable[tuple[dict, float]]) -> Iterable[str]:
+    """Zeilen für einen Collector: samples = [(labels, wert), ...]."""
+    yield f"# HELP {name} {help}"
+    yield f"# TYPE {name} {kind}"
+    for labels, v in samples:
+        yield f"{name}{_labels(tuple(labels), tuple(labels.values()))} {v}"
+
+def http_histograms(clients) -> Iterable[str]:
+    """LatencyHistogram-Snapshots der HTTP-Clients (ari_http) als Prometheus-Histogramm."""
+    name = "freya_http_request_duration_ms"
+    yield f"# HELP {name} HTTP-Latenz pro Endpoint (ARI, Webhook)"
+    yield f"# TYPE {name} histogram"
+    for c in clients:
+        for ep, snap in c.snapshot().items():
+            for le, n in snap["buckets"].items():
+                yield f'{name}_bucket{{endpoint="{ep}",le="{le}"}} {n}'
+            yield f'{name}_sum{{endpoint="{ep}"}} {snap["sum_ms"]}'
+            yield f'{name}_count{{endpoint="{ep}"}} {snap["count"]}'
+    yield "# HELP freya_http_errors_total HTTP-Fehler (Exception oder 5xx) pro Endpoint"
+    yield "# TYPE freya_http_errors_total counter"
+    for c in clients:
+        for ep, snap in c.snapshot().items():
+            yield f'freya_http_errors_total{{endpoint="{ep}"}} {snap["errors"]}'
+
+
+# ---------- Per-Turn-Spans ----------
+TURN_STAGE = REGISTRY.histogram("freya_turn_stage_seconds",
+                                "Dauer der Abschnitte eines Turns", ("stage",))
+TURN_TOTAL = REGISTRY.histogram("freya_turn_seconds",
+                                "Turn-Ende (nach dem Stille-Fenster) bis erstes RTP-Paket der Antwort")
+TURNS = REGISTRY.counter("freya_turns_total", "Turns nach Ergebnis", ("result",))
+turn_log = logging.getLogger("freya.turn")
+
+
+class TurnTrace:
+    """
+    Zeitachse eines Turns ab Segment-Ende (monotonic). Stufen melden Warte- und
+    Laufzeit (span), die Ausgabe den Zeitpunkt des ersten RTP-Pakets (first_rtp).
+    Ausgegeben wird einmal, wenn der Turn fertig ist (finish) und – falls eine
+    Ausgabe läuft – das erste Paket gesendet wurde, egal in welcher Reihenfolge:
+    eine strukturierte Log-Zeile (logfmt) plus Histogramme.
+    """
+    __slots__ = ("call_id", "turn", "t0", "spans", "result", "_t_first",
+                 "_first_seen", "_closed", "_done", "_lock")
+
+    def __init__(self, call_id: str, turn: int, eos_s: float = 0.0, t0: float | None = None):
+        self.call_id = call_id
+        self.turn = turn
+        self.t0 = time.monotonic() if t0 is None else t0
+        self.spans: list[tuple[str, float]] = [("eos", eos_s)] if eos_s else []
+        self.result = "ok"
+        self._t_first = None
+        self._first_seen = False
+        self._closed = False
+        self._done = False
+        self._lock = threading.Lock()   # first_rtp kommt aus dem Playout-Thread
+
+    def span(self, name: str, seconds: float):
+        self.spans.append((name, seconds))
+
+    def first_rtp(self, t: float | None, played: bool):
+        """Callback für PlayoutStream.on_first_packet."""
+        with self._lock:
+            self._t_first = t if played else None
+            self._first_seen = True
+            ready = self._closed
+        if ready:
+            self._emit()
+
+    def finish(self, result: str = "ok", wait_playout: bool = False):
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            self.result = result
+            ready = not wait_playout or self._first_seen
+        if ready:
+            self._emit()
+
+    def _emit(self):
+        with self._lock:
+            if self._done:
+                return
+            self._done = True
+        t_first = self._t_first
+        result = self.result if t_first is not None or self.result != "ok" else "not_played"
+        total = (t_first if t_first is not None else time.monotonic()) - self.t0
+        TURNS.inc(result=result)
+        for name, s in self.spans:
+            TURN_STAGE.observe(s, stage=name)
+        if t_first is not None:
+            TURN_TOTAL.observe(total)
+        if turn_log.isEnabledFor(logging.INFO):
+            parts = " ".join(f"{n}_ms={s * 1000:.0f}" for n, s in self.spans)
+            turn_log.info("turn call=%s n=%d result=%s %s %s_ms=%.0f", self.call_id, self.turn, result,
+                          parts, "first_rtp" if t_first is not None else "total", total * 1000)
+
+
+# ---------- HTTP-Endpoint ----------
+class _Handler(BaseHTTPRequestHandler):
+    routes: dict[str, Callable[[], tuple[int, str, str]]] = {}
+
+    def do_GET(self):
+        fn = self.routes.get(self.path.split("?", 1)[0])
+        if fn is None:
+            self.send_error(404)
+            return
+        code, ctype, body = fn()
+        data = body.encode()
+        self.send_response(code)
+        self.send_header("Content-Type", ctype)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
+
+
+PROM_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+def serve(port: int, host: str = "0.0.0.0", routes: dict | None = None) -> ThreadingHTTPServer:
+    """
+    Kleiner HTTP-Server im Hintergrund-Thread (nur stdlib): /metrics und
+    optionale weitere Routen {pfad: fn() -> (status, content_type, body)}.
+    """
+    handler = type("MetricsHandler", (_Handler,), {"routes": {
+        "/metrics": lambda: (200, PROM_CONTENT_TYPE, REGISTRY.render()),
+        **(routes or {}),
+    }})
+    srv = ThreadingHTTPServer((host, int(port)), handler)
+    srv.daemon_threads = True
+    threading.Thread(target=srv.serve_forever, name="metrics-http", daemon=True).start()
+    log.info("[METRICS] listening on %s:%s", host, port)
+    return srv
@@ -0,0 +1,172 @@
+# -*- coding: utf-8 -*-
+import asyncio, itertools, time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable
+
+from ari_metrics import REGISTRY
+
+STAGE_WAIT = REGISTRY.histogram("freya_stage_wait_seconds",
+                                "Wartezeit vor einer Stufe (Reihenfolge pro Call + freier Slot)", ("stage",))
+STAGE_RUN = REGISTRY.histogram("freya_stage_seconds", "Laufzeit einer Stufe", ("stage",))
+STAGE_TIMEOUTS = REGISTRY.counter("freya_stage_timeouts_total", "Timeouts pro Stufe", ("stage",))
+
+
+class StageTimeout(Exception):
+    pass
+
+
+class Stage:
+    """
+    Eine Pipeline-Stufe (z.B. STT, Webhook, TTS) mit eigenem Thread-Pool,
+    eigener Nebenläufigkeitsgrenze und Timeout pro Job.
+    Coroutine-Funktionen werden direkt im Loop awaited (kein Thread).
+    Hinweis: bei Timeout läuft der blockierende Aufruf im Thread noch zu Ende,
+    sein Ergebnis wird aber verworfen.
+    Warte- und Laufzeit gehen in die Stufen-Histogramme und, falls übergeben,
+    in den TurnTrace (Spans "<name>_wait" und "<name>").
+    """
+    def __init__(self, name: str, concurrency: int = 4, timeout_s: float = 15.0):
+        self.name = name
+        self.concurrency = max(1, int(concurrency))
+        self.timeout_s = float(timeout_s)
+        self._pool = ThreadPoolExecutor(max_workers=self.concurrency,
+                                        thread_name_prefix=f"stage-{name}")
+        self._sem = asyncio.Semaphore(self.concurrency)
+        self.inflight = 0
+        self.waiting = 0
+
+    async def run(self, fn: Callable, *args, trace=None, queued_at: float | None = None,
+                  timeout_s: float | None = None):
+        t_q = queued_at or time.monotonic()
+        timeout_s = timeout_s or self.timeout_s
+        self.waiting += 1
+        try:
+            await self._sem.acquire()
+        finally:
+            self.waiting -= 1
+        self.inflight += 1
+        t_run = time.monotonic()
+        try:
+            aw = fn(*args) if asyncio.iscoroutinefunction(fn) else self.offload(fn, *args)
+            return await asyncio.wait_for(aw, timeout_s)
+        except asyncio.TimeoutError:
+            STAGE_TIMEOUTS.inc(stage=self.name)
+            raise StageTimeout(f"{self.name} timed out after {timeout_s:.1f}s")
+        finally:
+            self.inflight -= 1
+            self._sem.release()
+            wait, run = t_run - t_q, time.monotonic() - t_run
+            STAGE_WAIT.observe(wait, stage=self.name)
+            STAGE_RUN.observe(run, stage=self.name)
+            if trace is not None:
+                trace.span(f"{self.name}_wait", wait)
+                trace.span(self.name, run)
+
+
+    def offload(self, fn: Callable, *args) -> asyncio.Future:
+        """Blockierenden Aufruf im Pool dieser Stufe ausführen (ohne Slot/Timeout)."""
+        return asyncio.get_running_loop().run_in_executor(self._pool, fn, *args)
+
+
+class Lane:
+    """
+    Reihenfolge-Garantie pro Call: ein Turn betritt Stufe i erst, wenn der
+    vorherige Turn desselben Calls Stufe i verlassen hat. Verschiedene Calls
+    (und verschiedene Stufen desselben Calls) laufen parallel.
+    """
+    def __init__(self, n_stages: int):
+        self._tails: list[asyncio.Future | None] = [None] * n_stages
+
+    async def run(self, i: int, stage: Stage, fn: Callable, *args, trace=None,
+                  timeout_s: float | None = None):
+        t_q = time.monotonic()
+        prev = self._tails[i]
+        mine = asyncio.get_running_loop().create_future()
+        self._tails[i] = mine
+        try:
+            if prev is not None and not prev.done():
+                # shield: wird dieser Turn abgebrochen, bleibt der Vorgänger unberührt
+                await asyncio.shield(prev)
+            return await stage.run(fn, *args, trace=trace, queued_at=t_q, timeout_s=timeout_s)
+        finally:
+            if prev is not None and not prev.done():
+                # abgebrochen, solange der Vorgänger noch läuft: Nachfolger erst nach ihm freigeben
+                prev.add_done_callback(lambda _: mine.done() or mine.set_result(None))
+            elif not mine.done():
+                mine.set_result(None)
+
+
+class Budget:
+    """
+    Globale Obergrenze gleichzeitiger Turns über alle Calls: ein Turn hält einen
+    Platz von STT bis TTS. Wer keinen Platz bekommt, wartet (FIFO) höchstens
+    max_wait_s (bzw. die kürzere übergebene Frist) und wird sonst verworfen –
+    angenommene Calls warten so nie länger als max_wait_s auf einen Platz.
+    overloaded() schaut nach vorn statt auf vergangene Wartezeiten: es warten
+    schon max_waiting Turns, der älteste wartet länger als die halbe Frist, oder
+    ein neuer Turn müsste voraussichtlich länger als ein Viertel der Frist
+    warten ((inflight + waiting + 1 - limit) Turns vor ihm, je mittlere
+    Haltedauer / limit) – dann nimmt die App keine neuen Calls mehr an. Die
+    Last neuer Calls kommt erst Sekunden später an, daher der Abstand.
+    limit 0 = kein Budget (acquire gelingt immer).
+    """
+    def __init__(self, limit: int = 0, max_waiting: int = 4, max_wait_s: float = 0.5):
+        self.limit = max(0, int(limit))
+        self.max_waiting = max(1, int(max_waiting))
+        self.max_wait_s = float(max_wait_s)
+        self._sem = asyncio.Semaphore(self.limit) if self.limit else None
+        self.inflight = 0
+        self.waiting = 0
+        self.hold_avg_s = 0.0                 # EWMA der Haltedauer eines Platzes
+        self._queued: dict[int, float] = {}   # wartende Turns -> Beginn (Einfügereihenfolge = FIFO)
+        self._held: deque[float] = deque()    # Zeitpunkte der belegten Plätze
+        self._ids = itertools.count()
+
+    async def acquire(self, timeout_s: float | None = None) -> bool:
+        if self._sem is not None:
+            timeout_s = self.max_wait_s if timeout_s is None else min(timeout_s, self.max_wait_s)
+            key = next(self._ids)
+            self._queued[key] = time.monotonic()
+            self.waiting += 1
+            try:
+                await asyncio.wait_for(self._sem.acquire(), timeout_s)
+            except asyncio.TimeoutError:
+                return False
+            finally:
+                self.waiting -= 1
+                del self._queued[key]
+            self._held.append(time.monotonic())
+        self.inflight += 1
+        return True
+
+    def release(self):
+        self.inflight -= 1
+        if self._sem is not None:
+            # FIFO-Zuordnung: einzelne Haltedauern stimmen nicht, ihre Summe schon
+            held = time.monotonic() - self._held.popleft()
+            self.hold_avg_s += 0.2 * (held - self.hold_avg_s)
+            self._sem.release()
+
+    def oldest_wait_s(self) -> float:
+        return time.monotonic() - next(iter(self._queued.values())) if self._queued else 0.0
+
+    def projected_wait_s(self) -> float:
+        """Voraussichtliche Wartezeit eines jetzt hinzukommenden Turns."""
+        if self._sem is None:
+            return 0.0
+        ahead = self.inflight + self.waiting + 1 - self.limit
+        return ahead * self.hold_avg_s / self.limit if ahead > 0 else 0.0
+
+    def overloaded(self) -> bool:
+        if self._sem is None:
+            return False
+        return (self.waiting >= self.max_waiting or self.oldest_wait_s() > self.max_wait_s / 2
+                or self.projected_wait_s() > self.max_wait_s / 4)
+
+
+def stage_from_cfg(name: str, c: dict, concurrency: int, timeout_s: float) -> Stage:
+    c = c or {}
+    return Stage(name,
+                 concurrency=int(c.get("concurrency", concurrency)),
+                 timeout_s=float(c.get("timeout_s", timeout_s)))
@@ -0,0 +1,235 @@
+# -*- coding: utf-8 -*-
+import heapq, itertools, logging, socket, struct, threading, time
+
+log = logging.getLogger(__name__)
+
+FRAME_BYTES = 160      # 20 ms @8k μ-law
+FRAME_S     = 0.020
+TS_INC      = 160      # RTP-Timestamp-Schritt pro Paket
+RTP_PT      = 0        # PCMU
+LATE_MS     = 5.0      # ab hier zählt ein Paket als "spät"
+RESYNC_S    = 0.060    # weiter hinten? -> Takt neu aufsetzen statt Burst
+
+
+class PlayoutStream:
+    """
+    Ein ausgehender RTP-Stream (eine Äußerung oder mehrere aneinandergehängte).
+    Audio kommt per feed() (μ-law, beliebige Stückelung), close() markiert das
+    Ende. Abbruch über cancel() oder das übergebene stop_event (Barge-in/Hangup).
+    on_first_packet(t, played) wird einmal aufgerufen (Scheduler-Thread): mit dem
+    Sendezeitpunkt des ersten Pakets, oder played=False, wenn nichts gesendet wurde.
+    tap(frame) bekommt jedes gesendete 20ms-Paket (μ-law), z.B. fürs Journal.
+    """
+    def __init__(self, sched: "PlayoutScheduler", sock: socket.socket, dst: tuple,
+                 rtp_state: dict, stop_event=None):
+        self._sched = sched
+        self.sock = sock
+        self.dst = dst
+        self.state = rtp_state
+        self.stop_event = stop_event
+        self._buf = bytearray()
+        self._pos = 0
+        self._lock = threading.Lock()
+        self._eof = False
+        self._cancelled = False
+        self._waiting = True      # nicht im Scheduler-Heap, wartet auf Daten
+        self._talkspurt = True    # nächstes Paket beginnt einen Talkspurt (Anfang/nach Unterlauf)
+        self.packets = 0
+        self.done = threading.Event()
+        self.on_first_packet = None
+        self.tap = None
+
+    def feed(self, ulaw: bytes):
+        with self._lock:
+            if self._eof or self._cancelled:
+                return
+            self._buf.extend(ulaw)
+            wake = self._waiting and len(self._buf) - self._pos >= FRAME_BYTES
+            if wake:
+                self._waiting = False
+        if wake:
+            self._sched._schedule(self, time.monotonic())
+
+    def close(self):
+        with self._lock:
+            self._eof = True
+            wake = self._waiting
+            self._waiting = False
+        if wake:
+            self._sched._schedule(self, time.monotonic())
+
+    def cancel(self):
+        self._cancelled = True
+        self.close()
+
+    def cancelled(self) -> bool:
+        return self._cancelled or bool(self.stop_event and self.stop_event.is_set())
+
+    def wait(self, timeout: float | None = None) -> bool:
+        return self.done.wait(timeout)
+
+    def _take(self) -> bytes | None:
+        """Nächstes volles 20ms-Paket; None = gerade nichts da (waiting oder Ende)."""
+        with self._lock:
+            if len(self._buf) - self._pos >= FRAME_BYTES:
+                frame = bytes(self._buf[self._pos:self._pos + FRAME_BYTES])
+                self._pos += FRAME_BYTES
+                if self._pos > 64 * FRAME_BYTES:
+                    del self._buf[:self._pos]
+                    self._pos = 0
+                return frame
+            if not self._eof:
+                self._waiting = True
+            return None
+
+    @property
+    def finished(self) -> bool:
+        return self._eof and len(self._buf) - self._pos < FRAME_BYTES
+
+
+class PlayoutScheduler:
+    """
+    Ein Thread für alle ausgehenden RTP-Streams: jedes Paket wird auf einer
+    absoluten monotonic()-Deadline gesendet (kein sleep(0.02)-Drift), Abbruch
+    wird pro Paket geprüft. Zählt späte Pakete und Jitter der Sendezeitpunkte.
+    """
+    def __init__(self):
+        self._heap: list = []
+        self._cv = threading.Condition()
+        self._seq = itertools.count()
+        self._thread = None
+        self._active = set()
+        # Statistik
+        self.sent = 0
+        self.late = 0
+        self.max_late_ms = 0.0
+        self.jitter_ms = 0.0
+        self._prev_late_ms = 0.0
+
+    def start(self):
+        with self._cv:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="rtp-playout", daemon=True)
+                self._thread.start()
+        return self
+
+    def open(self, sock: socket.socket, dst: tuple, rtp_state: dict, stop_event=None) -> PlayoutStream:
+        st = PlayoutStream(self, sock, dst, rtp_state, stop_event)
+        with self._cv:
+            self._active.add(st)
+        return st
+
+    def stats(self) -> dict:
+        return {
+            "streams": len(self._active),
+            "sent": self.sent,
+            "late": self.late,
+            "max_late_ms": round(self.max_late_ms, 2),
+            "jitter_ms": round(self.jitter_ms, 3),
+        }
+
+    def _schedule(self, st: PlayoutStream, deadline: float):
+        with self._cv:
+            heapq.heappush(self._heap, (deadline, next(self._seq), st))
+            self._cv.notify()
+
+    def _finish(self, st: PlayoutStream):
+        with self._cv:
+            self._active.discard(st)
+        if st.packets == 0:
+            self._first(st, None, False)
+        st.done.set()
+
+    @staticmethod
+    def _first(st: PlayoutStream, t, played: bool):
+        cb, st.on_first_packet = st.on_first_packet, None
+        if cb is not None:
+            try:
+                cb(t, played)
+            except Exception as e:
+                log.warning("[PLAYOUT] first-packet callback error: %s", e)
+
+    def _run(self):
+        while True:
+            with self._cv:
+                while not self._heap:
+                    self._cv.wait()
+                deadline, _, st = self._heap[0]
+                delay = deadline - time.monotonic()
+                if delay > 0:
+                    # neu eingeplante Streams wecken uns ggf. früher
+                    self._cv.wait(delay)
+                    continue
+                heapq.heappop(self._heap)
+            try:
+                self._tick(st, deadline)
+            except Exception as e:
+                log.warning("[PLAYOUT] error: %s", e)
+                self._finish(st)
+
+    def _tick(self, st: PlayoutStream, deadline: float):
+        if st.cancelled():
+            log.info("[TTS] stopped early after %d packets", st.packets)
+            self._finish(st)
+            return
+        frame = st._take()
+        if frame is None:
+            if st.finished:
+                self._finish(st)
+            else:
+                st._talkspurt = True
+            return   # Unterlauf: feed() plant den Stream wieder ein
+
+        state = st.state
+        marker = 0x00
+        if st._talkspurt:
+            # Neuer Talkspurt: Timestamp um die Pause seit dem letzten Paket
+            # (gleicher RTP-Zustand) weiterzählen, Marker setzen (RFC 3551)
+            last = state.get("t_last")
+            if last is not None:
+                gap = round((deadline - last) / FRAME_S) - 1
+                if gap > 0:
+                    state["ts"] = (state["ts"] + gap * TS_INC) & 0xFFFFFFFF
+            marker = 0x80
+            st._talkspurt = False
+        hdr = struct.pack("!BBHII", 0x80, marker | RTP_PT, state["seq"] & 0xFFFF,
+                          state["ts"] & 0xFFFFFFFF, state["ssrc"] & 0xFFFFFFFF)
+        try:
+            st.sock.sendto(hdr + frame, st.dst)
+        except Exception as e:
+            log.warning("[TTS] send error: %s", e)
+            self._finish(st)
+            return
+        now = time.monotonic()
+        if st.tap is not None:
+            st.tap(frame)
+        state["seq"] = (state["seq"] + 1) & 0xFFFF
+        state["ts"]  = (state["ts"] + TS_INC) & 0xFFFFFFFF
+        state["t_last"] = deadline
+        st.packets += 1
+        if st.packets == 1:
+            self._first(st, now, True)
+
+        late_ms = (now - deadline) * 1000.0
+        self.sent += 1
+        if late_ms > LATE_MS:
+            self.late += 1
+        self.max_late_ms = max(self.max_late_ms, late_ms)
+        self.jitter_ms += (abs(late_ms - self._prev_late_ms) - self.jitter_ms) / 16.0
+        self._prev_late_ms = late_ms
+
+        nxt = deadline + FRAME_S
+        if now - nxt > RESYNC_S:
+            nxt = now
+        self._schedule(st, nxt)
+
+
+_scheduler: PlayoutScheduler | None = None
+_scheduler_lock = threading.Lock()
+
+def get_scheduler() -> PlayoutScheduler:
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = PlayoutScheduler().start()
+        return _scheduler
@@ -0,0 +1,187 @@
+# -*- coding: utf-8 -*-
+import struct
+from dataclasses import dataclass
+
+_HDR = struct.Struct("!BBHII")
+ULAW_SILENCE = 0xFF
+
+
+@dataclass(frozen=True, slots=True)
+class RtpPacket:
+    seq: int
+    ts: int
+    ssrc: int
+    pt: int
+    marker: bool
+    payload: bytes
+
+
+def parse_rtp(pkt) -> RtpPacket | None:
+    """
+    RTP-Header nach RFC 3550 parsen (CSRC-Liste, Header-Extension, Padding).
+    Gibt None für alles zurück, was kein gültiges RTP v2 ist.
+    'pkt' darf ein memoryview sein; payload ist dann ebenfalls ein View.
+    """
+    n = len(pkt)
+    if n < 12:
+        return None
+    b0, b1, seq, ts, ssrc = _HDR.unpack_from(pkt, 0)
+    if b0 >> 6 != 2:
+        return None
+    off = 12 + 4 * (b0 & 0x0F)              # CSRC count
+    if b0 & 0x10:                           # Extension
+        if n < off + 4:
+            return None
+        ext_words = struct.unpack_from("!H", pkt, off + 2)[0]
+        off += 4 + 4 * ext_words
+    end = n
+    if b0 & 0x20:                           # Padding (letztes Byte = Anzahl)
+        end -= pkt[-1]
+    if end < off:
+        return None
+    return RtpPacket(seq, ts, ssrc, b1 & 0x7F, bool(b1 & 0x80), pkt[off:end])
+
+
+class RtpStats:
+    """Zähler pro Empfangs-Stream."""
+    __slots__ = ("received", "duplicates", "late", "lost", "reordered",
+                 "foreign", "bad", "jitter_ms", "depth")
+
+    def __init__(self):
+        self.received = 0      # angenommene Pakete
+        self.duplicates = 0
+        self.late = 0          # kam nach der Ausgabe/Verdeckung seiner Position
+        self.lost = 0          # durch Stille verdeckt
+        self.reordered = 0
+        self.foreign = 0       # falsche SSRC/Quelle/PT
+        self.bad = 0           # kein gültiges RTP
+        self.jitter_ms = 0.0   # Interarrival-Jitter (RFC 3550)
+        self.depth = 0         # aktuelle Ziel-Tiefe des Jitter-Buffers (Frames)
+
+    def as_dict(self) -> dict:
+        d = {k: getattr(self, k) for k in self.__slots__}
+        d["jitter_ms"] = round(self.jitter_ms, 2)
+        return d
+
+
+class JitterBuffer:
+    """
+    Kleiner adaptiver Jitter-Buffer für 8k-PCMU:
+    - sortiert nach Sequenznummer, verwirft Duplikate und zu späte Pakete
+    - lückenlose Pakete gehen ohne Verzögerung (und ohne Kopie) raus; nur
+      gepufferte Payloads werden kopiert, da der Empfangspuffer wiederverwendet wird
+    - fehlt ein Paket, wird höchstens 'depth' Frames gewartet, dann wird die
+      Lücke mit Stille gefüllt (damit die Segment-Zeitbasis stimmt); kommt
+      kein weiteres Paket (Verlust am Ende eines Talkspurts, Stream steht),
+      gibt poll() das Gepufferte nach derselben Wartezeit aus
+    - 'depth' folgt dem gemessenen Jitter zwischen min_frames und max_frames
+    """
+    CLOCK = 8000
+
+    def __init__(self, stats: RtpStats | None = None, min_frames: int = 2,
+                 max_frames: int = 10, max_gap: int = 50):
+        self.stats = stats or RtpStats()
+        self.min_frames = min_frames
+        self.max_frames = max_frames
+        self.max_gap = max_gap
+        self._next: int | None = None
+        self._pending: dict[int, bytes] = {}
+        self._highest = 0
+        self._frame_len = 160
+        self._transit = None
+        self._jitter = 0.0   # in Timestamp-Einheiten
+        self._last_arrival = 0.0
+        self.stats.depth = min_frames
+
+    def reset(self):
+        self._next = None
+        self._pending.clear()
+        self._transit = None
+
+    def push(self, p: RtpPacket, arrival_s: float) -> list[bytes]:
+        st = self.stats
+        self._update_jitter(p.ts, arrival_s)
+        self._last_arrival = arrival_s
+
+        if self._next is None:
+            self._next = p.seq
+            self._highest = p.seq
+        d = ((p.seq - self._next + 0x8000) & 0xFFFF) - 0x8000
+        if d < 0:
+            st.late += 1
+            return []
+        if d > self.max_gap:
+            # großer Sprung (Quelle neu gestartet o.ä.): alles raus, neu synchronisieren
+            out = self._flush()
+            self._next = p.seq
+            self._highest = p.seq
+            d = 0
+        else:
+            out = []
+        if p.seq in self._pending:
+            st.duplicates += 1
+            return out
+        if ((p.seq - self._highest) & 0xFFFF) >= 0x8000:
+            st.reordered += 1
+        else:
+            self._highest = p.seq
+        if p.payload:
+            self._frame_len = len(p.payload)
+        st.received += 1
+        if d == 0 and not self._pending:
+            out.append(p.payload)   # Normalfall: in Reihenfolge, nichts offen
+            self._next = (self._next + 1) & 0xFFFF
+            return out
+        self._pending[p.seq] = bytes(p.payload)
+
+        self._release(out)
+        return out
+
+    def poll(self, now_s: float) -> list[bytes]:
+        """
+        Ohne neues Paket aufrufen (Empfangs-Timeout): liegt das letzte Paket
+        länger als 'depth' Frames zurück, alles Gepufferte ausgeben, fehlende
+        Positionen bis zum höchsten Paket als Stille.
+        """
+        if not self._pending or now_s - self._last_arrival < self.stats.depth * self._frame_len / self.CLOCK:
+            return []
+        out = []
+        while self._pending:
+            frame = self._pending.pop(self._next, None)
+            if frame is None:
+                frame = bytes([ULAW_SILENCE]) * self._frame_len
+                self.stats.lost += 1
+            out.append(frame)
+            self._next = (self._next + 1) & 0xFFFF
+        return out
+
+    def _release(self, out: list):
+        depth = self.stats.depth
+        while self._pending:
+            if self._next in self._pending:
+                out.append(self._pending.pop(self._next))
+            else:
+                span = ((self._highest - self._next) & 0xFFFF) + 1
+                if span <= depth:
+                    break
+                out.append(bytes([ULAW_SILENCE]) * self._frame_len)
+                self.stats.lost += 1
+            self._next = (self._next + 1) & 0xFFFF
+
+    def _flush(self) -> list[bytes]:
+        out = [self._pending[s] for s in sorted(
+            self._pending, key=lambda s: (s - self._next) & 0xFFFF)]
+        self._pending.clear()
+        return out
+
+    def _update_jitter(self, ts: int, arrival_s: float):
+        transit = arrival_s * self.CLOCK - ts
+        if self._transit is not None:
+            dd = abs(transit - self._transit)
+            if dd < self.CLOCK:   # Timestamp-Sprünge (neuer Talkspurt) ignorieren
+                self._jitter += (dd - self._jitter) / 16.0
+        self._transit = transit
+        jitter_ms = self._jitter * 1000.0 / self.CLOCK
+        self.stats.jitter_ms = jitter_ms
+        want = self.min_frames + int(2 * jitter_ms / 20.0)
+        self.stats.depth = max(self.min_frames, min(self.max_frames, want))
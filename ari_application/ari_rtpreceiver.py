@@ -1,19 +1,126 @@
-import socket, threading, audioop
+import socket, threading, audioop, logging, time
+from ari_rtp import parse_rtp, JitterBuffer, RtpStats
+
+log = logging.getLogger(__name__)
+
+try:
+    import numpy as np
+except ImportError:  # optional: nur für die Batch-Dekodierung per Lookup-Tabelle
+    np = None
+
+SSRC_SWITCH_PKTS = 3   # so viele Pakete in Folge von neuer SSRC -> Quelle wechseln
+RX_TIMEOUT_S = 0.04    # Empfangs-Timeout: Jitter-Buffer ohne neue Pakete leeren
+STALL_S = 0.3          # so lange kein Paket -> Stille nachliefern (Segmenter zählt Samples)
+
+_ULAW_LUT = np.frombuffer(audioop.ulaw2lin(bytes(range(256)), 2), dtype=np.int16) if np else None
+
+
+class UlawTo16k:
+    """
+    μ-law/8k -> PCM16/16k mit durchgehendem ratecv-Zustand (keine Filter-
+    Sprünge an Frame-Grenzen). Mehrere Frames können in einem Rutsch
+    konvertiert werden; mit NumPy wird per 256er-Lookup-Tabelle dekodiert,
+    sonst über audioop (ebenfalls tabellenbasiert in C).
+    Ausgabe in festen 20ms-Frames an sink(frame).
+    Mit rate=8000 wird nur dekodiert (kein Upsampling, Frames à 320 Bytes).
+    """
+    def __init__(self, sink, rate: int = 16000):
+        self.sink = sink
+        self.rate = rate
+        self._frame = rate * 2 // 50
+        self._state = None
+        self._carry = bytearray()
+
+    def feed(self, ulaw_frames: list):
+        if not ulaw_frames:
+            return
+        ulaw = ulaw_frames[0] if len(ulaw_frames) == 1 else b"".join(ulaw_frames)
+        if np is not None and len(ulaw_frames) > 1:
+            pcm8k = _ULAW_LUT[np.frombuffer(ulaw, dtype=np.uint8)].tobytes()
+        else:
+            pcm8k = audioop.ulaw2lin(ulaw, 2)
+        if self.rate == 8000:
+            pcm = pcm8k
+        else:
+            pcm, self._state = audioop.ratecv(pcm8k, 2, 1, 8000, self.rate, self._state)
+
+        # Normalfall: genau ein 20ms-Frame, kein Rest -> direkt durchreichen
+        frame = self._frame
+        if not self._carry and len(pcm) == frame:
+            self.sink(pcm)
+            return
+        self._carry.extend(pcm)
+        mv = memoryview(self._carry)
+        off = 0
+        while len(self._carry) - off >= frame:
+            self.sink(bytes(mv[off:off + frame]))
+            off += frame
+        mv.release()
+        del self._carry[:off]
 
 class RtpReceiver:
     """
-    Hört auf RTP (Payload-Type=0, μ-law/8kHz), wandelt nach PCM16@16k
-    und gibt Frames an einen Segmenter weiter (feed20ms).
+    Hört auf RTP (Payload-Type=0, μ-law/8kHz), wandelt nach PCM16 mit 'rate'
+    (16000, oder 8000 = Telefonband ohne Upsampling) und gibt 20ms-Frames an
+    einen Segmenter weiter (feed20ms).
+    Pakete laufen durch einen Jitter-Buffer (Reihenfolge, Duplikate, Lücken);
+    angenommen wird nur eine Quelle (Adresse + SSRC). Zähler in .stats.
+    Kommen keine Pakete, gibt der Empfangs-Timeout gepufferte Frames aus;
+    steht der Stream länger als STALL_S, wird Stille in Echtzeit nachgeliefert,
+    damit der Segmenter das Turn-Ende erkennt.
     """
-    def __init__(self, ip="127.0.0.1", port=12000, segmenter=None):
+    def __init__(self, ip="127.0.0.1", port=12000, segmenter=None, rate: int = 16000):
         self.ip = ip
         self.port = port
         self.segmenter = segmenter
+        self.rate = rate
         self._stop = False
         self._sock = None
         self._thread = None
+        self.stats = RtpStats()
+        self._jb = JitterBuffer(self.stats)
+        self._src = None          # erwartete Absenderadresse (ip, port)
+        self._ssrc = None
+        self._new_ssrc = None
+        self._new_ssrc_n = 0
+        self.on_first_packet = None   # optionaler Callback: Medien fließen (RTP-Thread)
+        self.on_ulaw = None           # optionaler Abgriff: geordnete μ-law-Payloads (Journal)
+
+    def expect_from(self, ip: str, port: int):
+        """Nur noch RTP von dieser Adresse annehmen (Asterisk UNICASTRTP_LOCAL_*)."""
+        self._src = (ip, int(port))
+
+    def _accept(self, addr, p) -> bool:
+        src = self._src
+        if src is None:
+            self._src = addr           # erste Quelle festhalten
+        elif addr[1] != src[1] or (src[0] not in ("0.0.0.0", "::") and addr[0] != src[0]):
+            return False
+        if p.pt != 0:
+            return False
+        if self._ssrc is None:
+            self._ssrc = p.ssrc
+        elif p.ssrc != self._ssrc:
+            # dauerhafter SSRC-Wechsel derselben Quelle (z.B. Re-Bridge) -> übernehmen
+            if p.ssrc == self._new_ssrc:
+                self._new_ssrc_n += 1
+            else:
+                self._new_ssrc, self._new_ssrc_n = p.ssrc, 1
+            if self._new_ssrc_n < SSRC_SWITCH_PKTS:
+                return False
+            self._ssrc = p.ssrc
+            self._jb.reset()
+        self._new_ssrc = None
+        return True
 
     def start(self):
+        # Socket direkt binden, damit Fehler (Port belegt) beim Aufrufer landen
+        # und _sock sofort fürs Senden (TTS) verfügbar ist.
+        s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        s.bind((self.ip, self.port))
+        s.settimeout(RX_TIMEOUT_S)  # auch damit stop() den Thread zuverlässig beendet
+        self._sock = s
         self._stop = False
         self._thread = threading.Thread(target=self._loop, daemon=True)
         self._thread.start()
@@ -30,26 +137,59 @@ class RtpReceiver:
         self._thread = None
 
     def _loop(self):
-        s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-        s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-        s.bind((self.ip, self.port))
-        self._sock = s
-        buf8k = bytearray()
-        print(f"[RTP-IN] listening {self.ip}:{self.port} (PT=0 μ-law)")
+        s = self._sock
+        # ein Empfangspuffer für alle Pakete: recvfrom_into + memoryview, keine Kopie pro Paket
+        rxbuf = bytearray(2048)
+        rxview = memoryview(rxbuf)
+        conv = UlawTo16k(self._on_frame, self.rate)
+        log.info("[RTP-IN] listening %s:%s (PT=0 μ-law, %d Hz)", self.ip, self.port, self.rate)
+        t_out = None   # bis hierhin ist Audio ausgegeben (Echtzeit), None = noch kein Paket
+        fill_after = STALL_S
 
         while not self._stop:
             try:
-                pkt, _ = s.recvfrom(2048)
+                n, addr = s.recvfrom_into(rxbuf)
+            except socket.timeout:
+                if t_out is None:
+                    continue
+                now = time.monotonic()
+                frames = self._jb.poll(now)
+                if frames:
+                    t_out = now
+                elif now - t_out > fill_after:
+                    # Stream steht: Stille für die verstrichene Zeit, danach neu synchronisieren
+                    n_fill = int((now - t_out) / 0.020)
+                    frames = [b"\xff" * 160] * n_fill
+                    t_out += n_fill * 0.020
+                    fill_after = 0.020   # solange der Stream steht, laufend weiter
+                    self._jb.reset()
+                if frames:
+                    if self.on_ulaw is not None:
+                        self.on_ulaw(frames)
+                    conv.feed(frames)
+                continue
             except OSError:
                 break
-            if len(pkt) < 12:
+            p = parse_rtp(rxview[:n])
+            if p is None:
+                self.stats.bad += 1
                 continue
-            ulaw = pkt[12:]  # RTP Header 12 Bytes
-            pcm16_8k = audioop.ulaw2lin(ulaw, 2)
-            buf8k.extend(pcm16_8k)
-            while len(buf8k) >= 320:  # 20ms @ 8kHz, 16bit = 320 Bytes
-                frame8k = bytes(buf8k[:320])
-                del buf8k[:320]
-                frame16k, _ = audioop.ratecv(frame8k, 2, 1, 8000, 16000, None)
-                if self.segmenter:
-                    self.segmenter.feed20ms(frame16k)
\ No newline at end of file
+            if not self._accept(addr, p):
+                self.stats.foreign += 1
+                continue
+            if self.on_first_packet:
+                cb, self.on_first_packet = self.on_first_packet, None
+                try:
+                    cb()
+                except Exception as e:
+                    log.warning("[RTP-IN] first-packet callback error: %s", e)
+            # Payload-Views müssen vor dem nächsten recvfrom_into verarbeitet sein
+            t_out, fill_after = time.monotonic(), STALL_S
+            frames = self._jb.push(p, t_out)
+            if self.on_ulaw is not None and frames:
+                self.on_ulaw(frames)
+            conv.feed(frames)
+
+    def _on_frame(self, frame: bytes):
+        if self.segmenter:
+            self.segmenter.feed20ms(frame)
\ No newline at end of file
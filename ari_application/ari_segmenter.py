@@ -1,47 +1,177 @@
 # -*- coding: utf-8 -*-
-import time, audioop
+import audioop, logging
+from collections import deque
 from dataclasses import dataclass
 from typing import Callable
 
+log = logging.getLogger(__name__)
+
 @dataclass(frozen=True)
 class SegmenterConfig:
-    silence_ms: int = 500
-    rms_thresh: int = 400
+    silence_ms: int = 500       # Hangover: so lange Stille beendet einen Turn
+    rms_thresh: int = 400       # Mindest-Schwelle; die adaptive Schwelle liegt nie darunter
     min_bytes: int = 24000
+    preroll_ms: int = 200       # Audio vor dem Sprachbeginn, das beim Onset mitgeht
+    rate: int = 16000           # Samplerate der gefütterten PCM16-Frames
+    onset_ms: int = 60          # so lange über der Schwelle = Sprachbeginn
+    max_segment_ms: int = 15000 # spätestens hier wird ein Turn zwangsweise geteilt
+    noise_factor: float = 3.0   # Schwelle = max(rms_thresh, Rauschboden * noise_factor)
+    noise_alpha: float = 0.05   # Glättung des Rauschbodens (EMA pro Frame)
+    noise_window_ms: int = 3000 # Minimum der Frame-RMS über dieses Fenster: lauter werdendes Rauschen
+    noise_rise: float = 0.02    # Anstieg pro Frame Richtung dieses Minimums (auch in Sprache)
 
 class Segmenter:
     """
     Callback-basiertes Turn-Taking über RMS-Schwelle + Stille-Fenster.
     API bleibt identisch: feed20ms(frame16k_20ms) / feed16k(pcm16k).
+    Zeit wird in Samples gezählt (nicht per Uhr), dadurch ist das Ende eines
+    Turns unabhängig von Paket-Bursts und Thread-Scheduling. Die Schwelle folgt
+    einem adaptiven Rauschboden: unter der Schwelle als EMA, außerdem steigt er
+    langsam auf das Minimum der letzten noise_window_ms (Rauschen, das lauter
+    wird, hält den Turn sonst ewig offen). Segmente, die nur wegen eines so
+    überholten Bodens Sprache waren, werden verworfen statt ins STT zu gehen.
+    Onset braucht onset_ms Sprache, Offset silence_ms Stille (Hangover). Der Puffer ist begrenzt: außerhalb von
+    Sprache nur Preroll, in Sprache höchstens max_segment_ms.
+    Optional für Streaming-STT:
+      on_speech_start(preroll) – beim Sprachbeginn (inkl. preroll_ms davor)
+      on_frame(pcm)            – jeder weitere Frame bis zum Segment-Ende
+      on_discard()             – Sprache war zu kurz, es kommt kein Segment
     """
-    def __init__(self, on_segment: Callable[[bytes], None], cfg: SegmenterConfig | None = None):
+    def __init__(self, on_segment: Callable[[bytes], None], cfg: SegmenterConfig | None = None,
+                 on_speech_start: Callable[[bytes], None] | None = None,
+                 on_frame: Callable[[bytes], None] | None = None,
+                 on_discard: Callable[[], None] | None = None):
         self.on_segment = on_segment
+        self.on_speech_start = on_speech_start
+        self.on_frame = on_frame
+        self.on_discard = on_discard
         self.cfg = cfg or SegmenterConfig()
         self.buf = bytearray()
-        self._last = time.time()
-        self._silent_ms = 0
+        self._bpms = self.cfg.rate * 2 // 1000          # Bytes pro ms (PCM16 mono)
+        self._idle_keep = (self.cfg.preroll_ms + self.cfg.onset_ms) * self._bpms
+        self._max_bytes = self.cfg.max_segment_ms * self._bpms
+        self._speech_ms = 0.0      # zusammenhängende Sprache vor dem Onset
+        self._silent_ms = 0.0      # Stille seit der letzten Sprache (im Turn)
+        self._in_speech = False
+        self.noise_floor = float(self.cfg.rms_thresh) / self.cfg.noise_factor
+        # Fenster-Minimum in Blöcken zu 500 ms (Minimum pro Block, Blöcke im Ring)
+        self._blocks: deque = deque(maxlen=max(1, self.cfg.noise_window_ms // 500))
+        self._block_min = None
+        self._block_ms = 0.0
+        self._seg_rms = 0.0        # Summe Frame-RMS im laufenden Turn
+        self._seg_frames = 0
+        self._seg_thresh = 0.0     # Schwelle beim Sprachbeginn
+
+    @property
+    def in_speech(self) -> bool:
+        return self._in_speech
+
+    @property
+    def threshold(self) -> float:
+        return max(self.cfg.rms_thresh, self.noise_floor * self.cfg.noise_factor)
 
     def feed16k(self, pcm: bytes):
-        self.buf.extend(pcm)
         try:
             rms = audioop.rms(pcm, 2)
         except Exception:
             rms = 0
+        dt_ms = len(pcm) / self._bpms
+        speech = rms >= self.threshold
+        if not speech:
+            self.noise_floor += (rms - self.noise_floor) * self.cfg.noise_alpha
+        win_min = self._track_min(rms, dt_ms)
+        if win_min is not None and win_min > self.noise_floor:
+            self.noise_floor += (win_min - self.noise_floor) * self.cfg.noise_rise
+
+        self.buf.extend(pcm)
+
+        if not self._in_speech:
+            self._speech_ms = self._speech_ms + dt_ms if speech else 0.0
+            if self._speech_ms >= self.cfg.onset_ms:
+                self._in_speech = True
+                self._silent_ms = 0.0
+                self._seg_rms, self._seg_frames, self._seg_thresh = 0.0, 0, self.threshold
+                self._emit(self.on_speech_start, bytes(self.buf))
+            elif len(self.buf) > self._idle_keep:
+                del self.buf[:len(self.buf) - self._idle_keep]
+            return
 
-        now = time.time()
-        dt_ms = (now - self._last) * 1000.0
-        self._last = now
+        self._emit(self.on_frame, pcm)
+        self._silent_ms = 0.0 if speech else self._silent_ms + dt_ms
+        self._seg_rms += rms
+        self._seg_frames += 1
 
-        self._silent_ms = self._silent_ms + dt_ms if rms < self.cfg.rms_thresh else 0
+        if self._silent_ms >= self.cfg.silence_ms:
+            self._in_speech = False
+            self._speech_ms = 0.0
+            if len(self.buf) > self.cfg.min_bytes and not self._swamped():
+                self._flush()
+            else:
+                self.buf.clear()   # zu kurz (Knacksen, Husten) oder nur Rauschen -> verwerfen
+                self._emit(self.on_discard)
+        elif len(self.buf) >= self._max_bytes:
+            # Boden sofort neu schätzen: war die "Sprache" nur lauter gewordenes Rauschen?
+            if self._block_min is not None:
+                self.noise_floor = max(self.noise_floor, min([self._block_min, *self._blocks]))
+            if self._swamped():
+                self._in_speech = False
+                self._speech_ms = 0.0
+                self.buf.clear()
+                self._emit(self.on_discard)
+                return
+            # Anrufer macht keine Pause: Turn teilen, Sprache läuft weiter
+            self._flush()
+            self._seg_rms, self._seg_frames, self._seg_thresh = 0.0, 0, self.threshold
+            self._emit(self.on_speech_start, b"")
 
-        if self._silent_ms >= self.cfg.silence_ms and len(self.buf) > self.cfg.min_bytes:
-            seg = bytes(self.buf)
-            self.buf.clear()
-            self._silent_ms = 0
-            try:
-                self.on_segment(seg)
-            except Exception as e:
-                print("[SEG] callback error:", e)
+    def _track_min(self, rms: float, dt_ms: float) -> float | None:
+        """Minimum der Frame-RMS über noise_window_ms (None, solange das Fenster nicht voll ist)."""
+        self._block_min = rms if self._block_min is None else min(self._block_min, rms)
+        self._block_ms += dt_ms
+        if self._block_ms >= 500:
+            self._blocks.append(self._block_min)
+            self._block_min, self._block_ms = None, 0.0
+        if len(self._blocks) < self._blocks.maxlen:
+            return None
+        return min(self._blocks) if self._block_min is None else min(self._block_min, *self._blocks)
+
+    def _swamped(self) -> bool:
+        # Schwelle ist seit dem Sprachbeginn deutlich gestiegen und der Turn liegt
+        # im Mittel darunter: das war Rauschen, keine Sprache
+        if not self._seg_frames:
+            return False
+        mean = self._seg_rms / self._seg_frames
+        return self.threshold > 1.5 * self._seg_thresh and mean < self.threshold
+
+    def drop_before(self, keep_ms: int):
+        """
+        Verwirft gepuffertes Audio bis auf die letzten keep_ms (+ Preroll).
+        Läuft gerade ein Turn, wird der Sprachbeginn mit dem Rest neu gemeldet,
+        damit ein Streaming-STT nicht mit dem verworfenen Audio weiterarbeitet.
+        """
+        keep = (keep_ms + self.cfg.preroll_ms) * self._bpms
+        if len(self.buf) > keep:
+            del self.buf[:len(self.buf) - keep]
+        if self._in_speech:
+            self._silent_ms = 0.0
+            self._emit(self.on_speech_start, bytes(self.buf))
+
+    def _flush(self):
+        seg = bytes(self.buf)
+        self.buf.clear()
+        self._silent_ms = 0.0
+        try:
+            self.on_segment(seg)
+        except Exception as e:
+            log.warning("[SEG] callback error: %s", e)
+
+    def _emit(self, cb, *args):
+        if cb is None:
+            return
+        try:
+            cb(*args)
+        except Exception as e:
+            log.warning("[SEG] stream callback error: %s", e)
 
     def feed20ms(self, frame16k_20ms: bytes):
         self.feed16k(frame16k_20ms)
@@ -0,0 +1,106 @@
+# -*- coding: utf-8 -*-
+import asyncio, threading
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING
+
+from ari_segmenter import Segmenter
+from ari_rtpreceiver import RtpReceiver
+from ari_tts import new_rtp_state
+from ari_pipeline import Lane
+
+if TYPE_CHECKING:   # nur für Annotationen, ari_stt zieht Wyoming-ASR
+    from ari_stt import StreamingTranscriber
+    from ari_playout import PlayoutStream
+
+
+class RtpPortPool:
+    """
+    Vergibt lokale UDP-Ports für externalMedia aus einem festen Bereich.
+    Jeder Call bekommt einen eigenen Port (= eigener RtpReceiver).
+    """
+    def __init__(self, first: int, count: int):
+        self._free = list(range(first, first + count))
+        self._lock = threading.Lock()
+
+    def acquire(self) -> int | None:
+        with self._lock:
+            return self._free.pop(0) if self._free else None
+
+    def release(self, port: int | None):
+        if not port:
+            return
+        with self._lock:
+            if port not in self._free:
+                self._free.append(port)
+
+    def free_count(self) -> int:
+        with self._lock:
+            return len(self._free)
+
+
+@dataclass(eq=False)
+class CallSession:
+    """Kompletter Zustand eines Anrufs (vorher: Modul-Globals in ari_app)."""
+    caller_id: str
+    caller_number: str = ""
+    rtp_port: int = 0
+    bridge_id: str | None = None
+    ext_id: str | None = None
+    tts_dst_ip: str | None = None
+    tts_dst_port: int | None = None
+    alive: bool = False
+    segmenter: Segmenter | None = None
+    receiver: RtpReceiver | None = None
+    stt_stream: "StreamingTranscriber | None" = None
+    # wird im Event-Loop befüllt (RTP-Thread -> call_soon_threadsafe);
+    # Einträge: (pcm16, Streaming-STT-Future oder None, TurnTrace)
+    segment_queue: "asyncio.Queue[tuple]" = field(default_factory=asyncio.Queue)
+    turn_no: int = 0
+    worker: "asyncio.Task | None" = None
+    # STT -> Webhook -> TTS: Reihenfolge pro Call + laufende Turn-Tasks
+    lane: Lane = field(default_factory=lambda: Lane(3))
+    turns: set = field(default_factory=set)
+    closed: bool = False
+    tts_stop_event: threading.Event | None = None
+    tts_stream: "PlayoutStream | None" = None
+    tts_rtp_state: dict = field(default_factory=new_rtp_state)
+
+
+class SessionRegistry:
+    """Thread-sichere Ablage aller aktiven Calls, Schlüssel = Caller-Channel-ID."""
+    def __init__(self):
+        self._by_caller: dict[str, CallSession] = {}
+        self._lock = threading.Lock()
+
+    def add(self, s: CallSession):
+        with self._lock:
+            self._by_caller[s.caller_id] = s
+
+    def get(self, caller_id: str | None) -> CallSession | None:
+        if not caller_id:
+            return None
+        with self._lock:
+            return self._by_caller.get(caller_id)
+
+    def by_ext(self, ext_id: str | None) -> CallSession | None:
+        if not ext_id:
+            return None
+        with self._lock:
+            for s in self._by_caller.values():
+                if s.ext_id == ext_id:
+                    return s
+        return None
+
+    def pop(self, caller_id: str | None) -> CallSession | None:
+        if not caller_id:
+            return None
+        with self._lock:
+            return self._by_caller.pop(caller_id, None)
+
+    def all(self) -> list[CallSession]:
+        with self._lock:
+            return list(self._by_caller.values())
+
+    def __len__(self):
+        with self._lock:
+            return len(self._by_caller)
@@ -1,39 +1,121 @@
 import asyncio
-from wyoming.client import AsyncTcpClient
 from wyoming.audio import AudioStart, AudioChunk, AudioStop
 from wyoming.asr import Transcribe, Transcript  # ← wichtig
-from config import cfg
+import ari_aio
+from ari_wyoming import asr_pool, chunk_bytes, with_retry
 
-async def _transcribe_async(pcm16_16k: bytes, lang: str) -> str:
-    if not pcm16_16k:
+def _chunk_event(audio: bytes, rate: int = 16000):
+    return AudioChunk(rate=rate, width=2, channels=1, timestamp=None, audio=audio).event()
+
+async def _read_transcript(c) -> str:
+    # Antwort sauber parsen
+    while True:
+        ev = await c.read_event()
+        if not ev:
+            return ""
+        if ev.type == "transcript":
+            c.done = True
+            return Transcript.from_event(ev).text or ""
+
+async def _transcribe_async(pcm16: bytes, lang: str, rate: int = 16000) -> str:
+    if not pcm16:
         return ""
 
-    C = cfg()  # cached – billig
-    wyoming_host = C["wyoming"]["host"]
-    wyoming_port = int(C["wyoming"]["asr_de"])
+    step = chunk_bytes(rate)  # wyoming.chunk_ms (statt 20ms-Chunks)
 
-    async with AsyncTcpClient(wyoming_host, wyoming_port) as c:
+    async def request(c):
         # saubere Events senden
         await c.write_event(Transcribe(language=lang).event())
-        await c.write_event(AudioStart(rate=16000, width=2, channels=1).event())
+        await c.write_event(AudioStart(rate=rate, width=2, channels=1).event())
+        view = memoryview(pcm16)
+        for off in range(0, len(view), step):
+            await c.write_event(_chunk_event(view[off:off+step].tobytes(), rate))
+        await c.write_event(AudioStop().event())
+        return await _read_transcript(c)
 
-        step = 640  # 20ms @16kHz, 2 Bytes pro Sample, 1 Kanal
-        for off in range(0, len(pcm16_16k), step):
-            chunk = pcm16_16k[off:off+step]
-            await c.write_event(
-                AudioChunk(rate=16000, width=2, channels=1, timestamp=None, audio=chunk).event()
-            )
+    return await with_retry(asr_pool(), request)
 
-        await c.write_event(AudioStop().event())
+def transcribe_segment(pcm16: bytes, lang: str = "de", rate: int = 16000) -> str:
+    # Wrapper für Sync-Aufruf (gemeinsamer Hintergrund-Loop statt asyncio.run);
+    # Whisper bekommt die native Rate, der Server rechnet selbst um
+    return ari_aio.run(_transcribe_async(pcm16, lang, rate))
+
+def warm(connections: int = 1, lang: str = "de", rate: int = 16000):
+    """Start: Verbindungen öffnen, Wegwerf-Transkription (lädt das Modell im Server)."""
+    ari_aio.run(asr_pool().warm(connections))
+    transcribe_segment(b"\0\0" * (rate // 2), lang, rate)
+
+
+# ---------- Streaming: Audio schon während der Anrufer spricht senden ----------
+_ABORT = object()
+
+async def _stream_async(q: "asyncio.Queue", lang: str, rate: int = 16000) -> str:
+    step = chunk_bytes(rate)
+    # immer neu verbinden: das Audio ist nach dem Senden weg, eine vom Server
+    # geschlossene Pool-Verbindung ließe sich nicht wiederholen (Whisper schließt
+    # nach jedem Transcript); der Aufbau fällt in die Sprechzeit
+    async with asr_pool().connection(fresh=True) as c:
+        await c.write_event(Transcribe(language=lang).event())
+        await c.write_event(AudioStart(rate=rate, width=2, channels=1).event())
 
-        # Antwort sauber parsen
+        # 20ms-Frames zu chunk_ms-Events zusammenfassen
+        pending = bytearray()
         while True:
-            ev = await c.read_event()
-            if not ev:
+            chunk = await q.get()
+            if chunk is _ABORT:
                 return ""
-            if ev.type == "transcript":
-                return Transcript.from_event(ev).text or ""
+            if chunk is None:
+                break
+            pending.extend(chunk)
+            if len(pending) >= step:
+                await c.write_event(_chunk_event(bytes(pending), rate))
+                pending.clear()
+        if pending:
+            await c.write_event(_chunk_event(bytes(pending), rate))
+
+        await c.write_event(AudioStop().event())
+        return await _read_transcript(c)
+
+
+class StreamingTranscriber:
+    """
+    Eine eigene Wyoming-ASR-Verbindung pro Turn, die beim Sprachbeginn
+    AudioStart bekommt und danach die Frames direkt. Am Turn-Ende (finish)
+    wird nur noch AudioStop gesendet und auf das Transcript gewartet.
+    Alle Methoden sind thread-safe (Aufruf typischerweise aus dem RTP-Thread).
+    """
+    def __init__(self, loop: asyncio.AbstractEventLoop | None = None, lang: str = "de",
+                 rate: int = 16000):
+        self.loop = loop or ari_aio.get_loop()
+        self.lang = lang
+        self.rate = rate
+        self._q: "asyncio.Queue | None" = None
+        self._fut = None
+
+    def start(self, preroll: bytes = b""):
+        if self._q is not None:
+            self.abort()
+        q = asyncio.Queue()
+        self._q = q
+        self._fut = asyncio.run_coroutine_threadsafe(_stream_async(q, self.lang, self.rate), self.loop)
+        if preroll:
+            self.feed(preroll)
+
+    def feed(self, pcm16: bytes):
+        if self._q is not None:
+            self.loop.call_soon_threadsafe(self._q.put_nowait, pcm16)
+
+    def finish(self):
+        """Beendet den Turn; liefert ein concurrent.futures.Future[str] oder None (kein Stream aktiv)."""
+        q, fut = self._q, self._fut
+        self._q = self._fut = None
+        if q is None:
+            return None
+        self.loop.call_soon_threadsafe(q.put_nowait, None)
+        return fut
 
-def transcribe_segment(pcm16_16k: bytes, lang: str = "de") -> str:
-    # Wrapper für Sync-Aufruf
-    return asyncio.run(_transcribe_async(pcm16_16k, lang))
+    def abort(self):
+        q = self._q
+        self._q = self._fut = None
+        if q is not None:
+            self.loop.call_soon_threadsafe(q.put_nowait, _ABORT)
@@ -0,0 +1,201 @@
+# -*- coding: utf-8 -*-
+import asyncio, importlib, logging, threading, time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable
+
+log = logging.getLogger(__name__)
+
+# Backend-Name -> Modul mit transcribe_segment(pcm16, lang, rate) -> str.
+# Import erst bei Benutzung (z.B. legt ari_stt_openai beim Import den OpenAI-Client an).
+BACKENDS: dict[str, str | Callable] = {
+    "openai":  "ari_stt_openai",
+    "wyoming": "ari_stt",
+}
+
+def register_backend(name: str, fn: Callable[[bytes, str, int], str]):
+    BACKENDS[name] = fn
+
+_WARM: dict[str, Callable | None] = {}
+
+def get_backend(name: str) -> Callable[[bytes, str, int], str]:
+    b = BACKENDS.get(name)
+    if b is None:
+        raise ValueError(f"unknown stt backend {name!r} (known: {', '.join(BACKENDS)})")
+    if isinstance(b, str):
+        mod = importlib.import_module(b)
+        _WARM[name] = getattr(mod, "warm", None)
+        b = BACKENDS[name] = mod.transcribe_segment
+    return b
+
+def get_warm(name: str) -> Callable | None:
+    """warm(connections, lang, rate) des Backend-Moduls, falls vorhanden."""
+    get_backend(name)
+    return _WARM.get(name)
+
+
+class CircuitBreaker:
+    """
+    Rollierendes Fenster der letzten 'window' Aufrufe. Öffnet, wenn die p95-Latenz
+    über p95_ms oder die Fehlerquote über error_rate liegt (ab min_samples).
+    Nach cooldown_s darf ein Probe-Aufruf durch (half-open); geht er gut,
+    schließt der Breaker wieder.
+    """
+    def __init__(self, window: int = 50, p95_ms: float = 4000.0, error_rate: float = 0.5,
+                 min_samples: int = 10, cooldown_s: float = 30.0):
+        self.p95_limit_ms = p95_ms
+        self.error_rate_limit = error_rate
+        self.min_samples = min_samples
+        self.cooldown_s = cooldown_s
+        self._win: deque[tuple[float, bool]] = deque(maxlen=window)
+        self._lock = threading.Lock()
+        self._opened_at: float | None = None
+        self._probe = False
+        self.trips = 0
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self._opened_at is None:
+                return True
+            if self._probe or time.monotonic() - self._opened_at < self.cooldown_s:
+                return False
+            self._probe = True   # half-open: genau ein Probe-Aufruf
+            return True
+
+    def record(self, ms: float, ok: bool):
+        with self._lock:
+            if self._opened_at is not None and self._probe:
+                self._probe = False
+                if ok and ms <= self.p95_limit_ms:
+                    self._opened_at = None
+                    self._win.clear()
+                else:
+                    self._opened_at = time.monotonic()
+                return
+            self._win.append((ms, ok))
+            if self._opened_at is None and len(self._win) >= self.min_samples:
+                p95, err = self._p95_err()
+                if p95 > self.p95_limit_ms or err > self.error_rate_limit:
+                    self._opened_at = time.monotonic()
+                    self.trips += 1
+                    log.warning("[STT] breaker open (p95=%.0fms errors=%.0f%%)", p95, err * 100)
+
+    def _p95_err(self) -> tuple[float, float]:
+        lat = sorted(ms for ms, _ in self._win)
+        p95 = lat[min(len(lat) - 1, int(0.95 * len(lat)))] if lat else 0.0
+        err = sum(1 for _, ok in self._win if not ok) / len(self._win) if self._win else 0.0
+        return p95, err
+
+    @property
+    def state(self) -> str:
+        if self._opened_at is None:
+            return "closed"
+        return "half-open" if self._probe else "open"
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            p95, err = self._p95_err()
+            return {"state": self.state, "p95_ms": round(p95, 1),
+                    "error_rate": round(err, 3), "samples": len(self._win), "trips": self.trips}
+
+
+class SttRouter:
+    """
+    Verteilt Segmente auf STT-Backends:
+    - primary wird benutzt, solange sein Breaker geschlossen ist, sonst hedge (Failover)
+    - hedged: liefert primary nicht innerhalb hedge_delay_ms, geht dasselbe Segment
+      zusätzlich an das hedge-Backend; das erste erfolgreiche Ergebnis gewinnt
+    Die blockierenden Backends laufen in einem eigenen Thread-Pool; Latenz und
+    Fehler jedes Aufrufs (auch des Verlierers) gehen in den Breaker.
+    """
+    def __init__(self, primary: str, hedge: str | None = None, hedge_delay_ms: float = 800.0,
+                 breaker_cfg: dict | None = None, workers: int = 16):
+        self.primary = primary
+        self.hedge = hedge if hedge and hedge != primary else None
+        self.hedge_delay_s = hedge_delay_ms / 1000.0
+        names = [primary] + ([self.hedge] if self.hedge else [])
+        for n in names:
+            if n not in BACKENDS:
+                get_backend(n)   # unbekannt -> ValueError schon beim Start
+        self.fns: dict[str, Callable] = {}   # Import erst bei Benutzung bzw. warm()
+        self.breakers = {n: CircuitBreaker(**(breaker_cfg or {})) for n in names}
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="stt")
+        self.hedged = 0
+        self.hedge_wins = 0
+
+    def _call(self, name: str, pcm: bytes, lang: str, rate: int) -> str:
+        t0 = time.perf_counter()
+        ok = False
+        try:
+            text = self._fn(name)(pcm, lang, rate)
+            ok = True
+            return text
+        finally:
+            self.breakers[name].record((time.perf_counter() - t0) * 1000.0, ok)
+
+    def _fn(self, name: str) -> Callable:
+        fn = self.fns.get(name)
+        if fn is None:
+            fn = self.fns[name] = get_backend(name)
+        return fn
+
+    async def warm(self, connections: int = 1, lang: str = "de", rate: int = 16000):
+        """Alle konfigurierten Backends laden und vorwärmen (Import, Verbindungen, Modell)."""
+        for name in self.breakers:
+            t0 = time.perf_counter()
+            await asyncio.get_running_loop().run_in_executor(self._pool, self._fn, name)
+            warm = get_warm(name)
+            if warm is not None:
+                await asyncio.get_running_loop().run_in_executor(self._pool, warm, connections, lang, rate)
+            log.info("[STT] backend %s warm in %.0f ms", name, (time.perf_counter() - t0) * 1000)
+
+    def _start(self, name: str, pcm: bytes, lang: str, rate: int) -> asyncio.Future:
+        fut = asyncio.get_running_loop().run_in_executor(self._pool, self._call, name, pcm, lang, rate)
+        fut.backend = name
+        return fut
+
+    async def transcribe(self, pcm16: bytes, lang: str = "de", rate: int = 16000) -> str:
+        hedge = self.hedge
+        if self.breakers[self.primary].allow():
+            first = self._start(self.primary, pcm16, lang, rate)
+        elif hedge and self.breakers[hedge].allow():
+            first, hedge = self._start(hedge, pcm16, lang, rate), None   # Failover
+        else:
+            first, hedge = self._start(self.primary, pcm16, lang, rate), None   # alles offen: trotzdem versuchen
+        if not hedge:
+            return await first
+        # Hedge erst nach hedge_delay_ms (oder sofort, wenn primary scheitert)
+        done, _ = await asyncio.wait({first}, timeout=self.hedge_delay_s)
+        if done and first.exception() is None:
+            return first.result()
+        if not self.breakers[hedge].allow():
+            return await first
+        self.hedged += 1
+        pending = {first, self._start(hedge, pcm16, lang, rate)} - done
+        err = first.exception() if done else None
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for f in done:
+                if f.exception() is None:
+                    for p in pending:
+                        p.cancel()
+                    if f.backend != self.primary:
+                        self.hedge_wins += 1
+                    return f.result()
+                err = f.exception()
+        raise err
+
+    def snapshot(self) -> dict:
+        return {"primary": self.primary, "hedge": self.hedge,
+                "hedged": self.hedged, "hedge_wins": self.hedge_wins,
+                "backends": {n: b.snapshot() for n, b in self.breakers.items()}}
+
+
+def router_from_cfg(c: dict, workers: int = 16) -> SttRouter:
+    c = c or {}
+    h = c.get("hedge", {}) or {}
+    return SttRouter(c.get("backend", "openai"),
+                     hedge=h.get("backend") or None,
+                     hedge_delay_ms=float(h.get("delay_ms", 800)),
+                     breaker_cfg=c.get("breaker") or None,
+                     workers=workers)
@@ -1,33 +1,32 @@
 # /opt/freya/phone/ari_stt_openai.py
-import io, wave, os
+import os
 from openai import OpenAI
+from ari_audio import encode_wav
 from config import cfg
 
 C = cfg()
 OPENAI_STT_MODEL = C["openai"]["stt_model"]                              # z.B. gpt-4o-mini-transcribe
 
-_client = OpenAI() 
+# Upload-Format: Telefonband (8 kHz) reicht, 'wav-ulaw' halbiert die Bytes nochmal
+_UPLOAD_C = (C.get("stt", {}) or {}).get("upload", {}) or {}
+UPLOAD_RATE = int(_UPLOAD_C.get("rate", 8000) or 0)
+UPLOAD_ENCODING = _UPLOAD_C.get("encoding", "pcm16")
 
-def _pcm16_16k_bytes_to_wav_bytes(pcm: bytes) -> bytes:
-    """Wrappt PCM16/16k/mono in ein gültiges WAV-Container-Byteobjekt."""
-    buf = io.BytesIO()
-    with wave.open(buf, "wb") as wf:
-        wf.setnchannels(1)
-        wf.setsampwidth(2)      # 16-bit
-        wf.setframerate(16000)
-        wf.writeframes(pcm)
-    return buf.getvalue()
+_client = OpenAI()
 
-def transcribe_segment(pcm16_16k: bytes, lang: str = "de") -> str:
-    if not pcm16_16k:
+def warm(connections: int = 1, lang: str = "de", rate: int = 16000):
+    """Start: TLS-Verbindung zur API aufbauen (kostenloser Listen-Aufruf statt Transkription)."""
+    _client.models.with_raw_response.list()
+
+def transcribe_segment(pcm16: bytes, lang: str = "de", rate: int = 16000) -> str:
+    if not pcm16:
         return ""
 
-    wav_bytes = _pcm16_16k_bytes_to_wav_bytes(pcm16_16k)
+    wav_bytes = encode_wav(pcm16, rate, UPLOAD_RATE, UPLOAD_ENCODING)
 
     resp = _client.audio.transcriptions.create(
         model=OPENAI_STT_MODEL,                                  # ⬅️ jetzt vorhanden
-        file=("audio.wav", io.BytesIO(wav_bytes), "audio/wav"),
+        file=("audio.wav", wav_bytes, "audio/wav"),
         language=lang or None
     )
     return (getattr(resp, "text", "") or "").strip()
-
@@ -0,0 +1,226 @@
+# -*- coding: utf-8 -*-
+import asyncio, json, logging, socket, subprocess, sys, time
+from typing import Awaitable, Callable
+
+from ari_metrics import metric_family
+
+log = logging.getLogger(__name__)
+
+WORKER_PREFIX = "w{}-"      # Präfix der externalMedia-Channel-IDs eines Workers
+HANGUP_EVENTS = ("StasisEnd", "ChannelDestroyed")
+LINE_LIMIT = 1 << 20        # max. Länge einer Nachricht auf der Steuerverbindung
+
+
+def worker_of(ch_id: str) -> int | None:
+    """Worker-Index aus einer Channel-ID mit Worker-Präfix ("w3-…"), sonst None."""
+    if ch_id.startswith("w"):
+        head, sep, _ = ch_id.partition("-")
+        if sep and head[1:].isdigit():
+            return int(head[1:])
+    return None
+
+
+def port_shard(first: int, count: int, idx: int, n: int) -> tuple[int, int]:
+    """Disjunkter RTP-Portbereich (erster Port, Anzahl) für Worker idx von n."""
+    per = count // n
+    return first + idx * per, per
+
+
+class Worker:
+    __slots__ = ("idx", "proc", "writer", "calls", "load", "up", "restarts", "started")
+
+    def __init__(self, idx: int):
+        self.idx = idx
+        self.proc: subprocess.Popen | None = None
+        self.writer: asyncio.StreamWriter | None = None
+        self.calls: set[str] = set()     # Caller-Channels, die diesem Worker gehören
+        self.load: dict = {}             # letzter Lastbericht
+        self.up = False                  # erst mit dem ersten Lastbericht (Worker fertig geladen)
+        self.restarts = 0
+        self.started = 0.0
+
+
+class Supervisor:
+    """
+    Master-Prozess für den Betrieb über mehrere Kerne: startet N Worker-Prozesse
+    (je eigener Event-Loop, eigene RTP-Threads, eigener Portbereich) und hält
+    selbst nur den ARI-Websocket. Neue Calls (StasisStart eines Anrufer-Channels)
+    gehen an den Worker mit der geringsten Last und bleiben dort; alle weiteren
+    Events dieses Channels folgen ihm. Events der externalMedia-Channels werden
+    über das Worker-Präfix der Channel-ID zugestellt (vom Worker selbst vergeben),
+    daher ist kein Abgleich vor dem Anlegen nötig.
+    Steuerverbindung pro Worker: socketpair, eine JSON-Zeile pro Nachricht
+    (Master -> Worker: ARI-Events, Worker -> Master: {"load": {...}}).
+    Stirbt ein Worker, legt der Master dessen Calls auf und startet ihn neu.
+    """
+    def __init__(self, n: int, argv: Callable[[int, int, int], list[str]],
+                 is_caller: Callable[[dict], bool], hangup: Callable[[str], Awaitable],
+                 app: str, restart_backoff_s: float = 2.0):
+        self.n = n
+        self.argv = argv
+        self.is_caller = is_caller
+        self.hangup = hangup
+        self.app = app
+        self.restart_backoff_s = float(restart_backoff_s)
+        self.workers = [Worker(i) for i in range(n)]
+        self.owner: dict[str, int] = {}   # Caller-Channel-ID -> Worker
+        self.unroutable = 0
+        self._stopping = False
+
+    # ---- Worker-Prozesse ----
+    async def start(self, timeout_s: float = 60.0):
+        """Worker starten und warten, bis alle bereit sind (erster Lastbericht)."""
+        for w in self.workers:
+            await self._spawn(w)
+        t_end = time.monotonic() + timeout_s
+        while not all(w.up for w in self.workers) and time.monotonic() < t_end:
+            await asyncio.sleep(0.05)
+        ready = sum(w.up for w in self.workers)
+        if ready < self.n:
+            log.warning("[SUPERVISOR] only %d/%d workers ready after %.0fs", ready, self.n, timeout_s)
+
+    async def _spawn(self, w: Worker):
+        ours, theirs = socket.socketpair()
+        w.proc = subprocess.Popen(self.argv(w.idx, self.n, theirs.fileno()), pass_fds=(theirs.fileno(),))
+        theirs.close()
+        reader, w.writer = await asyncio.open_connection(sock=ours, limit=LINE_LIMIT)
+        w.up, w.started, w.load = False, time.monotonic(), {}
+        log.info("[SUPERVISOR] worker %d started (pid %d)", w.idx, w.proc.pid)
+        asyncio.create_task(self._read(w, reader))
+
+    async def _read(self, w: Worker, reader: asyncio.StreamReader):
+        try:
+            async for line in reader:
+                try:
+                    msg = json.loads(line)
+                except ValueError:
+                    continue
+                if "load" in msg:
+                    w.load = msg["load"]
+                    if not w.up:
+                        w.up = True
+                        log.info("[SUPERVISOR] worker %d ready", w.idx)
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            pass
+        if not self._stopping:
+            await self._lost(w)
+
+    async def _lost(self, w: Worker):
+        w.up = False
+        if w.writer:
+            w.writer.close()
+            w.writer = None
+        try:
+            rc = await asyncio.to_thread(w.proc.wait, 5)
+        except subprocess.TimeoutExpired:
+            # Steuerverbindung weg, Prozess hängt noch
+            w.proc.kill()
+            rc = await asyncio.to_thread(w.proc.wait)
+        calls, w.calls = list(w.calls), set()
+        log.warning("[SUPERVISOR] worker %d exited (rc=%s), hanging up %d calls", w.idx, rc, len(calls))
+        for ch in calls:
+            self.owner.pop(ch, None)
+            try:
+                await self.hangup(ch)
+            except Exception:
+                pass
+        # nicht im Takt neu starten, wenn der Worker sofort wieder stirbt
+        if time.monotonic() - w.started < 10:
+            await asyncio.sleep(self.restart_backoff_s)
+        if self._stopping:
+            return
+        w.restarts += 1
+        try:
+            await self._spawn(w)
+        except OSError as e:
+            log.error("[SUPERVISOR] worker %d restart failed: %s", w.idx, e)
+
+    def stop(self):
+        self._stopping = True
+        for w in self.workers:
+            if w.proc and w.proc.poll() is None:
+                w.proc.terminate()
+
+    # ---- Verteilung ----
+    def _pick(self) -> Worker | None:
+        up = [w for w in self.workers if w.up]
+        if not up:
+            return None
+        # Calls zählt der Master selbst (sofort aktuell), Turns/Überlast aus dem letzten Bericht
+        return min(up, key=lambda w: (bool(w.load.get("overloaded")), len(w.calls), w.load.get("turns", 0), w.idx))
+
+    def _send(self, w: Worker, raw: str):
+        if w.writer is None:
+            return
+        if "\n" in raw:
+            raw = json.dumps(json.loads(raw))
+        w.writer.write(raw.encode() + b"\n")
+
+    def route(self, raw: str):
+        """Ein ARI-Event (Rohtext vom Websocket) an den zuständigen Worker geben."""
+        ev = json.loads(raw)
+        ch = (ev.get("channel") or {}).get("id") or ""
+        idx = worker_of(ch)
+        if idx is None:
+            idx = self.owner.get(ch)
+        typ = ev.get("type")
+        if idx is None and typ == "StasisStart" and ev.get("application") == self.app and self.is_caller(ev):
+            w = self._pick()
+            if w is None:
+                log.warning("[SUPERVISOR] no worker up, rejecting %s", ch)
+                asyncio.create_task(self.hangup(ch))
+                return
+            idx = self.owner[ch] = w.idx
+            w.calls.add(ch)
+            log.info("[SUPERVISOR] call %s -> worker %d (%d calls)", ch, w.idx, len(w.calls))
+        if idx is None or idx >= self.n:
+            self.unroutable += 1
+            return
+        w = self.workers[idx]
+        self._send(w, raw)
+        if typ in HANGUP_EVENTS and self.owner.get(ch) == idx:
+            del self.owner[ch]
+            w.calls.discard(ch)
+
+    # ---- Metriken ----
+    def collect(self):
+        ws = self.workers
+        yield from metric_family("freya_worker_up", "gauge", "Worker-Prozess läuft",
+                                 [({"worker": w.idx}, int(w.up)) for w in ws])
+        yield from metric_family("freya_worker_calls", "gauge", "Zugewiesene Calls pro Worker",
+                                 [({"worker": w.idx}, len(w.calls)) for w in ws])
+        yield from metric_family("freya_worker_turns_inflight", "gauge", "Laufende Turns pro Worker (Bericht)",
+                                 [({"worker": w.idx}, w.load.get("turns", 0)) for w in ws])
+        yield from metric_family("freya_worker_cpu_seconds_total", "counter", "CPU-Zeit pro Worker (Bericht)",
+                                 [({"worker": w.idx}, w.load.get("cpu_s", 0)) for w in ws])
+        yield from metric_family("freya_worker_rss_bytes", "gauge", "Speicher pro Worker (Bericht)",
+                                 [({"worker": w.idx}, w.load.get("rss", 0)) for w in ws])
+        yield from metric_family("freya_worker_restarts_total", "counter", "Neustarts pro Worker",
+                                 [({"worker": w.idx}, w.restarts) for w in ws])
+        yield from metric_family("freya_supervisor_unroutable_events_total", "counter",
+                                 "ARI-Events ohne zuständigen Worker", [({}, self.unroutable)])
+
+    def snapshot(self) -> list[dict]:
+        return [{"worker": w.idx, "up": w.up, "pid": w.proc.pid if w.proc else None,
+                 "calls": len(w.calls), **w.load} for w in self.workers]
+
+
+async def connect_master(fd: int) -> tuple[asyncio.StreamReader, asyncio.StreamWriter]:
+    """Worker-Seite der Steuerverbindung (vom Master per pass_fds vererbt)."""
+    return await asyncio.open_connection(sock=socket.socket(fileno=fd), limit=LINE_LIMIT)
+
+
+def process_load() -> dict:
+    """CPU-Zeit und RSS dieses Prozesses (für den Lastbericht)."""
+    rss = 0
+    try:
+        with open("/proc/self/statm") as f:
+            rss = int(f.read().split()[1]) * 4096
+    except (OSError, ValueError, IndexError):
+        pass
+    return {"cpu_s": round(time.process_time(), 3), "rss": rss}
+
+
+def default_argv(script: str) -> Callable[[int, int, int], list[str]]:
+    return lambda idx, n, fd: [sys.executable, "-u", script, "--worker", str(idx),
+                               "--workers", str(n), "--ctl-fd", str(fd)]
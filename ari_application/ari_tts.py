@@ -1,29 +1,58 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 
-import asyncio, socket, struct, time, audioop, random
-from wyoming.client import AsyncTcpClient
-from wyoming.tts import Synthesize
+import asyncio, socket, audioop, logging, random
+from wyoming.tts import Synthesize, SynthesizeVoice
 from wyoming.audio import AudioChunk
+from ari_tts_cache import PromptCache
+from ari_playout import PlayoutStream, get_scheduler
+from ari_wyoming import tts_pool, with_retry
+import ari_aio
 from config import cfg
 
+log = logging.getLogger(__name__)
+
 C = cfg()
 WYOMING_HOST = C["wyoming"]["host"]
 WYOMING_TTS_PORT = int(C["wyoming"]["tts_de"])
+WYOMING_TTS_VOICE = C["wyoming"].get("tts_voice") or None
+
+# --- Cache fertiger 8k-μ-law-Prompts (WELCOME, Dialer-Texte, wiederkehrende Antworten) ---
+_CACHE_C = C.get("tts_cache", {}) or {}
+tts_cache = PromptCache(
+    max_bytes=int(_CACHE_C.get("max_bytes", 32 * 1024 * 1024)),
+    directory=_CACHE_C.get("dir") or None,
+    disk_max_bytes=int(_CACHE_C.get("disk_max_bytes", 256 * 1024 * 1024)),
+) if _CACHE_C.get("enabled", True) else None
+
+def _cache_key(text: str) -> str:
+    voice = f"{WYOMING_HOST}:{WYOMING_TTS_PORT}/{WYOMING_TTS_VOICE or 'default'}"
+    return PromptCache.key(text, voice, "pcmu8k")
 
-# --- einfacher RTP-Zustand (pro Call) ---
+def _synthesize_event(text: str):
+    if WYOMING_TTS_VOICE:
+        return Synthesize(text=text, voice=SynthesizeVoice(name=WYOMING_TTS_VOICE)).event()
+    return Synthesize(text=text).event()
+
+# --- einfacher RTP-Zustand (Fallback, wenn kein Call-State übergeben wird) ---
 _RTP_STATE = {"ssrc": None, "seq": 0, "ts": 0}
 
+def new_rtp_state() -> dict:
+    """Eigener RTP-Zustand pro Call: neue SSRC, zufälliger Startwert für seq/ts."""
+    return {
+        "ssrc": random.getrandbits(32),
+        "seq":  random.randint(0, 65535),
+        "ts":   random.randint(0, 2**31 - 1),
+    }
+
 def reset_tts_rtp_state():
-    """Pro neuem Call aufrufen: neue SSRC, zufälliger Startwert für seq/ts."""
-    _RTP_STATE["ssrc"] = random.getrandbits(32)
-    _RTP_STATE["seq"]  = random.randint(0, 65535)
-    _RTP_STATE["ts"]   = random.randint(0, 2**31 - 1)
+    """Setzt den globalen Fallback-State zurück."""
+    _RTP_STATE.update(new_rtp_state())
 
 async def _tts_pcm16_16k(text: str) -> bytes:
-    pcm = bytearray()
-    async with AsyncTcpClient(WYOMING_HOST, WYOMING_TTS_PORT) as c:
-        await c.write_event(Synthesize(text=text).event())
+    async def request(c):
+        pcm = bytearray()
+        await c.write_event(_synthesize_event(text))
         while True:
             ev = await c.read_event()
             if not ev:
@@ -31,94 +60,201 @@ async def _tts_pcm16_16k(text: str) -> bytes:
             if ev.type == "audio-chunk":
                 pcm.extend(AudioChunk.from_event(ev).audio)
             elif ev.type == "audio-stop":
+                c.done = True
                 break
-    return bytes(pcm)
+        return bytes(pcm)
+    return await with_retry(tts_pool(), request)
 
-def send_tts_to_rtp(
-    text: str,
+async def _tts_ulaw_chunks(text: str, emit, stop_event=None, persist: bool = False) -> int:
+    """
+    Liest die Wyoming audio-chunks und gibt sie sofort als 8k μ-law an
+    emit(bytes) weiter (ratecv-Zustand wird über die Chunks mitgeführt).
+    Mit Cache: Treffer gehen komplett in einem Stück raus, vollständige
+    Synthesen werden danach im Cache abgelegt (mit persist auch auf Platte).
+    Return: Anzahl μ-law-Bytes.
+    """
+    key = _cache_key(text) if tts_cache is not None else None
+    if key:
+        hit = await tts_cache.aget(key)
+        if hit is not None:
+            emit(hit)
+            return len(hit)
+
+    async def request(c):
+        # Verbindung geht nur nach audio-stop zurück in den Pool (bei Abbruch
+        # stecken noch Chunks in der Leitung)
+        state = None
+        total = 0
+        collected = bytearray() if key else None
+        await c.write_event(_synthesize_event(text))
+        while True:
+            if stop_event and stop_event.is_set():
+                break
+            ev = await c.read_event()
+            if not ev:
+                break
+            if ev.type == "audio-chunk":
+                ch = AudioChunk.from_event(ev)
+                pcm8k, state = audioop.ratecv(ch.audio, ch.width, ch.channels, ch.rate, 8000, state)
+                if ch.width != 2:
+                    pcm8k = audioop.lin2lin(pcm8k, ch.width, 2)
+                ulaw = audioop.lin2ulaw(pcm8k, 2)
+                if collected is not None:
+                    collected.extend(ulaw)
+                total += len(ulaw)
+                emit(ulaw)
+            elif ev.type == "audio-stop":
+                c.done = True
+                break
+        return total, collected, c.done
+
+    total, collected, complete = await with_retry(tts_pool(), request)
+    if complete and collected:
+        tts_cache.put(key, bytes(collected), persist)
+    return total
+
+def open_playout(
     dst_ip: str,
     dst_port: int,
-    sock: socket.socket | None = None,
-    stop_event=None,        # <— NEU: optionales Cancel-Flag
-) -> int:
+    sock: socket.socket,
+    stop_event=None,
+    rtp_state: dict | None = None,
+) -> PlayoutStream:
+    """Neuen RTP-Stream beim gemeinsamen PlayoutScheduler anmelden (noch ohne Audio)."""
+    # initialisiere RTP-State falls nötig
+    state = rtp_state if rtp_state is not None else _RTP_STATE
+    if state["ssrc"] is None:
+        state.update(new_rtp_state())
+    return get_scheduler().open(sock, (dst_ip, int(dst_port)), state, stop_event)
+
+def synth_into(st: PlayoutStream, text: str, timeout_s: float | None = None) -> int:
     """
-    Erzeugt PCM16@16k mit Wyoming/Piper, wandelt zu 8k μ-law und sendet
-    in RTP-PCMU (PT=0) 20ms-Paketen. Hält seq/ts/ssrc über Aufrufe hinweg.
-    Wenn 'sock' übergeben wird, wird genau dieser UDP-Socket zum Senden benutzt
-    (z.B. der gleiche wie der Empfangs-Socket), andernfalls wird ein eigener
-    UDP-Socket kurzfristig erstellt.
-    Return: gesendete Paketanzahl.
+    Synthetisiert 'text' und hängt das Audio Chunk für Chunk an den Stream an.
+    Blockiert für die Dauer der Synthese, höchstens timeout_s (danach wird die
+    Synthese abgebrochen und der Thread frei). Return: Anzahl μ-law-Bytes.
     """
-    if not dst_ip or not dst_port:
-        print("[TTS] no dst specified")
+    if st.cancelled():
+        log.info("[TTS] cancelled before synth")
+        return 0
+    log.debug("[TTS] dst=%s:%s text=%r", st.dst[0], st.dst[1], text[:60])
+    try:
+        n = ari_aio.run(_tts_ulaw_chunks(text, st.feed, st.stop_event), timeout_s)
+    except TimeoutError:
+        log.warning("[TTS] synth timed out after %.1fs text=%r", timeout_s, text[:60])
         return 0
+    if not n:
+        log.warning("[TTS] no audio from wyoming")
+    return n
 
-    # Vorab-Abbruch (falls zwischen say() und Synthese schon gecancelt wurde)
-    if stop_event and stop_event.is_set():
-        print("[TTS] cancelled before synth")
+async def asynth_into(st: PlayoutStream, text: str) -> int:
+    """Wie synth_into(), aber awaitbar aus einem anderen Event-Loop (belegt keinen Thread)."""
+    if st.cancelled():
         return 0
+    log.debug("[TTS] dst=%s:%s text=%r", st.dst[0], st.dst[1], text[:60])
+    return await asyncio.wrap_future(ari_aio.submit(_tts_ulaw_chunks(text, st.feed, st.stop_event)))
 
-    print(f"[TTS] dst={dst_ip}:{dst_port} text='{text[:60]}'")
-    pcm16_16k = asyncio.run(_tts_pcm16_16k(text))
-    if not pcm16_16k:
-        print("[TTS] no audio from wyoming")
+_presynth_inflight: dict = {}
+
+async def apresynth(text: str) -> int:
+    """
+    Rendert 'text' nur in den Cache (ohne Ausgabe), z.B. während ein
+    ausgehender Anruf klingelt – beim Annehmen ist es dann ein Cache-Treffer.
+    Gleiche Texte werden nur einmal synthetisiert. Prozessübergreifend wirkt
+    das nur mit tts_cache.dir. Return: μ-law-Bytes (0 ohne Cache).
+    """
+    if tts_cache is None or not text:
         return 0
+    key = _cache_key(text)
+    hit = await tts_cache.aget(key)
+    if hit is not None:
+        return len(hit)
+    fut = _presynth_inflight.get(key)
+    if fut is None:
+        fut = _presynth_inflight[key] = ari_aio.submit(_tts_ulaw_chunks(text, lambda b: None, persist=True))
+        fut.add_done_callback(lambda f: _presynth_inflight.pop(key, None))
+    return await asyncio.wrap_future(fut)
 
-    # Abbruch-Check vor der Konvertierung (spart CPU)
-    if stop_event and stop_event.is_set():
-        print("[TTS] cancelled before convert")
+async def awarm(texts, connections: int = 1) -> int:
+    """
+    Start: Verbindungen zu Piper öffnen und die Prompts vorab in den Cache
+    rendern – die erste Synthese lädt auch die Stimme. Ohne Cache wird nur
+    der erste Text einmal (verworfen) synthetisiert. Return: Anzahl Prompts.
+    """
+    await asyncio.wrap_future(ari_aio.submit(tts_pool().warm(connections)))
+    texts = [t for t in dict.fromkeys(texts) if t]
+    if not texts:
         return 0
+    if tts_cache is None:
+        await asyncio.wrap_future(ari_aio.submit(_tts_ulaw_chunks(texts[0], lambda b: None)))
+        return 0
+    await asyncio.gather(*(apresynth(t) for t in texts))
+    return len(texts)
 
-    # 16k -> 8k, dann μ-law (16bit -> ulaw bytes)
-    pcm16_8k, _ = audioop.ratecv(pcm16_16k, 2, 1, 16000, 8000, None)
-    ulaw = audioop.lin2ulaw(pcm16_8k, 2)
-    print(f"[TTS] bytes_ulaw={len(ulaw)}")
+def prompt_file(text: str):
+    """
+    Gerenderter Prompt als Datei im tts_cache.dir (8k μ-law, .ulaw) – abspielbar
+    von Asterisk selbst ("sound:<pfad ohne Endung>"). None, wenn (noch) nicht da.
+    """
+    if tts_cache is None or not text:
+        return None
+    return tts_cache.file(_cache_key(text))
 
-    # initialisiere RTP-State falls nötig
-    if _RTP_STATE["ssrc"] is None:
-        reset_tts_rtp_state()
+def play_tts(
+    text: str,
+    dst_ip: str,
+    dst_port: int,
+    sock: socket.socket,
+    stop_event=None,
+    rtp_state: dict | None = None,
+) -> PlayoutStream | None:
+    """
+    Synthetisiert mit Wyoming/Piper und übergibt jeden audio-chunk sofort als
+    8k μ-law an den gemeinsamen PlayoutScheduler (RTP-PCMU, PT=0, 20ms-Pakete).
+    Blockiert nur für die Dauer der Synthese, das Abspielen läuft weiter;
+    der zurückgegebene Stream kann gewartet (wait) oder abgebrochen werden.
+    """
+    if not dst_ip or not dst_port:
+        log.warning("[TTS] no dst specified")
+        return None
 
-    RTP_PT = 0
-    TS_INC = 160   # 20 ms @8k -> 160 timestamp increment
-    ssrc   = _RTP_STATE["ssrc"]
-    seq    = _RTP_STATE["seq"]
-    ts     = _RTP_STATE["ts"]
+    # Vorab-Abbruch (falls zwischen say() und Synthese schon gecancelt wurde)
+    if stop_event and stop_event.is_set():
+        log.info("[TTS] cancelled before synth")
+        return None
 
+    st = open_playout(dst_ip, dst_port, sock, stop_event, rtp_state)
+    try:
+        synth_into(st, text)
+    finally:
+        st.close()
+    return st
+
+def send_tts_to_rtp(
+    text: str,
+    dst_ip: str,
+    dst_port: int,
+    sock: socket.socket | None = None,
+    stop_event=None,        # <— NEU: optionales Cancel-Flag
+    rtp_state: dict | None = None,
+) -> int:
+    """
+    Wie play_tts(), wartet aber bis das Abspielen fertig ist. Hält seq/ts/ssrc
+    über Aufrufe hinweg.
+    Wenn 'sock' übergeben wird, wird genau dieser UDP-Socket zum Senden benutzt
+    (z.B. der gleiche wie der Empfangs-Socket), andernfalls wird ein eigener
+    UDP-Socket kurzfristig erstellt.
+    'rtp_state' ist der RTP-Zustand des Calls (siehe new_rtp_state()); ohne
+    Angabe wird der modulweite Zustand benutzt.
+    Return: gesendete Paketanzahl.
+    """
     s = sock or socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-    close_after = (sock is None)
-    step = 160   # 20ms chunks @8k -> 160 bytes
-    pkt_count = 0
-    first_pkt = True
-
-    # sende nur volle step-chunks (einfacher und kompatibler)
-    for off in range(0, len(ulaw) - step + 1, step):
-        # Abbruch mitten im Senden
-        if stop_event and stop_event.is_set():
-            print("[TTS] stopped early")
-            break
-
-        chunk = ulaw[off:off+step]
-        # RTP header: V=2, P=0, X=0, M=marker for first packet, PT, seq, ts, ssrc
-        marker = 0x80 if first_pkt else 0x00
-        first_pkt = False
-        b1 = 0x80
-        b2 = marker | RTP_PT
-        hdr = struct.pack("!BBHII", b1, b2, seq & 0xFFFF, ts & 0xFFFFFFFF, ssrc & 0xFFFFFFFF)
-        try:
-            s.sendto(hdr + chunk, (dst_ip, int(dst_port)))
-        except Exception as e:
-            print("[TTS] send error:", e)
-            break
-
-        pkt_count += 1
-        seq = (seq + 1) & 0xFFFF
-        ts  = (ts + TS_INC) & 0xFFFFFFFF
-        time.sleep(0.02)  # 20 ms pacing
-
-    # speichere State zurück
-    _RTP_STATE["seq"] = seq
-    _RTP_STATE["ts"]  = ts
-    if close_after:
-        s.close()
-    print(f"[TTS] sent {pkt_count} RTP packets to {dst_ip}:{dst_port}")
-    return pkt_count
+    try:
+        st = play_tts(text, dst_ip, dst_port, s, stop_event, rtp_state)
+        if st is None:
+            return 0
+        st.wait()
+    finally:
+        if sock is None:
+            s.close()
+    log.info("[TTS] sent %d RTP packets to %s:%s", st.packets, dst_ip, dst_port)
+    return st.packets
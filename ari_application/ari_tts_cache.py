@@ -0,0 +1,166 @@
+# -*- coding: utf-8 -*-
+import asyncio, hashlib, logging, os, threading, time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+log = logging.getLogger(__name__)
+
+
+class PromptCache:
+    """
+    LRU-Cache für fertig sendbare 8k-μ-law-Payloads (Schlüssel: Text + Stimme + Format).
+    Begrenzung über die Summe der Bytes im RAM. Optional zusätzlich auf Platte
+    ('directory'), damit Prompts einen Neustart überleben; dort wird nach
+    'disk_max_bytes' über die mtime aufgeräumt. Auf Platte landen nur feste
+    Prompts (put(..., persist=True): Begrüßung, Besetzt-Ansage, Warm-up,
+    Kampagnen-Texte), keine freien Antworten. Plattenzugriffe laufen in einem
+    eigenen Thread (aget/put), nicht im Event-Loop der Aufrufer; die Größe
+    wird mitgezählt, gescannt wird nur beim Aufräumen.
+    """
+    def __init__(self, max_bytes: int = 32 * 1024 * 1024, directory: str | None = None,
+                 disk_max_bytes: int = 256 * 1024 * 1024):
+        self.max_bytes = int(max_bytes)
+        self.disk_max_bytes = int(disk_max_bytes)
+        self.dir = Path(directory) if directory else None
+        self._disk_pool = None
+        self._disk_bytes = 0
+        self._last_prune = 0.0
+        if self.dir:
+            self.dir.mkdir(parents=True, exist_ok=True)
+            self._disk_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="tts-cache")
+            self._disk_bytes = sum(size for _, size, _ in self._disk_files())
+        self._mem: "OrderedDict[str, bytes]" = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(text: str, voice: str, fmt: str = "pcmu8k") -> str:
+        return hashlib.sha1(f"{fmt}\0{voice}\0{text}".encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> bytes | None:
+        with self._lock:
+            data = self._mem.get(key)
+            if data is not None:
+                self._mem.move_to_end(key)
+                self.hits += 1
+                return data
+        data = self._disk_get(key)
+        with self._lock:
+            if data is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._mem_put(key, data)
+        return data
+
+    async def aget(self, key: str) -> bytes | None:
+        """Wie get(), liest die Platte aber im Cache-Thread (für Event-Loops)."""
+        with self._lock:
+            data = self._mem.get(key)
+            if data is not None:
+                self._mem.move_to_end(key)
+                self.hits += 1
+                return data
+        data = None
+        if self._disk_pool is not None:
+            data = await asyncio.get_running_loop().run_in_executor(self._disk_pool, self._disk_get, key)
+        with self._lock:
+            if data is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._mem_put(key, data)
+        return data
+
+    def put(self, key: str, data: bytes, persist: bool = False):
+        """persist: zusätzlich auf Platte (nur feste Prompts), im Hintergrund."""
+        if not data:
+            return
+        with self._lock:
+            self._mem_put(key, data)
+        if persist and self._disk_pool is not None:
+            self._disk_pool.submit(self._disk_put, key, data)
+
+    def file(self, key: str) -> Path | None:
+        """Pfad des Eintrags auf Platte (roh μ-law, .ulaw), None ohne Verzeichnis/Eintrag."""
+        if not self.dir:
+            return None
+        p = self._path(key)
+        return p if p.exists() else None
+
+    def __len__(self):
+        with self._lock:
+            return len(self._mem)
+
+    # ---- intern ----
+    def _mem_put(self, key: str, data: bytes):
+        if len(data) > self.max_bytes:
+            return
+        old = self._mem.pop(key, None)
+        if old is not None:
+            self._size -= len(old)
+        self._mem[key] = data
+        self._size += len(data)
+        while self._size > self.max_bytes and self._mem:
+            _, ev = self._mem.popitem(last=False)
+            self._size -= len(ev)
+
+    def _path(self, key: str) -> Path:
+        return self.dir / f"{key}.ulaw"
+
+    def _disk_get(self, key: str) -> bytes | None:
+        if not self.dir:
+            return None
+        try:
+            p = self._path(key)
+            data = p.read_bytes()
+            os.utime(p)  # für das mtime-basierte Aufräumen
+            return data
+        except OSError:
+            return None
+
+    def _disk_put(self, key: str, data: bytes):
+        if not self.dir:
+            return
+        try:
+            p = self._path(key)
+            if p.exists():
+                os.utime(p)   # gleicher Schlüssel = gleicher Inhalt
+                return
+            tmp = p.with_suffix(f".tmp{threading.get_ident()}")
+            tmp.write_bytes(data)
+            os.replace(tmp, p)  # atomar, andere Prozesse sehen nie halbe Dateien
+            self._disk_bytes += len(data)
+            self._disk_prune()
+        except OSError as e:
+            log.warning("[TTS-CACHE] disk write failed: %s", e)
+
+    def _disk_files(self) -> list:
+        files = []
+        for f in self.dir.glob("*.ulaw"):
+            try:
+                st = f.stat()
+            except OSError:
+                continue
+            files.append((st.st_mtime, st.st_size, f))
+        return files
+
+    def _disk_prune(self):
+        # nur über der Grenze scannen, und höchstens alle 30 s (andere Prozesse schreiben mit)
+        if self._disk_bytes <= self.disk_max_bytes or time.monotonic() - self._last_prune < 30:
+            return
+        self._last_prune = time.monotonic()
+        files = self._disk_files()
+        total = sum(size for _, size, _ in files)
+        for _, size, f in sorted(files):
+            if total <= self.disk_max_bytes:
+                break
+            try:
+                f.unlink()
+            except OSError:
+                continue
+            total -= size
+        self._disk_bytes = total
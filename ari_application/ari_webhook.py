@@ -1,18 +1,280 @@
-import requests
+import json, re, threading, time, unicodedata
+from collections import OrderedDict
+from typing import Iterator
+
+from ari_http import webhook_client
 from config import cfg
 
 C = cfg()
-N8N_WEBHOOK = (C.get("n8n", {}) or {}).get(
+N8N_C = C.get("n8n", {}) or {}
+N8N_WEBHOOK = N8N_C.get(
     "webhook_url",
-    "http://localhost:5678/webhook/on_message" 
+    "http://localhost:5678/webhook/on_message"
 )
+# Antwort als Stream lesen und Satz für Satz sprechen
+N8N_STREAM = bool(N8N_C.get("stream", False))
+SENTENCE_MIN_CHARS = int(N8N_C.get("sentence_min_chars", 12))
+SENTENCE_MAX_CHARS = int(N8N_C.get("sentence_max_chars", 250))
+
+STREAM_ACCEPT = "text/event-stream, application/x-ndjson, application/json;q=0.9, text/plain;q=0.8"
+
+# ---------- Antwort-Cache ----------
+_PUNCT = re.compile(r"[^\w\s]+")
+_SPACE = re.compile(r"\s+")
+
+def normalize(text: str) -> str:
+    """Transkript -> Cache-Schlüssel: Kleinschreibung, ohne Satzzeichen, einfache Leerzeichen."""
+    t = unicodedata.normalize("NFKC", text).casefold()
+    return _SPACE.sub(" ", _PUNCT.sub(" ", t)).strip()
+
+def parse_cache_hint(hint, header: str = "") -> tuple[float | None, str | None]:
+    """
+    Cache-Hinweis des Webhooks -> (ttl_s | None = Default, scope | None = Default);
+    ttl_s 0 = nicht cachen. JSON-Feld "cache": false/0/"no-store", Sekunden oder
+    {"ttl": s, "scope": "global"|"caller"}; sonst der HTTP-Header Cache-Control
+    (no-store/no-cache, max-age=N, private = pro Anrufer).
+    """
+    if hint is not None:
+        if hint is False or hint in ("no-store", "no-cache"):
+            return 0.0, None
+        if hint is True:
+            return None, None
+        if isinstance(hint, (int, float)):
+            return max(0.0, float(hint)), None
+        if isinstance(hint, dict):
+            ttl = hint.get("ttl", hint.get("max_age"))
+            scope = hint.get("scope")
+            return (None if ttl is None else max(0.0, float(ttl)),
+                    scope if scope in ("global", "caller") else None)
+    ttl, scope = None, None
+    for d in (x.strip().lower() for x in header.split(",") if x.strip()):
+        if d in ("no-store", "no-cache"):
+            return 0.0, None
+        if d == "private":
+            scope = "caller"
+        elif d.startswith("max-age="):
+            try:
+                ttl = max(0.0, float(d[8:]))
+            except ValueError:
+                pass
+    return ttl, scope
+
+class ReplyCache:
+    """
+    Antworten des Webhooks für wiederkehrende Fragen (Öffnungszeiten, "wer ist
+    da?"). Schlüssel: normalisiertes Transkript, bei scope "caller" zusätzlich
+    die Rufnummer. TTL pro Eintrag, LRU-Begrenzung über die Anzahl Einträge.
+    Thread-sicher (Webhook-Stufe läuft im Thread-Pool).
+    """
+    def __init__(self, max_entries: int = 1000, default_ttl_s: float = 0.0, scope: str = "global"):
+        self.max_entries = int(max_entries)
+        self.default_ttl_s = float(default_ttl_s)
+        self.scope = scope if scope in ("global", "caller") else "global"
+        self._d: "OrderedDict[str, tuple[float, str]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+
+    @staticmethod
+    def _key(text: str, caller: str = "") -> str:
+        return f"{caller}\0{normalize(text)}"
+
+    def get(self, text: str, caller: str) -> str | None:
+        # Einträge pro Anrufer haben Vorrang vor globalen
+        now = time.monotonic()
+        with self._lock:
+            for k in (self._key(text, caller), self._key(text)):
+                e = self._d.get(k)
+                if e is None:
+                    continue
+                if e[0] <= now:
+                    del self._d[k]
+                    continue
+                self._d.move_to_end(k)
+                self.hits += 1
+                return e[1]
+            self.misses += 1
+            return None
+
+    def put(self, text: str, caller: str, reply: str, hint=None, header: str = ""):
+        ttl, scope = parse_cache_hint(hint, header)
+        ttl = self.default_ttl_s if ttl is None else ttl
+        if ttl <= 0 or not reply or not normalize(text):
+            return
+        k = self._key(text, caller if (scope or self.scope) == "caller" else "")
+        with self._lock:
+            self._d[k] = (time.monotonic() + ttl, reply)
+            self._d.move_to_end(k)
+            self.stores += 1
+            while len(self._d) > self.max_entries:
+                self._d.popitem(last=False)
+
+    def __len__(self):
+        with self._lock:
+            return len(self._d)
+
+_CACHE_C = N8N_C.get("reply_cache", {}) or {}
+reply_cache = ReplyCache(
+    max_entries=int(_CACHE_C.get("max_entries", 1000)),
+    default_ttl_s=float(_CACHE_C.get("default_ttl_s", 0)),
+    scope=_CACHE_C.get("scope", "global"),
+) if _CACHE_C.get("enabled", False) else None
 
 def process_text(text: str, caller: str):
+    if reply_cache is not None:
+        hit = reply_cache.get(text, caller)
+        if hit is not None:
+            return hit
     payload = {"caller": caller, "text": text}
-    r = requests.post(N8N_WEBHOOK, json=payload, timeout=10)
+    r = webhook_client().request("POST", N8N_WEBHOOK, json=payload, endpoint="webhook")
     r.raise_for_status()
     try:
         data = r.json()
-        return data.get("reply", str(data))
+        reply = data.get("reply", str(data))
+        hint = data.get("cache") if isinstance(data, dict) else None
     except Exception:
-        return r.text
+        reply, hint = r.text, None
+    if reply_cache is not None:
+        reply_cache.put(text, caller, reply, hint, r.headers.get("Cache-Control", ""))
+    return reply
+
+# ---------- Streaming-Antworten ----------
+def _delta(obj) -> str:
+    """Text aus einem Stream-Event: {"delta"|"text"|"content"|"reply": …} oder OpenAI-Chunk."""
+    if isinstance(obj, str):
+        return obj
+    if not isinstance(obj, dict):
+        return ""
+    for k in ("delta", "text", "content", "reply"):
+        v = obj.get(k)
+        if isinstance(v, str):
+            return v
+    try:
+        return obj["choices"][0]["delta"].get("content") or ""
+    except (KeyError, IndexError, TypeError, AttributeError):
+        return ""
+
+def _event(data: str) -> tuple[str, object]:
+    """Ein Stream-Event -> (Text, Cache-Hinweis | None)."""
+    try:
+        obj = json.loads(data)
+    except ValueError:
+        return data, None
+    return _delta(obj), obj.get("cache") if isinstance(obj, dict) else None
+
+def _sse(r) -> Iterator[tuple[str, object]]:
+    data = []
+    for line in r.iter_lines(decode_unicode=True):
+        if line:
+            if line.startswith("data:"):
+                data.append(line[5:].removeprefix(" "))
+            continue
+        if not data:
+            continue
+        ev, data = "\n".join(data), []
+        if ev.strip() == "[DONE]":
+            return
+        yield _event(ev)
+    if data and "\n".join(data).strip() != "[DONE]":
+        yield _event("\n".join(data))
+
+def _chunks(r) -> Iterator[tuple[str, object]]:
+    ctype = r.headers.get("Content-Type", "")
+    if "charset" not in ctype:
+        r.encoding = "utf-8"
+    mime = ctype.split(";", 1)[0].strip().lower()
+    if mime == "text/event-stream":
+        yield from _sse(r)
+    elif mime in ("application/x-ndjson", "application/jsonl", "application/jsonlines"):
+        for line in r.iter_lines(decode_unicode=True):
+            if line.strip():
+                yield _event(line)
+    elif mime == "application/json":
+        data = json.loads(r.content or b"{}")
+        if isinstance(data, dict):
+            yield data.get("reply", str(data)), data.get("cache")
+        else:
+            yield str(data), None
+    else:
+        for chunk in r.iter_content(chunk_size=None, decode_unicode=True):
+            if chunk:
+                yield chunk, None
+
+def iter_reply(text: str, caller: str) -> Iterator[str]:
+    """
+    Antwort des Webhooks in Stücken, sobald sie eintreffen: Server-Sent Events
+    (data: {"delta": "…"} bzw. OpenAI-Chunks, Ende mit [DONE]), NDJSON, chunked
+    text/plain – oder eine normale JSON-Antwort ({"reply": …}) als ein Stück.
+    Mit reply_cache: Treffer kommen als ein Stück, vollständige Antworten
+    werden (nach Cache-Hinweis) abgelegt.
+    """
+    if reply_cache is not None:
+        hit = reply_cache.get(text, caller)
+        if hit is not None:
+            yield hit
+            return
+    payload = {"caller": caller, "text": text, "stream": True}
+    r = webhook_client().request("POST", N8N_WEBHOOK, json=payload, endpoint="webhook",
+                                 stream=True, headers={"Accept": STREAM_ACCEPT})
+    parts, hint = [], None
+    with r:
+        r.raise_for_status()
+        for delta, h in _chunks(r):
+            hint = h if h is not None else hint
+            if delta:
+                parts.append(delta)
+                yield delta
+    if reply_cache is not None:
+        reply_cache.put(text, caller, "".join(parts), hint, r.headers.get("Cache-Control", ""))
+
+
+# Satzende: Satzzeichen (+ evtl. Anführungszeichen/Klammer) und Leerraum, oder Zeilenumbruch
+_BOUNDARY = re.compile(r"[.!?…]+[\"'»«“”)\]]*\s+|\n\s*")
+# kein Satzende: gängige Abkürzungen und Zahlen ("z.B.", "Nr.", "am 3. Mai")
+_NO_END = re.compile(r"(?:\b(?:z\.\s?B|d\.\s?h|u\.\s?a|bzw|ca|Dr|Nr|Hr|Fr|Str|St|Prof|usw|etc|vgl|evtl|"
+                     r"ggf|inkl|zzgl|Mio|Mrd|Tel|Jh|bspw|sog)|\d)\.$", re.IGNORECASE)
+
+class SentenceSplitter:
+    """
+    Zerlegt einen Text-Stream in Sätze: feed(delta) liefert die fertigen Sätze,
+    flush() den Rest. Sehr kurze Sätze (< min_chars, z.B. "Ja.") werden mit dem
+    nächsten zusammengefasst, zu lange ohne Satzende bei max_chars an einem
+    Komma bzw. Leerzeichen geteilt.
+    """
+    def __init__(self, min_chars: int = SENTENCE_MIN_CHARS, max_chars: int = SENTENCE_MAX_CHARS):
+        self.min_chars = int(min_chars)
+        self.max_chars = max(self.min_chars + 1, int(max_chars))
+        self._buf = ""
+
+    def feed(self, delta: str) -> list[str]:
+        self._buf += delta
+        out = []
+        start = 0
+        for m in _BOUNDARY.finditer(self._buf):
+            cand = self._buf[start:m.end()].strip()
+            if len(cand) < self.min_chars or _NO_END.search(cand):
+                continue
+            out.append(cand)
+            start = m.end()
+        self._buf = self._buf[start:]
+        while len(self._buf) > self.max_chars:
+            cut = max(self._buf.rfind(sep, 0, self.max_chars) for sep in (", ", "; ", ": ", " – "))
+            if cut < self.max_chars // 2:
+                cut = self._buf.rfind(" ", 0, self.max_chars)
+            if cut <= 0:
+                cut = self.max_chars
+            out.append(self._buf[:cut + 1].strip())
+            self._buf = self._buf[cut + 1:]
+        return [s for s in out if s]
+
+    def flush(self) -> list[str]:
+        rest, self._buf = self._buf.strip(), ""
+        return [rest] if rest else []
+
+def iter_sentences(text: str, caller: str) -> Iterator[str]:
+    """Antwort des Webhooks Satz für Satz (blockierend, für einen Worker-Thread)."""
+    sp = SentenceSplitter()
+    for delta in iter_reply(text, caller):
+        yield from sp.feed(delta)
+    yield from sp.flush()
@@ -0,0 +1,153 @@
+# -*- coding: utf-8 -*-
+import asyncio, logging, time
+from contextlib import asynccontextmanager
+from functools import lru_cache
+
+from wyoming.client import AsyncTcpClient
+from config import cfg
+
+log = logging.getLogger(__name__)
+
+
+class WyomingPool:
+    """
+    Wiederverwendbare Wyoming-TCP-Verbindungen (Piper/Whisper) für den
+    gemeinsamen Hintergrund-Loop. Vor der Ausgabe wird geprüft, ob eine
+    Verbindung noch offen und nicht zu lange unbenutzt ist. Server, die nach
+    einer Anfrage selbst schließen, fallen dadurch einfach aus dem Pool.
+    Nur auf dem Loop benutzen, auf dem die Verbindungen entstanden sind.
+    """
+    def __init__(self, host: str, port: int, size: int = 8, max_idle_s: float = 60.0,
+                 connect_timeout_s: float = 5.0, reuse: bool = True):
+        self.host = host
+        self.port = int(port)
+        self.size = size
+        self.max_idle_s = max_idle_s
+        self.connect_timeout_s = connect_timeout_s
+        self.reuse = reuse
+        self._idle: list[tuple[float, AsyncTcpClient]] = []
+        self.opened = 0
+        self.reused = 0
+
+    @staticmethod
+    def _healthy(c: AsyncTcpClient) -> bool:
+        r, w = getattr(c, "_reader", None), getattr(c, "_writer", None)
+        return r is not None and w is not None and not r.at_eof() and not w.is_closing()
+
+    async def acquire(self, fresh: bool = False) -> tuple[AsyncTcpClient, bool]:
+        """Liefert (client, wiederverwendet?); fresh = immer neu verbinden."""
+        now = time.monotonic()
+        while self._idle and not fresh:
+            t, c = self._idle.pop()
+            if now - t <= self.max_idle_s and self._healthy(c):
+                self.reused += 1
+                return c, True
+            await self._close(c)
+        return await self.open(), False
+
+    async def open(self) -> AsyncTcpClient:
+        """Neue Verbindung; Connect-Timeout per wait_for (ältere wyoming-1.x kennen connect_timeout nicht)."""
+        c = AsyncTcpClient(self.host, self.port)
+        await asyncio.wait_for(c.connect(), self.connect_timeout_s)
+        self.opened += 1
+        return c
+
+    async def release(self, c: AsyncTcpClient, reusable: bool = True):
+        if reusable and self.reuse and len(self._idle) < self.size and self._healthy(c):
+            self._idle.append((time.monotonic(), c))
+        else:
+            await self._close(c)
+
+    @asynccontextmanager
+    async def connection(self, fresh: bool = False):
+        """
+        Verbindung für genau eine Anfrage. Der Aufrufer setzt lease.done = True,
+        wenn die Antwort vollständig gelesen wurde; nur dann geht die
+        Verbindung zurück in den Pool. fresh: neue Verbindung statt Pool, für
+        Anfragen, die sich nicht wiederholen lassen (siehe with_retry).
+        """
+        c, reused = await self.acquire(fresh)
+        lease = Lease(c, reused)
+        try:
+            yield lease
+        finally:
+            await self.release(c, reusable=lease.done)
+
+    async def warm(self, n: int = 1):
+        """n Verbindungen vorab öffnen (z.B. beim Start); gleichzeitig gehalten, sonst wäre es nur eine."""
+        held = [await self.acquire() for _ in range(max(0, min(n, self.size) - len(self._idle)))]
+        for c, _ in held:
+            await self.release(c)
+
+    @staticmethod
+    async def _close(c: AsyncTcpClient):
+        try:
+            await c.disconnect()
+        except Exception:
+            pass
+
+
+class Lease:
+    """Eine ausgeliehene Verbindung; erkennt vom Server geschlossene Pool-Verbindungen."""
+    __slots__ = ("client", "reused", "received", "done")
+
+    def __init__(self, client: AsyncTcpClient, reused: bool):
+        self.client = client
+        self.reused = reused
+        self.received = False
+        self.done = False
+
+    async def write_event(self, event):
+        await self.client.write_event(event)
+
+    async def read_event(self):
+        ev = await self.client.read_event()
+        if ev is None and self.reused and not self.received:
+            raise ConnectionResetError("pooled wyoming connection closed by server")
+        self.received = True
+        return ev
+
+
+async def with_retry(pool: WyomingPool, fn):
+    """
+    fn(lease) mit einer Pool-Verbindung ausführen. Hatte der Server eine
+    wiederverwendete Verbindung inzwischen geschlossen (Fehler, bevor eine
+    Antwort kam), wird genau einmal mit einer neuen Verbindung wiederholt.
+    """
+    c, reused = await pool.acquire()
+    for attempt in (0, 1):
+        lease = Lease(c, reused)
+        try:
+            return await fn(lease)
+        except (ConnectionError, OSError, asyncio.IncompleteReadError):
+            if attempt or not reused or lease.received:
+                raise
+            log.info("[WYOMING] stale pooled connection, reconnecting")
+        finally:
+            await pool.release(c, reusable=lease.done)
+        c = await pool.open()
+        reused = False
+
+
+def _wy_cfg() -> dict:
+    return cfg()["wyoming"]
+
+def chunk_bytes(rate: int = 16000, width: int = 2) -> int:
+    """Größe eines AudioChunk-Events (wyoming.chunk_ms, Default 100 ms)."""
+    ms = int(_wy_cfg().get("chunk_ms", 100))
+    return max(1, rate * width * ms // 1000)
+
+def _pool(port_key: str) -> WyomingPool:
+    w = _wy_cfg()
+    return WyomingPool(w["host"], int(w[port_key]),
+                       size=int(w.get("pool_size", 8)),
+                       max_idle_s=float(w.get("max_idle_s", 60)),
+                       reuse=bool(w.get("reuse_connections", True)))
+
+@lru_cache(maxsize=1)
+def asr_pool() -> WyomingPool:
+    return _pool("asr_de")
+
+@lru_cache(maxsize=1)
+def tts_pool() -> WyomingPool:
+    return _pool("tts_de")
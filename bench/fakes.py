@@ -0,0 +1,551 @@
+# -*- coding: utf-8 -*-
+"""
+Gegenstellen für den Lasttest: Fake-ARI (HTTP + Websocket auf einem Port),
+Wyoming-ASR/TTS-Stubs, n8n-Webhook-Stub und synthetische RTP-Anrufer.
+Alles läuft in einem asyncio-Loop im Bench-Prozess.
+"""
+import asyncio, audioop, base64, hashlib, json, math, random, socket, struct, time, uuid
+from dataclasses import dataclass, field
+from urllib.parse import urlsplit, parse_qs
+
+from wyoming.server import AsyncServer, AsyncEventHandler
+from wyoming.asr import Transcript
+from wyoming.audio import AudioChunk, AudioStart, AudioStop
+
+WS_GUID = "258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+FRAME = 160          # 20 ms μ-law @8k
+FRAME_S = 0.020
+
+
+# ---------- minimaler HTTP/1.1-Server (Keep-Alive) mit optionalem Websocket ----------
+class HttpRequest:
+    __slots__ = ("method", "path", "query", "headers", "body")
+
+    def __init__(self, method, target, headers, body):
+        u = urlsplit(target)
+        self.method = method
+        self.path = u.path
+        self.query = {k: v[0] for k, v in parse_qs(u.query).items()}
+        self.headers = headers
+        self.body = body
+
+    def json(self):
+        return json.loads(self.body) if self.body else {}
+
+
+class WebSocket:
+    """Server-Seite eines Websockets: Text senden, Ping/Close beantworten."""
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+        self.closed = False
+
+    async def send(self, text: str):
+        if self.closed:
+            return
+        data = text.encode()
+        n = len(data)
+        if n < 126:
+            hdr = struct.pack("!BB", 0x81, n)
+        elif n < 65536:
+            hdr = struct.pack("!BBH", 0x81, 126, n)
+        else:
+            hdr = struct.pack("!BBQ", 0x81, 127, n)
+        try:
+            self.writer.write(hdr + data)
+            await self.writer.drain()
+        except (ConnectionError, RuntimeError):
+            self.closed = True
+
+    async def _frame(self, opcode: int, payload: bytes = b""):
+        self.writer.write(struct.pack("!BB", 0x80 | opcode, len(payload)) + payload)
+        await self.writer.drain()
+
+    async def serve(self):
+        # eingehende Frames (Client maskiert): nur Ping/Close sind interessant
+        try:
+            while True:
+                b0, b1 = await self.reader.readexactly(2)
+                n = b1 & 0x7F
+                if n == 126:
+                    n = struct.unpack("!H", await self.reader.readexactly(2))[0]
+                elif n == 127:
+                    n = struct.unpack("!Q", await self.reader.readexactly(8))[0]
+                mask = await self.reader.readexactly(4) if b1 & 0x80 else b"\0\0\0\0"
+                data = bytes(c ^ mask[i % 4] for i, c in enumerate(await self.reader.readexactly(n)))
+                op = b0 & 0x0F
+                if op == 0x9:
+                    await self._frame(0xA, data[:125])
+                elif op == 0x8:
+                    await self._frame(0x8, data[:2])
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        self.closed = True
+        self.writer.close()
+
+
+@dataclass
+class Streamed:
+    """Antwort mit Transfer-Encoding: chunked, Stücke aus einem async Iterator."""
+    content_type: str
+    chunks: object
+
+
+class MiniHttpServer:
+    """
+    handler(req) -> (status, obj|Streamed|None) für normale Requests;
+    ws_handler(req, ws) für Websocket-Upgrades.
+    """
+    def __init__(self, handler, ws_handler=None):
+        self.handler = handler
+        self.ws_handler = ws_handler
+        self.server = None
+
+    async def start(self, host: str, port: int):
+        self.server = await asyncio.start_server(self._conn, host, port, reuse_address=True)
+        return self
+
+    async def _conn(self, reader, writer):
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                method, target, _ = line.decode().split(" ", 2)
+                headers = {}
+                while True:
+                    h = await reader.readline()
+                    if h in (b"\r\n", b"\n", b""):
+                        break
+                    k, v = h.decode().split(":", 1)
+                    headers[k.strip().lower()] = v.strip()
+                n = int(headers.get("content-length", 0) or 0)
+                body = await reader.readexactly(n) if n else b""
+                req = HttpRequest(method, target, headers, body)
+
+                if headers.get("upgrade", "").lower() == "websocket" and self.ws_handler:
+                    key = headers["sec-websocket-key"]
+                    accept = base64.b64encode(hashlib.sha1((key + WS_GUID).encode()).digest()).decode()
+                    writer.write(("HTTP/1.1 101 Switching Protocols\r\nUpgrade: websocket\r\n"
+                                  f"Connection: Upgrade\r\nSec-WebSocket-Accept: {accept}\r\n\r\n").encode())
+                    await writer.drain()
+                    ws = WebSocket(reader, writer)
+                    await self.ws_handler(req, ws)
+                    return
+
+                status, obj = await self.handler(req)
+                if isinstance(obj, Streamed):
+                    writer.write((f"HTTP/1.1 {status} X\r\nContent-Type: {obj.content_type}\r\n"
+                                  "Transfer-Encoding: chunked\r\nConnection: keep-alive\r\n\r\n").encode())
+                    async for chunk in obj.chunks:
+                        writer.write(b"%x\r\n%s\r\n" % (len(chunk), chunk))
+                        await writer.drain()
+                    writer.write(b"0\r\n\r\n")
+                    await writer.drain()
+                    continue
+                data = json.dumps(obj).encode() if obj is not None else b""
+                writer.write((f"HTTP/1.1 {status} X\r\nContent-Type: application/json\r\n"
+                              f"Content-Length: {len(data)}\r\nConnection: keep-alive\r\n\r\n").encode() + data)
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    def close(self):
+        if self.server:
+            self.server.close()
+
+
+# ---------- Audio ----------
+def speech_ulaw(ms: int, seed: int = 0) -> bytes:
+    """Sprachähnliches Signal (Grundton + Obertöne, Silben-Hüllkurve) als 8k μ-law."""
+    rnd = random.Random(seed)
+    f0 = rnd.uniform(100, 180)
+    n = 8 * ms
+    pcm = bytearray()
+    for i in range(n):
+        t = i / 8000.0
+        env = 0.55 + 0.45 * math.sin(2 * math.pi * 4.0 * t)
+        s = sum(math.sin(2 * math.pi * f0 * k * t) / k for k in (1, 2, 3, 5))
+        pcm += struct.pack("<h", int(5000 * env * s + rnd.uniform(-200, 200)))
+    return audioop.lin2ulaw(bytes(pcm), 2)
+
+def load_ulaw(path: str) -> bytes:
+    """Aufnahme laden: .ulaw/.raw (8k μ-law) oder .wav (wird nach 8k μ-law gewandelt)."""
+    if not path.endswith(".wav"):
+        with open(path, "rb") as f:
+            return f.read()
+    import wave
+    with wave.open(path, "rb") as w:
+        pcm = w.readframes(w.getnframes())
+        width, ch, rate = w.getsampwidth(), w.getnchannels(), w.getframerate()
+    if ch == 2:
+        pcm = audioop.tomono(pcm, width, 0.5, 0.5)
+    if width != 2:
+        pcm = audioop.lin2lin(pcm, width, 2)
+    if rate != 8000:
+        pcm, _ = audioop.ratecv(pcm, 2, 1, rate, 8000, None)
+    return audioop.lin2ulaw(pcm, 2)
+
+
+# ---------- Wyoming-Stubs ----------
+@dataclass
+class StubDelays:
+    asr_ms: float = 150.0          # nach AudioStop bis Transcript
+    tts_first_ms: float = 80.0     # bis zum ersten Audio-Chunk
+    tts_rtf: float = 0.1           # Synthesezeit pro Sekunde Audio
+    tts_audio_ms: int = 1500       # Länge jeder Antwort
+    webhook_ms: float = 300.0      # Antwortzeit; mit webhook_stream: bis zum ersten Token
+    webhook_stream: bool = False   # Antwort als SSE, Token für Token
+    token_ms: float = 30.0
+    jitter: float = 0.2            # ± Anteil Zufall auf alle Delays
+    close_after_reply: bool = False
+
+    def d(self, ms: float) -> float:
+        return max(0.0, ms * (1 + random.uniform(-self.jitter, self.jitter))) / 1000.0
+
+
+class _AsrHandler(AsyncEventHandler):
+    def __init__(self, delays: StubDelays, stats: dict, *args):
+        super().__init__(*args)
+        self.delays = delays
+        self.stats = stats
+
+    async def handle_event(self, ev) -> bool:
+        if ev.type == "audio-stop":
+            await asyncio.sleep(self.delays.d(self.delays.asr_ms))
+            self.stats["asr"] += 1
+            await self.write_event(Transcript(text="Hallo Freya, wie spät ist es?").event())
+            return not self.delays.close_after_reply
+        return True
+
+
+class _TtsHandler(AsyncEventHandler):
+    RATE = 22050
+
+    def __init__(self, delays: StubDelays, stats: dict, *args):
+        super().__init__(*args)
+        self.delays = delays
+        self.stats = stats
+
+    async def handle_event(self, ev) -> bool:
+        if ev.type != "synthesize":
+            return True
+        d = self.delays
+        await asyncio.sleep(d.d(d.tts_first_ms))
+        await self.write_event(AudioStart(rate=self.RATE, width=2, channels=1).event())
+        chunk_ms = 100
+        tone = struct.pack("<h", 3000) * (self.RATE * chunk_ms // 1000)
+        for i in range(max(1, d.tts_audio_ms // chunk_ms)):
+            if i:
+                await asyncio.sleep(d.d(chunk_ms * d.tts_rtf))
+            await self.write_event(AudioChunk(rate=self.RATE, width=2, channels=1, audio=tone).event())
+        await self.write_event(AudioStop().event())
+        self.stats["tts"] += 1
+        return not d.close_after_reply
+
+
+async def start_wyoming(host: str, asr_port: int, tts_port: int, delays: StubDelays, stats: dict):
+    asr = AsyncServer.from_uri(f"tcp://{host}:{asr_port}")
+    tts = AsyncServer.from_uri(f"tcp://{host}:{tts_port}")
+    await asr.start(lambda *a: _AsrHandler(delays, stats, *a))
+    await tts.start(lambda *a: _TtsHandler(delays, stats, *a))
+    return asr, tts
+
+
+# ---------- n8n-Webhook-Stub ----------
+async def start_webhook(host: str, port: int, delays: StubDelays, stats: dict) -> MiniHttpServer:
+    async def handler(req: HttpRequest):
+        await asyncio.sleep(delays.d(delays.webhook_ms))
+        stats["webhook"] += 1
+        n = stats["webhook"]
+        # jede Antwort anders, damit der TTS-Cache nicht alles abfängt
+        reply = f"Antwort {n}: Es ist {n % 24} Uhr und {n % 60} Minuten."
+        if not delays.webhook_stream:
+            return 200, {"reply": reply}
+        reply += " Das Wetter bleibt heute trocken. Kann ich sonst noch helfen?"
+
+        async def tokens():
+            for i, tok in enumerate(reply.split(" ")):
+                if i:
+                    await asyncio.sleep(delays.d(delays.token_ms))
+                yield b"data: " + json.dumps({"delta": ("" if not i else " ") + tok}).encode() + b"\n\n"
+            yield b"data: [DONE]\n\n"
+        return 200, Streamed("text/event-stream", tokens())
+    return await MiniHttpServer(handler).start(host, port)
+
+
+# ---------- synthetische Anrufer ----------
+@dataclass
+class CallResult:
+    call_id: str
+    setup_ms: float | None = None          # StasisStart -> erstes Paket der Begrüßung
+    response_ms: list = field(default_factory=list)   # Ende der Äußerung -> erstes Antwort-Paket
+    turns_ok: int = 0
+    turns_failed: int = 0
+    rx_packets: int = 0
+    rx_jitter_ms: float = 0.0              # Jitter der empfangenen TTS-Pakete (RFC 3550-Stil)
+    done: bool = False
+    failed: str = ""
+
+
+class RtpCaller(asyncio.DatagramProtocol):
+    """
+    Spielt die Asterisk-Seite eines externalMedia-Channels: sendet alle 20 ms ein
+    μ-law-Paket (Sprache oder Stille) an die App und misst die Antworten.
+    Ablauf: Begrüßung abwarten, dann 'turns' mal sprechen -> auf Antwort warten
+    -> Antwort ausspielen lassen -> kurze Pause.
+    """
+    QUIET_S = 0.3        # so lange kein Paket = Antwort zu Ende
+
+    def __init__(self, result: CallResult, speech: bytes, turns: int, reply_timeout_s: float,
+                 t_start: float, on_done):
+        self.r = result
+        self.speech = speech
+        self.turns = turns
+        self.reply_timeout_s = reply_timeout_s
+        self.t_start = t_start
+        self.on_done = on_done
+        self.transport = None
+        self.dst = None
+        self.seq = random.randint(0, 65535)
+        self.ts = random.randint(0, 2**31)
+        self.ssrc = random.getrandbits(32)
+        self.state = "greeting"
+        self.t_state = time.monotonic()
+        self.pos = 0
+        self.turn = 0
+        self.last_rx = 0.0
+        self.t_eos = 0.0
+        self._prev_rx = None
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    # RX: Pakete der App (TTS)
+    def datagram_received(self, data, addr):
+        now = time.monotonic()
+        self.r.rx_packets += 1
+        if self._prev_rx is not None:
+            d = abs((now - self._prev_rx) - FRAME_S) * 1000.0
+            if d < 200:   # Pausen zwischen Äußerungen ignorieren
+                self.r.rx_jitter_ms += (d - self.r.rx_jitter_ms) / 16.0
+        self._prev_rx = now
+        self.last_rx = now
+        if self.state == "greeting" and self.r.setup_ms is None:
+            self.r.setup_ms = (now - self.t_start) * 1000.0
+        elif self.state == "wait_reply":
+            self.r.response_ms.append((now - self.t_eos) * 1000.0)
+            self.r.turns_ok += 1
+            self._set("reply")
+
+    def _set(self, state):
+        self.state = state
+        self.t_state = time.monotonic()
+
+    def tick(self, now: float):
+        """Ein 20ms-Schritt: Zustand weiterschalten und ein Paket senden."""
+        st = self.state
+        payload = None
+        if st in ("greeting", "reply"):
+            if self.last_rx and now - self.last_rx > self.QUIET_S:
+                self._set("pause")
+            elif now - self.t_state > self.reply_timeout_s:
+                if st == "greeting":
+                    self.r.failed = "no greeting"
+                    return self._finish()
+                self._set("pause")
+        elif st == "pause" and now - self.t_state > 0.5:
+            if self.turn >= self.turns:
+                return self._finish()
+            self.turn += 1
+            self.pos = 0
+            self._set("speak")
+        elif st == "speak":
+            payload = self.speech[self.pos:self.pos + FRAME]
+            self.pos += FRAME
+            if self.pos >= len(self.speech):
+                self.t_eos = now
+                self._set("wait_reply")
+        elif st == "wait_reply" and now - self.t_state > self.reply_timeout_s:
+            self.r.turns_failed += 1
+            self._set("pause")
+        if payload is None or len(payload) < FRAME:
+            payload = b"\xff" * FRAME
+        hdr = struct.pack("!BBHII", 0x80, 0, self.seq, self.ts, self.ssrc)
+        self.seq = (self.seq + 1) & 0xFFFF
+        self.ts = (self.ts + FRAME) & 0xFFFFFFFF
+        self.transport.sendto(hdr + payload, self.dst)
+        return True
+
+    def _finish(self):
+        self.r.done = True
+        self.on_done(self)
+        return False
+
+
+# ---------- Fake-ARI ----------
+class FakeAri:
+    """
+    Emuliert die von ari_app benutzten ARI-Endpunkte und Events:
+    StasisStart (Anrufer / externalMedia), ChannelEnteredBridge, Hangup.
+    Wird externalMedia in eine Bridge mit einem Anrufer gelegt, startet dessen
+    RtpCaller auf einem eigenen UDP-Socket (= UNICASTRTP_LOCAL_PORT).
+    """
+    def __init__(self, app: str, speech: bytes, turns: int = 3, reply_timeout_s: float = 10.0):
+        self.app = app
+        self.speech = speech
+        self.turns = turns
+        self.reply_timeout_s = reply_timeout_s
+        self.sockets: set[WebSocket] = set()
+        self.bridges: dict[str, list] = {}
+        self.ext: dict[str, dict] = {}       # ext_id -> {sock, dst}
+        self.callers: dict[str, CallResult] = {}
+        self.t_start: dict[str, float] = {}
+        self.active: dict[str, RtpCaller] = {}
+        self.results: list[CallResult] = []
+        self.http_requests = 0
+        self.connected = asyncio.Event()
+        self._ticker = None
+
+    async def start(self, host: str, port: int):
+        self.server = await MiniHttpServer(self._http, self._ws).start(host, port)
+        self._ticker = asyncio.create_task(self._tick_loop())
+        return self
+
+    def close(self):
+        self.server.close()
+        if self._ticker:
+            self._ticker.cancel()
+        for c in list(self.active.values()):
+            c.transport.close()
+
+    async def _ws(self, req, ws: WebSocket):
+        self.sockets.add(ws)
+        self.connected.set()
+        await ws.serve()
+        self.sockets.discard(ws)
+
+    async def emit(self, ev: dict):
+        ev.setdefault("application", self.app)
+        text = json.dumps(ev)
+        for ws in list(self.sockets):
+            await ws.send(text)
+
+    # --- Anrufe ---
+    async def place_call(self) -> str:
+        cid = f"caller-{uuid.uuid4().hex[:12]}"
+        self.callers[cid] = CallResult(cid)
+        self.t_start[cid] = time.monotonic()
+        num = f"0170{random.randint(1000000, 9999999)}"
+        await self.emit({"type": "StasisStart", "args": [],
+                         "channel": {"id": cid, "name": f"PJSIP/fritz-{cid[-8:]}",
+                                     "caller": {"number": num}}})
+        return cid
+
+    async def hangup(self, cid: str):
+        ch = {"id": cid, "name": f"PJSIP/fritz-{cid[-8:]}"}
+        await self.emit({"type": "ChannelHangupRequest", "channel": ch})
+        await self.emit({"type": "StasisEnd", "channel": ch})
+
+    def _caller_done(self, c: RtpCaller):
+        cid = c.r.call_id
+        self.active.pop(cid, None)
+        self.results.append(c.r)
+        asyncio.get_running_loop().call_soon(lambda: asyncio.ensure_future(self.hangup(cid)))
+        c.transport.close()
+
+    async def _tick_loop(self):
+        # ein Takt für alle Anrufer: absolute Deadlines, kein Drift
+        nxt = time.monotonic()
+        while True:
+            nxt += FRAME_S
+            now = time.monotonic()
+            for c in list(self.active.values()):
+                c.tick(now)
+            delay = nxt - time.monotonic()
+            if delay < -0.1:
+                nxt = time.monotonic()
+            await asyncio.sleep(max(0.0, delay))
+
+    async def _start_caller(self, cid: str, ext_id: str):
+        e = self.ext[ext_id]
+        loop = asyncio.get_running_loop()
+        r = self.callers[cid]
+        c = RtpCaller(r, self.speech, self.turns, self.reply_timeout_s, self.t_start[cid], self._caller_done)
+        c.dst = e["dst"]
+        e["caller"] = c
+        await loop.create_datagram_endpoint(lambda: c, sock=e["sock"])
+        self.active[cid] = c
+
+    # --- REST ---
+    async def _http(self, req: HttpRequest):
+        self.http_requests += 1
+        p = req.path.split("/ari", 1)[-1]
+        parts = [x for x in p.split("/") if x]
+        m = req.method
+
+        if m == "GET" and parts == ["asterisk", "info"]:
+            return 200, {"system": {"version": "fake"}, "status": {"startup_time": ""}}
+        if m == "POST" and parts == ["bridges"]:
+            bid = str(uuid.uuid4())
+            self.bridges[bid] = []
+            return 200, {"id": bid, "bridge_type": req.query.get("type", "mixing"), "channels": []}
+        if len(parts) == 3 and parts[0] == "bridges" and parts[2] == "addChannel" and m == "POST":
+            bid, ch = parts[1], req.query.get("channel")
+            if bid not in self.bridges:
+                return 404, {"message": "Bridge not found"}
+            self.bridges[bid].append(ch)
+            if ch in self.ext:
+                await self.emit({"type": "ChannelEnteredBridge", "channel": {"id": ch},
+                                 "bridge": {"id": bid}})
+                cid = next((c for c in self.bridges[bid] if c in self.callers), None)
+                if cid:
+                    await self._start_caller(cid, ch)
+            return 204, None
+        if len(parts) == 2 and parts[0] == "bridges":
+            if m == "DELETE":
+                self.bridges.pop(parts[1], None)
+                return 204, None
+            chans = self.bridges.get(parts[1])
+            return (200, {"id": parts[1], "channels": [{"id": c} for c in chans]}) if chans is not None \
+                else (404, {"message": "Bridge not found"})
+        if m == "POST" and parts == ["channels", "externalMedia"]:
+            ext_id = req.query.get("channelId") or str(uuid.uuid4())
+            host, port = req.query["external_host"].rsplit(":", 1)
+            s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            s.bind(("127.0.0.1", 0))
+            s.setblocking(False)
+            self.ext[ext_id] = {"sock": s, "dst": (host, int(port))}
+            ch = {"id": ext_id, "name": f"UnicastRTP/{host}:{port}-{ext_id[:8]}", "caller": {"number": ""}}
+            asyncio.get_running_loop().call_soon(
+                lambda: asyncio.ensure_future(self.emit({"type": "StasisStart", "args": [], "channel": ch})))
+            return 200, ch
+        if len(parts) == 3 and parts[0] == "channels" and parts[2] == "variable":
+            e = self.ext.get(parts[1])
+            if e is None:
+                return 404, {"message": "Channel not found"}
+            var = req.query.get("variable")
+            addr = e["sock"].getsockname()
+            return 200, {"value": addr[0] if var.endswith("ADDRESS") else str(addr[1])}
+        if len(parts) == 3 and parts[0] == "channels" and parts[2] == "play" and m == "POST":
+            # Ansage von Asterisk (z.B. Besetzt-Ansage bei Überlast): nur quittieren
+            if parts[1] not in self.callers:
+                return 404, {"message": "Channel not found"}
+            return 201, {"id": str(uuid.uuid4()), "media_uri": req.query.get("media", ""), "state": "queued"}
+        if len(parts) == 2 and parts[0] == "channels" and m == "DELETE":
+            ch = parts[1]
+            e = self.ext.pop(ch, None)
+            if e is not None and "caller" not in e:
+                e["sock"].close()
+            if e is None and ch in self.callers and ch not in self.active:
+                # von der App abgewiesen (z.B. congestion)
+                r = self.callers[ch]
+                if not r.done:
+                    r.failed = f"rejected ({req.query.get('reason', '')})"
+                    r.done = True
+                    self.results.append(r)
+            return 204, None
+        return 404, {"message": f"not emulated: {m} {req.path}"}
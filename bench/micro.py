@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Micro-Benchmarks der Hot-Paths (pro Call und Paket): RTP-Empfang
+(parse_rtp + JitterBuffer + μ-law->PCM), Segmenter, Barge-in-Detector und
+TTS-Pfad (Wyoming-Stub -> 8k μ-law, inkl. Pool). Ergebnis in µs pro Operation.
+
+Als Gate: --save legt eine Baseline an, --baseline vergleicht dagegen und
+endet mit Exit 1, wenn ein Wert um mehr als --tolerance schlechter ist.
+
+    python bench/micro.py --save bench/baseline_micro.json
+    python bench/micro.py --baseline bench/baseline_micro.json --tolerance 0.5
+"""
+import argparse, asyncio, json, os, struct, sys, tempfile, time
+from pathlib import Path
+
+import yaml
+
+import fakes
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT / "ari_application"))
+
+
+def _timeit(fn, n: int, repeat: int = 7) -> float:
+    """Bester Wert aus 'repeat' Läufen, in µs pro Operation."""
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn(n)
+        best = min(best, time.perf_counter() - t0)
+    return best / n * 1e6
+
+def _packets(n: int, speech: bytes) -> list[bytes]:
+    out = []
+    for i in range(n):
+        off = (i * 160) % (len(speech) - 160)
+        out.append(struct.pack("!BBHII", 0x80, 0, i & 0xFFFF, i * 160, 1234) + speech[off:off + 160])
+    return out
+
+def bench_rtp(speech: bytes, rate: int) -> float:
+    from ari_rtp import parse_rtp, JitterBuffer
+    from ari_rtpreceiver import UlawTo16k
+    pkts = _packets(2000, speech)
+    frames = []
+
+    def run(n):
+        jb = JitterBuffer()
+        conv = UlawTo16k(frames.append, rate)
+        frames.clear()
+        t = 0.0
+        for i in range(n):
+            p = parse_rtp(memoryview(pkts[i % len(pkts)]))
+            t += 0.02
+            conv.feed(jb.push(p, t))
+    return _timeit(run, 2000)
+
+def bench_segmenter(speech: bytes, rate: int) -> float:
+    import audioop
+    from ari_segmenter import Segmenter, SegmenterConfig
+    pcm = audioop.ulaw2lin(speech, 2)
+    if rate != 8000:
+        pcm, _ = audioop.ratecv(pcm, 2, 1, 8000, rate, None)
+    silence = bytes(len(pcm) // 2)
+    stream = pcm + silence
+    fb = rate * 2 // 50
+    frames = [stream[i:i + fb] for i in range(0, len(stream) - fb, fb)]
+
+    def run(n):
+        seg = Segmenter(lambda s: None, SegmenterConfig(rate=rate))
+        for i in range(n):
+            seg.feed20ms(frames[i % len(frames)])
+    return _timeit(run, 3000)
+
+def bench_bargein(speech: bytes, rate: int) -> float:
+    import audioop
+    from ari_segmenter import Segmenter, SegmenterConfig
+    from ari_bargein import BargeInDetector, BargeInConfig
+    pcm = audioop.ulaw2lin(speech, 2)
+    if rate != 8000:
+        pcm, _ = audioop.ratecv(pcm, 2, 1, 8000, rate, None)
+    fb = rate * 2 // 50
+    frames = [pcm[i:i + fb] for i in range(0, len(pcm) - fb, fb)]
+
+    def run(n):
+        seg = Segmenter(lambda s: None, SegmenterConfig(rate=rate))
+        det = BargeInDetector(seg, BargeInConfig(enabled=True, min_ms=10**9),
+                              is_playing=lambda: True, on_barge_in=lambda: None)
+        for i in range(n):
+            det.feed20ms(frames[i % len(frames)])
+    return _timeit(run, 3000)
+
+def bench_tts(n_utt: int = 20) -> float:
+    """µs pro Sekunde erzeugtem Audio über den ganzen ari_tts-Pfad (Stub ohne Verzögerung)."""
+    import ari_aio, ari_tts
+    ari_tts.tts_cache = None
+    out = []
+
+    def run(n):
+        for i in range(n):
+            ari_aio.run(ari_tts._tts_ulaw_chunks(f"Satz {i}", out.append))
+    us = _timeit(run, n_utt, repeat=3)
+    return us / (fakes.StubDelays.tts_audio_ms / 1000.0)
+
+async def _start_stub(port: int):
+    d = fakes.StubDelays(asr_ms=0, tts_first_ms=0, tts_rtf=0, webhook_ms=0, jitter=0)
+    await fakes.start_wyoming("127.0.0.1", port + 100, port, d, {"asr": 0, "tts": 0})
+    await asyncio.Event().wait()
+
+def main(argv=None) -> int:
+    p = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    p.add_argument("--rate", type=int, default=16000, choices=(8000, 16000))
+    p.add_argument("--tts-port", type=int, default=20210)
+    p.add_argument("--save", default="", help="Ergebnis als Baseline speichern")
+    p.add_argument("--baseline", default="", help="gegen diese Baseline prüfen")
+    p.add_argument("--tolerance", type=float, default=0.5, help="erlaubte Verschlechterung (0.3 = +30%%)")
+    a = p.parse_args(argv)
+
+    # ari_tts liest die Config beim Import -> vorher auf den Stub zeigen lassen
+    with open(ROOT / "config" / "freya.yaml", encoding="utf-8") as f:
+        c = yaml.safe_load(f)
+    c["wyoming"].update(host="127.0.0.1", tts_de=a.tts_port, asr_de=a.tts_port + 100)
+    with tempfile.NamedTemporaryFile("w", suffix=".yaml", delete=False) as f:
+        yaml.safe_dump(c, f, allow_unicode=True)
+    os.environ["FREYA_CONFIG"] = f.name
+
+    import ari_aio
+    stub = ari_aio.submit(_start_stub(a.tts_port))
+    time.sleep(0.3)
+
+    speech = fakes.speech_ulaw(1500)
+    res = {
+        "rtp_rx_us_per_packet": bench_rtp(speech, a.rate),
+        "segmenter_us_per_frame": bench_segmenter(speech, a.rate),
+        "bargein_us_per_frame": bench_bargein(speech, a.rate),
+        "tts_us_per_audio_s": bench_tts(),
+    }
+    stub.cancel()
+    os.unlink(f.name)
+    res = {k: round(v, 2) for k, v in res.items()}
+    for k, v in res.items():
+        print(f"[MICRO] {k:28s} {v:10.2f}")
+
+    if a.save:
+        with open(a.save, "w") as f:
+            json.dump(res, f, indent=2)
+    if a.baseline:
+        with open(a.baseline) as f:
+            base = json.load(f)
+        bad = [k for k, v in res.items() if k in base and v > base[k] * (1 + a.tolerance)]
+        for k in bad:
+            print(f"[MICRO] REGRESSION {k}: {res[k]} > {base[k]} * {1 + a.tolerance:.2f}")
+        return 1 if bad else 0
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,355 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Offline-Lasttest für ari_app: startet Fake-ARI, Wyoming-Stubs und einen
+Webhook-Stub, dann ari_app als Unterprozess gegen diese Gegenstellen, und
+schickt synthetische Anrufer (RTP μ-law) in Stufen (--ramp).
+
+Bericht pro Stufe: gehaltene Calls, Antwortlatenz aus Anrufersicht
+(Ende der Äußerung -> erstes Antwort-Paket), Stufen-Perzentile aus den
+freya.turn-Logzeilen, CPU und RSS von ari_app. Mit --min-sustained /
+--max-p95-ms wird der Exit-Code zum Regressions-Gate.
+
+Beispiel:
+    python bench/run_load.py --ramp 10,25,50 --turns 2 --json /tmp/bench.json
+"""
+import argparse, asyncio, json, os, re, sys, tempfile, time
+from pathlib import Path
+
+import yaml
+
+import fakes
+
+ROOT = Path(__file__).resolve().parent.parent
+APP_DIR = ROOT / "ari_application"
+TURN_RE = re.compile(r"freya\.turn turn (.*)$")
+
+
+def pct(values, p):
+    if not values:
+        return None
+    v = sorted(values)
+    return round(v[min(len(v) - 1, int(p / 100.0 * len(v)))], 1)
+
+def summary(values) -> dict:
+    return {"n": len(values), "p50": pct(values, 50), "p95": pct(values, 95), "p99": pct(values, 99),
+            "max": round(max(values), 1) if values else None}
+
+
+# ---------- ari_app-Prozess ----------
+class AppProcess:
+    """ari_app als Unterprozess; liest Turn-Logzeilen mit, misst CPU/RSS über /proc (inkl. Worker-Prozesse)."""
+    def __init__(self, config_path: str, log_path: str | None = None):
+        self.config_path = config_path
+        self.log_path = log_path
+        self.proc = None
+        self.turns: list[dict] = []
+        self.tail: list[str] = []
+        self.samples: list[tuple[float, float, float]] = []   # (t, cpu_s, rss_mb)
+        self._tasks = []
+
+    async def start(self):
+        env = dict(os.environ, FREYA_CONFIG=self.config_path, PYTHONUNBUFFERED="1")
+        env.setdefault("OPENAI_API_KEY", "bench")
+        self.proc = await asyncio.create_subprocess_exec(
+            sys.executable, "-u", "ari_app.py", cwd=str(APP_DIR), env=env,
+            stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.STDOUT)
+        self._tasks = [asyncio.create_task(self._read()), asyncio.create_task(self._sample())]
+
+    async def _read(self):
+        log = open(self.log_path, "w") if self.log_path else None
+        async for raw in self.proc.stdout:
+            line = raw.decode(errors="replace").rstrip()
+            if log:
+                log.write(line + "\n")
+            self.tail = (self.tail + [line])[-40:]
+            m = TURN_RE.search(line)
+            if m:
+                kv = dict(tok.split("=", 1) for tok in m.group(1).split() if "=" in tok)
+                kv["t"] = time.monotonic()
+                self.turns.append(kv)
+        if log:
+            log.close()
+
+    @staticmethod
+    def _stat(pid) -> list[str]:
+        with open(f"/proc/{pid}/stat") as f:
+            return f.read().rsplit(")", 1)[1].split()
+
+    def _pids(self) -> list[int]:
+        # ari_app selbst + direkte Kinder (Worker bei workers.count >= 2)
+        pids = [self.proc.pid]
+        for d in os.listdir("/proc"):
+            if d.isdigit():
+                try:
+                    if int(self._stat(d)[1]) == self.proc.pid:
+                        pids.append(int(d))
+                except (OSError, IndexError, ValueError):
+                    pass
+        return pids
+
+    def _proc_stat(self):
+        cpu_s, rss_mb = 0.0, 0.0
+        for i, pid in enumerate(self._pids()):
+            try:
+                fields = self._stat(pid)
+                cpu = (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+                with open(f"/proc/{pid}/status") as f:
+                    rss = next((int(line.split()[1]) / 1024.0 for line in f if line.startswith("VmRSS:")), 0.0)
+            except OSError:
+                if i == 0:
+                    raise
+                continue   # Worker gerade beendet
+            cpu_s += cpu
+            rss_mb += rss
+        return cpu_s, rss_mb
+
+    async def _sample(self):
+        while self.proc.returncode is None:
+            try:
+                cpu_s, rss = self._proc_stat()
+                self.samples.append((time.monotonic(), cpu_s, rss))
+            except (OSError, IndexError, ValueError):
+                pass   # kein /proc (nicht Linux) -> keine CPU/RSS-Werte
+            await asyncio.sleep(0.5)
+
+    def usage(self, t0: float, t1: float) -> dict:
+        s = [x for x in self.samples if t0 <= x[0] <= t1]
+        if len(s) < 2:
+            return {"cpu_pct": None, "rss_mb_peak": None}
+        cpu = (s[-1][1] - s[0][1]) / (s[-1][0] - s[0][0]) * 100.0
+        return {"cpu_pct": round(cpu, 1), "rss_mb_peak": round(max(x[2] for x in s), 1)}
+
+    async def stop(self):
+        if self.proc and self.proc.returncode is None:
+            self.proc.terminate()
+            try:
+                await asyncio.wait_for(self.proc.wait(), 5)
+            except asyncio.TimeoutError:
+                self.proc.kill()
+        for t in self._tasks:
+            t.cancel()
+
+
+# ---------- Konfiguration für ari_app ----------
+def build_config(a, max_calls: int) -> dict:
+    with open(ROOT / "config" / "freya.yaml", encoding="utf-8") as f:
+        c = yaml.safe_load(f)
+    c["ari"]["base"] = f"http://127.0.0.1:{a.ari_port}/ari"
+    c["media"].update(ext_host_ip="127.0.0.1", ext_host_port=a.rtp_port,
+                      ext_port_count=max_calls + 10, rate=a.rate)
+    c["wyoming"].update(host="127.0.0.1", asr_de=a.asr_port, tts_de=a.tts_port)
+    c["stt"].update(backend="wyoming", streaming=a.streaming, hedge={"backend": ""})
+    c["tts_cache"] = {"enabled": a.tts_cache, "dir": ""}
+    c["n8n"] = {"webhook_url": f"http://127.0.0.1:{a.webhook_port}/webhook/on_message",
+                "stream": a.webhook_stream}
+    c["metrics"] = {"port": a.metrics_port, "host": "127.0.0.1"}
+    c["logging"] = {"level": "INFO"}
+    c["barge_in"] = {"enabled": False}
+    c["journal"] = {"enabled": bool(a.journal), "dir": a.journal, "max_queue": a.journal_queue}
+    c["workers"] = {"count": a.workers}
+    c["admission"] = {**(c.get("admission") or {}), "max_turns_inflight": a.turn_budget,
+                      "max_waiting_turns": a.max_waiting_turns, "busy_hold_s": 0.2}
+    return c
+
+
+# ---------- Ablauf ----------
+def round_report(level: int, results: list, turns: list, usage: dict, slo_ms: float) -> dict:
+    resp = [x for r in results for x in r.response_ms]
+    setup = [r.setup_ms for r in results if r.setup_ms is not None]
+    # von der Admission abgewiesene Calls (Besetzt/Ablehnung) sind gewollt, keine Fehler
+    shed = [r for r in results if r.failed.startswith("rejected")]
+    failed = [r for r in results if r.failed and r not in shed]
+    turns_failed = sum(r.turns_failed for r in results)
+    stages = {}
+    for t in turns:
+        for k, v in t.items():
+            if k.endswith("_ms"):
+                stages.setdefault(k[:-3], []).append(float(v))
+    rep = {
+        "calls": level,
+        "completed": sum(1 for r in results if r.done and not r.failed),
+        "failed_calls": len(failed),
+        "shed_calls": len(shed),
+        "failures": sorted({r.failed for r in failed}),
+        "turns_ok": sum(r.turns_ok for r in results),
+        "turns_failed": turns_failed,
+        "response_ms": summary(resp),
+        "setup_ms": summary(setup),
+        "rx_jitter_ms": round(sum(r.rx_jitter_ms for r in results) / len(results), 2) if results else None,
+        "stages_ms": {k: summary(v) for k, v in sorted(stages.items())},
+        "turn_results": {res: sum(1 for t in turns if t.get("result") == res)
+                         for res in sorted({t.get("result") for t in turns})},
+        **usage,
+    }
+    p95 = rep["response_ms"]["p95"]
+    rep["ok"] = not failed and not turns_failed and p95 is not None and p95 <= slo_ms
+    return rep
+
+async def run_round(ari: fakes.FakeAri, app: AppProcess, level: int, a) -> dict:
+    ari.results.clear()
+    t0 = time.monotonic()
+    n_turns = len(app.turns)
+    ids = []
+    for _ in range(level):
+        ids.append(await ari.place_call())
+        await asyncio.sleep(1.0 / a.cps)
+    deadline = t0 + a.round_timeout
+    while len(ari.results) < level and time.monotonic() < deadline:
+        await asyncio.sleep(0.2)
+    for cid in ids:   # nicht fertig gewordene Anrufer abbrechen
+        r = ari.callers[cid]
+        if not r.done:
+            r.failed = r.failed or "timeout"
+            c = ari.active.get(cid)
+            if c:
+                c._finish()
+            else:
+                ari.results.append(r)
+    await asyncio.sleep(1.0)   # Hangup/Cleanup abwarten
+    t1 = time.monotonic()
+    results = [ari.callers[c] for c in ids]
+    return round_report(level, results, app.turns[n_turns:], app.usage(t0, t1), a.slo_p95_ms)
+
+async def scrape_metrics(port: int, workers: int = 0) -> dict:
+    """
+    Ein paar Zähler aus /metrics von ari_app (RTP-Verluste, späte Playout-Pakete);
+    mit Workern summiert über deren Ports (port+1 …) plus die Worker-Last vom Master.
+    """
+    ports = [port] + [port + 1 + i for i in range(workers if workers > 1 else 0)]
+    out = {}
+    for p in ports:
+        try:
+            r, w = await asyncio.open_connection("127.0.0.1", p)
+            w.write(b"GET /metrics HTTP/1.0\r\n\r\n")
+            body = (await r.read()).decode()
+            w.close()
+        except OSError:
+            continue
+        for line in body.splitlines():
+            if line.startswith(("freya_rtp_packets_total", "freya_playout_packets_total",
+                                "freya_segments_total", "freya_stage_timeouts_total",
+                                "freya_worker_cpu_seconds_total", "freya_worker_restarts_total")):
+                k, v = line.rsplit(" ", 1)
+                out[k] = out.get(k, 0.0) + float(v)
+    return out
+
+async def main_async(a) -> dict:
+    levels = [int(x) for x in a.ramp.split(",")] if a.ramp else [a.calls]
+    delays = fakes.StubDelays(asr_ms=a.asr_ms, tts_first_ms=a.tts_first_ms, tts_rtf=a.tts_rtf,
+                              tts_audio_ms=a.tts_audio_ms, webhook_ms=a.webhook_ms,
+                              jitter=a.jitter, close_after_reply=a.close_after_reply,
+                              webhook_stream=a.webhook_stream, token_ms=a.token_ms)
+    stats = {"asr": 0, "tts": 0, "webhook": 0}
+    speech = fakes.load_ulaw(a.speech) if a.speech else fakes.speech_ulaw(a.speech_ms)
+
+    cfg = build_config(a, max(levels))
+    with tempfile.NamedTemporaryFile("w", suffix=".yaml", delete=False) as f:
+        yaml.safe_dump(cfg, f, allow_unicode=True)
+        cfg_path = f.name
+
+    await fakes.start_wyoming("127.0.0.1", a.asr_port, a.tts_port, delays, stats)
+    await fakes.start_webhook("127.0.0.1", a.webhook_port, delays, stats)
+    ari = await fakes.FakeAri(cfg["ari"]["app"], speech, a.turns, a.reply_timeout).start("127.0.0.1", a.ari_port)
+    app = AppProcess(cfg_path, a.log)
+    await app.start()
+    report = {"levels": [], "config": {k: v for k, v in vars(a).items() if k != "json"}}
+    try:
+        try:
+            await asyncio.wait_for(ari.connected.wait(), a.start_timeout)
+        except asyncio.TimeoutError:
+            raise SystemExit("ari_app did not connect to the fake ARI:\n" + "\n".join(app.tail))
+        for level in levels:
+            rep = await run_round(ari, app, level, a)
+            report["levels"].append(rep)
+            print_round(rep)
+            if not rep["ok"] and a.stop_on_fail:
+                break
+        report["metrics"] = await scrape_metrics(a.metrics_port, a.workers)
+    finally:
+        await app.stop()
+        ari.close()
+        os.unlink(cfg_path)
+    report["stubs"] = stats
+    ok_levels = [r["calls"] for r in report["levels"] if r["ok"]]
+    report["sustained_calls"] = max(ok_levels) if ok_levels else 0
+    return report
+
+def print_round(r: dict):
+    rm, st = r["response_ms"], r["stages_ms"]
+    stage_txt = " ".join(f"{k}={v['p95']}" for k, v in st.items() if k not in ("eos",))
+    print(f"[BENCH] calls={r['calls']:4d} ok={r['ok']!s:5} completed={r['completed']} "
+          f"failed={r['failed_calls']} shed={r['shed_calls']} turns={r['turns_ok']}/{r['turns_ok'] + r['turns_failed']} "
+          f"resp p50/p95/p99={rm['p50']}/{rm['p95']}/{rm['p99']}ms setup p95={r['setup_ms']['p95']}ms "
+          f"cpu={r['cpu_pct']}% rss={r['rss_mb_peak']}MB")
+    print(f"        stage p95 (ms): {stage_txt}")
+    if r["failures"]:
+        print(f"        failures: {', '.join(r['failures'])}")
+
+def parse_args(argv=None):
+    p = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    p.add_argument("--calls", type=int, default=10, help="gleichzeitige Anrufer (ohne --ramp)")
+    p.add_argument("--ramp", default="", help="Stufen, z.B. 10,25,50")
+    p.add_argument("--turns", type=int, default=2, help="Äußerungen pro Anruf")
+    p.add_argument("--cps", type=float, default=20.0, help="neue Anrufe pro Sekunde")
+    p.add_argument("--speech", default="", help="Aufnahme (.wav oder 8k .ulaw) statt synthetischer Sprache")
+    p.add_argument("--speech-ms", type=int, default=1500)
+    p.add_argument("--rate", type=int, default=16000, choices=(8000, 16000), help="media.rate für ari_app")
+    p.add_argument("--streaming", action="store_true", help="stt.streaming einschalten")
+    p.add_argument("--tts-cache", action="store_true", help="TTS-Cache in ari_app einschalten")
+    p.add_argument("--journal", default="", help="Journal in dieses Verzeichnis schreiben")
+    p.add_argument("--journal-queue", type=int, default=20000)
+    p.add_argument("--turn-budget", type=int, default=32, help="admission.max_turns_inflight (0 = aus)")
+    p.add_argument("--max-waiting-turns", type=int, default=4, help="admission.max_waiting_turns")
+    p.add_argument("--workers", type=int, default=0, help="workers.count für ari_app (>= 2: Supervisor + Worker)")
+    # Verzögerungen der Gegenstellen
+    p.add_argument("--asr-ms", type=float, default=150.0)
+    p.add_argument("--tts-first-ms", type=float, default=80.0)
+    p.add_argument("--tts-rtf", type=float, default=0.1)
+    p.add_argument("--tts-audio-ms", type=int, default=1500)
+    p.add_argument("--webhook-ms", type=float, default=300.0)
+    p.add_argument("--webhook-stream", action="store_true",
+                   help="Webhook antwortet als SSE (webhook-ms bis zum ersten Token), n8n.stream an")
+    p.add_argument("--token-ms", type=float, default=30.0)
+    p.add_argument("--jitter", type=float, default=0.2)
+    p.add_argument("--close-after-reply", action="store_true", help="Wyoming-Stubs schließen nach jeder Antwort")
+    # Ports
+    p.add_argument("--ari-port", type=int, default=18088)
+    p.add_argument("--asr-port", type=int, default=20300)
+    p.add_argument("--tts-port", type=int, default=20200)
+    p.add_argument("--webhook-port", type=int, default=15678)
+    p.add_argument("--metrics-port", type=int, default=19108)
+    p.add_argument("--rtp-port", type=int, default=32000)
+    # Zeiten, Gate
+    p.add_argument("--reply-timeout", type=float, default=10.0)
+    p.add_argument("--round-timeout", type=float, default=120.0)
+    p.add_argument("--start-timeout", type=float, default=30.0)
+    p.add_argument("--slo-p95-ms", type=float, default=1500.0, help="Stufe gilt als gehalten bis zu dieser p95-Antwortlatenz")
+    p.add_argument("--stop-on-fail", action="store_true")
+    p.add_argument("--min-sustained", type=int, default=0, help="Gate: Exit 1, wenn weniger Calls gehalten")
+    p.add_argument("--max-p95-ms", type=float, default=0, help="Gate: Exit 1, wenn p95 einer Stufe darüber")
+    p.add_argument("--json", default="", help="Bericht als JSON schreiben")
+    p.add_argument("--log", default="", help="Ausgabe von ari_app in diese Datei")
+    return p.parse_args(argv)
+
+def main(argv=None) -> int:
+    a = parse_args(argv)
+    report = asyncio.run(main_async(a))
+    print(f"[BENCH] sustained calls: {report['sustained_calls']}  stubs: {report['stubs']}")
+    if a.json:
+        with open(a.json, "w") as f:
+            json.dump(report, f, indent=2)
+    errors = []
+    if a.min_sustained and report["sustained_calls"] < a.min_sustained:
+        errors.append(f"sustained {report['sustained_calls']} < {a.min_sustained}")
+    if a.max_p95_ms:
+        for r in report["levels"]:
+            p95 = r["response_ms"]["p95"]
+            if p95 is None or p95 > a.max_p95_ms:
+                errors.append(f"p95 {p95}ms > {a.max_p95_ms}ms at {r['calls']} calls")
+    for e in errors:
+        print("[BENCH] GATE FAILED:", e)
+    return 1 if errors else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
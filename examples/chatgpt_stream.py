@@ -0,0 +1,36 @@
+import json
+
+from flask import Flask, Response, request, stream_with_context
+from openai import OpenAI
+
+app = Flask(__name__)
+client = OpenAI()  # OPENAI_API_KEY from environment
+
+# Streaming variant of chatgpt.py: answers as Server-Sent Events, token by token.
+# In config/freya.yaml set n8n.stream: true – Freya speaks each sentence as soon as it is complete.
+
+@app.post("/webhook/on_message")
+def on_message():
+    data = request.get_json()
+    text = data.get("text")
+
+    def events():
+        stream = client.chat.completions.create(
+            model="gpt-4o-mini",
+            messages=[
+                {"role": "system", "content": "Antworte kurz und klar."},
+                {"role": "user", "content": text}
+            ],
+            stream=True,
+        )
+        for chunk in stream:
+            delta = chunk.choices[0].delta.content if chunk.choices else None
+            if delta:
+                yield f"data: {json.dumps({'delta': delta}, ensure_ascii=False)}\n\n"
+        yield "data: [DONE]\n\n"
+
+    return Response(stream_with_context(events()), mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache"})
+
+if __name__ == "__main__":
+    app.run(port=5678, threaded=True)